@@ -0,0 +1,11 @@
+"""
+Benchmarks for the SonarAPIHandler hot paths and the commands, run against
+the in-process fake SonarQube server (see sonarqube_api.fakeserver).
+
+Run them from the repository root with::
+
+    python -m benchmarks --rules 10000 --latency 0.005
+
+Results can be saved with --save and compared with a previous run with
+--baseline, which fails if any benchmark is slower than the tolerance.
+"""
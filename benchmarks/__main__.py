@@ -0,0 +1,57 @@
+"""
+Command line entry point of the benchmarks.
+"""
+import argparse
+import json
+import sys
+
+from .suite import BENCHMARKS, compare, run
+
+
+parser = argparse.ArgumentParser(description='Benchmark the SonarQube API handler '
+                                             'and commands against a fake server')
+parser.add_argument('names', nargs='*',
+                    help='Benchmarks to run: {}'.format(', '.join(f.__name__ for f in BENCHMARKS)))
+parser.add_argument('--rules', type=int, default=2000,
+                    help='Number of rules in the fake server')
+parser.add_argument('--latency', type=float, default=0.0,
+                    help='Simulated latency per request in seconds')
+parser.add_argument('--error-rate', type=float, default=0.0,
+                    help='Ratio of requests answered with a server error')
+parser.add_argument('--startup-runs', type=int, default=5,
+                    help='Times each console script is started for cli_startup')
+parser.add_argument('--save', type=str, default=None,
+                    help='Save results as JSON to this file')
+parser.add_argument('--baseline', type=str, default=None,
+                    help='Compare results with a previously saved JSON file')
+parser.add_argument('--tolerance', type=float, default=0.2,
+                    help='Allowed throughput regression against the baseline')
+
+
+def main():
+    options = parser.parse_args()
+    results = run(options.rules, options.latency, options.error_rate, options.names,
+                  options.startup_runs)
+
+    sys.stdout.write('{:<24} {:>8} {:>10} {:>12} {:>12}\n'.format(
+        'Benchmark', 'Items', 'Seconds', 'Items/s', 'Peak (KB)'))
+    for name, result in sorted(results.items()):
+        sys.stdout.write('{:<24} {items:>8} {seconds:>10.3f} {items_per_sec:>12.1f} '
+                         '{peak:>12}\n'.format(name, peak=result['peak_kb'] or '-', **result))
+
+    if options.save:
+        with open(options.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            regressions = compare(results, json.load(f), options.tolerance)
+        for name, current, previous in regressions:
+            sys.stderr.write('Regression in {}: {:.1f} items/s (was {:.1f})\n'.format(
+                name, current, previous))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Benchmark definitions and runner.
+"""
+import contextlib
+import csv
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2, no memory measure
+    tracemalloc = None
+
+from sonarqube_api.cmd import activate_rules, export_rules, migrate_rules
+from sonarqube_api.fakeserver import FakeSonarQube
+
+
+# Registered benchmarks, in order of execution
+BENCHMARKS = []
+
+
+def benchmark(func):
+    """
+    Register a benchmark: a callable that takes the benchmark context
+    (see run) and returns the number of processed items.
+    """
+    BENCHMARKS.append(func)
+    return func
+
+
+@contextlib.contextmanager
+def command_args(*args):
+    """
+    Run a command main with the given arguments and quiet output.
+    """
+    argv, stdout, stderr = sys.argv, sys.stdout, sys.stderr
+    sys.argv = ['benchmark'] + [str(a) for a in args]
+    sys.stdout = sys.stderr = io.StringIO() if sys.version_info.major == 3 else io.BytesIO()
+    try:
+        yield
+    finally:
+        sys.argv, sys.stdout, sys.stderr = argv, stdout, stderr
+
+
+@benchmark
+def get_rules_scan(ctx):
+    """Full scan of rules with get_rules."""
+    h = ctx['source'].handler()
+    return sum(1 for _ in h.get_rules())
+
+
+@benchmark
+def export_rules_main(ctx):
+    """Export of all rules to CSV and HTML with export_rules.main."""
+    server = ctx['source']
+    with command_args('--host', 'http://127.0.0.1', '--port', server.port,
+                      '--output-dir', ctx['tmp']):
+        export_rules.main()
+    return len(server.rules)
+
+
+@benchmark
+def migrate_rules_main(ctx):
+    """Migration of custom rules to an empty server with migrate_rules.main."""
+    source = ctx['source']
+    source.activations['bench-migrate'] = {
+        r['key']: {'severity': r['severity'], 'params': []}
+        for r in source.rules if 'templateKey' in r
+    }
+    with FakeSonarQube(rules=0, users=0, groups=0) as target:
+        with command_args('--source-host', 'http://127.0.0.1', '--source-port', source.port,
+                          '--target-host', 'http://127.0.0.1', '--target-port', target.port):
+            migrate_rules.main()
+        return len(target.rules)
+
+
+@benchmark
+def activate_rules_main(ctx):
+    """Activation of all rules from a CSV file with activate_rules.main."""
+    server = ctx['source']
+    filename = os.path.join(ctx['tmp'], 'activate.csv')
+    with open(filename, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(['key', 'reset', 'severity', 'format'])
+        for i, rule in enumerate(server.rules):
+            writer.writerow([rule['key'], '', ('MAJOR', 'MINOR')[i % 2], '^[a-z]+$'])
+
+    with command_args('bench-profile', filename, '--host', 'http://127.0.0.1',
+                      '--port', server.port):
+        activate_rules.main()
+    return len(server.rules)
+
+
+@benchmark
+def cli_startup(ctx):
+    """Startup of every console script, in a new interpreter showing help."""
+    runs = 0
+    for module in ('activate_rules', 'export_rules', 'migrate_rules', 'users', 'groups'):
+        for _ in range(ctx['startup_runs']):
+            subprocess.check_output([
+                sys.executable, '-c',
+                'from sonarqube_api.cmd.{} import main; main()'.format(module), '--help'
+            ])
+            runs += 1
+    return runs
+
+
+def measure(func, ctx):
+    """
+    Run a benchmark twice: first measuring its wall time, then its peak
+    memory (tracing allocations slows down execution noticeably).
+
+    :return: dict with items, seconds, items_per_sec and peak_kb
+    """
+    start = time.time()
+    items = func(ctx)
+    elapsed = time.time() - start
+
+    peak = None
+    if tracemalloc:
+        tracemalloc.start()
+        try:
+            func(ctx)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {
+        'items': items,
+        'seconds': elapsed,
+        'items_per_sec': items / elapsed if elapsed else 0.0,
+        'peak_kb': peak // 1024 if peak is not None else None,
+    }
+
+
+def run(rules=1000, latency=0.0, error_rate=0.0, names=None, startup_runs=5):
+    """
+    Run the benchmarks against a fresh fake server.
+
+    :param rules: number of rules in the source server
+    :param latency: simulated server latency per request (seconds)
+    :param error_rate: ratio of requests answered with errors
+    :param names: names of the benchmarks to run (all by default)
+    :param startup_runs: times each console script is started
+    :return: dict of results by benchmark name
+    """
+    results = {}
+    tmp = tempfile.mkdtemp()
+    try:
+        with FakeSonarQube(rules=rules, latency=latency, error_rate=error_rate) as source:
+            ctx = {'source': source, 'tmp': tmp, 'startup_runs': startup_runs}
+            for func in BENCHMARKS:
+                if not names or func.__name__ in names:
+                    results[func.__name__] = measure(func, ctx)
+    finally:
+        shutil.rmtree(tmp)
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return the benchmarks whose throughput regressed more than the tolerance.
+
+    :param results: dict of results by benchmark name
+    :param baseline: dict of previous results by benchmark name
+    :param tolerance: allowed slowdown ratio (ie: 0.2 for 20%)
+    :return: list of (name, current, baseline) throughput tuples
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        previous = baseline.get(name)
+        if previous and result['items_per_sec'] < previous['items_per_sec'] * (1 - tolerance):
+            regressions.append((name, result['items_per_sec'], previous['items_per_sec']))
+    return regressions
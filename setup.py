@@ -44,14 +44,18 @@ setup(
     ],
 
     keywords='api sonar sonarqube',
-    packages=find_packages(exclude=['contrib', 'docs', 'test*']),
+    packages=find_packages(exclude=['benchmarks', 'contrib', 'docs', 'test*']),
 
     # https://packaging.python.org/en/latest/requirements.html
     install_requires=[
         'requests>=2.9,<2.99',
-        'prettytable>=0.7.2'
+        'prettytable>=0.7.2',
+        'futures>=3.0; python_version < "3"'
     ],
-    extras_require={},
+    extras_require={
+        'http2': ['httpx[http2]>=0.18'],
+        'orjson': ['orjson'],
+    },
     package_data={},
 
     # http://docs.python.org/3.4/distutils/setupscript.html#installing-additional-files # noqa
@@ -64,9 +68,12 @@ setup(
         'console_scripts': [
             'activate-sonarqube-rules=sonarqube_api.cmd.activate_rules:main',
             'export-sonarqube-rules=sonarqube_api.cmd.export_rules:main',
+            'export-sonarqube-issues=sonarqube_api.cmd.export_issues:main',
             'migrate-sonarqube-rules=sonarqube_api.cmd.migrate_rules:main',
+            'search-sonarqube-rules=sonarqube_api.cmd.search_rules:main',
             'sonarqube-users=sonarqube_api.cmd.users:main',
-            'sonarqube-groups=sonarqube_api.cmd.groups:main'
+            'sonarqube-groups=sonarqube_api.cmd.groups:main',
+            'sonarqube=sonarqube_api.cmd.sonarqube:main'
         ],
     },
 
@@ -2,16 +2,85 @@
 This module contains the SonarAPIHandler, used for communicating with the
 SonarQube server web service API.
 """
+import json
 import operator
+import threading
+import time
+
+try:
+    from urllib.parse import urlencode
+except ImportError:
+    from urllib import urlencode
+
+from .batch import Batch
+from .capabilities import ServerCapabilities
+from .circuit import CircuitBreaker
+from .deadline import bound_timeout, check as check_deadline, remaining
+from .exceptions import ClientError, AuthError, DeadlineExceeded, NotFoundError, \
+    ValidationError, ServerError
+from .instrumentation import DecodeEvent, RequestEvent
+from .issues import IssuesScan, parse_date
+from .transports import RequestsTransport
+from .utils import prefetch as prefetch_pages
+
+
+def _loads_json(content):
+    """
+    Decode a JSON body with the standard library, from bytes if possible.
+
+    :param content: response body as bytes
+    :return: decoded data
+    """
+    try:
+        return json.loads(content)
+    except TypeError:
+        # Python < 3.6 only decodes text
+        return json.loads(content.decode('utf-8'))
+
+
+def get_decoder(decoder):
+    """
+    Return the function decoding response bodies (as bytes) for the given
+    decoder backend: "json" (standard library), "orjson", "ujson" or any
+    callable. None means using the decoding of the response itself.
 
-import requests
+    :param decoder: name of the backend, callable or None
+    :return: callable taking bytes, or None
+    """
+    if decoder is None or callable(decoder):
+        return decoder
+    elif decoder == 'json':
+        return _loads_json
+    elif decoder in ('orjson', 'ujson'):
+        # Note: optional modules, fail early if not installed
+        module = __import__(decoder)
+        return module.loads
+    else:
+        raise ValueError('Unknown decoder: {}'.format(decoder))
+
+
+def _to_number(value):
+    """
+    Convert a measure value to float, if numeric (ie: not a rating or a
+    distribution).
 
-from .exceptions import ClientError, AuthError, ValidationError, ServerError
+    :param value: str
+    :return: float or str
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
 
 
 class SonarAPIHandler(object):
     """
     Adapter for SonarQube's web service API.
+
+    A handler can be shared by many threads: each thread gets its own
+    requests session, all of them using the same pool of connections, and
+    hooks can be added or removed while calls are being made. Generators
+    (ie: get_rules) must be consumed by a single thread.
     """
     # Default host is local
     DEFAULT_HOST = 'http://localhost'
@@ -20,9 +89,15 @@ class SonarAPIHandler(object):
 
     # Endpoint for resources and rules
     AUTH_VALIDATION_ENDPOINT = '/api/authentication/validate'
+    SERVER_VERSION_ENDPOINT = '/api/server/version'
+    WEBSERVICES_LIST_ENDPOINT = '/api/webservices/list'
     METRICS_LIST_ENDPOINT = '/api/metrics/search'
     RESOURCES_ENDPOINT = '/api/resources'
+    COMPONENTS_SEARCH_ENDPOINT = '/api/components/search'
+    ISSUES_SEARCH_ENDPOINT = '/api/issues/search'
+    MEASURES_TREE_ENDPOINT = '/api/measures/component_tree'
     RULES_ACTIVATION_ENDPOINT = '/api/qualityprofiles/activate_rule'
+    RULES_BULK_ACTIVATION_ENDPOINT = '/api/qualityprofiles/activate_rules'
     RULES_LIST_ENDPOINT = '/api/rules/search'
     RULES_CREATE_ENDPOINT = '/api/rules/create'
     USERS_LIST_ENDPOINT = '/api/users/search'
@@ -60,23 +135,151 @@ class SonarAPIHandler(object):
         'uncovered_conditions', 'coverage'
     )
 
+    # Fields of rules/search, to add actives (not returned by default)
+    RULES_FIELDS = (
+        'repo', 'name', 'createdAt', 'severity', 'status', 'internalKey',
+        'isTemplate', 'templateKey', 'tags', 'sysTags', 'lang', 'langName',
+        'htmlDesc', 'mdDesc', 'noteLogin', 'mdNote', 'htmlNote',
+        'defaultDebtRemFn', 'debtRemFn', 'effortToFixDescription',
+        'debtOverloaded', 'params'
+    )
+
+    # Metric definitions are cached by server for all handlers (seconds)
+    METRICS_CACHE_TTL = 3600
+    _metrics_catalogs = {}
+
+    # Capabilities (version and web services) too (seconds)
+    CAPABILITIES_CACHE_TTL = 3600
+    _server_capabilities = {}
+
+    # Largest page size of the paginated web services
+    MAX_PAGE_SIZE = 500
+
+    # Results that can be paged through in the issues search
+    ISSUES_LIMIT = 10000
+
+    # Default circuit breakers by server, shared by all handlers
+    _circuit_breakers = {}
+
+    # Connections kept open to the server, shared by the sessions of all
+    # threads (more can be opened at once, but are not kept)
+    POOL_SIZE = 10
+
+    # Lock for the state shared by all handlers
+    _class_lock = threading.Lock()
+
     def __init__(self, host=None, port=None, user=None, password=None,
-                 base_path=None, token=None):
+                 base_path=None, token=None, transport=None, decoder=None,
+                 circuit_breaker=None, timeout=None, detect=True):
         """
         Set connection info and session, including auth (if user+password
-        and/or auth token were provided).
+        and/or auth token were provided), the transport used to make the
+        calls (requests by default, see transports module), the decoder
+        of the response bodies (see get_decoder), the circuit breaker
+        (True for the default one of the server, or a CircuitBreaker), the
+        timeout of each call (seconds, or (connect, read) tuple) and
+        whether to detect the server capabilities to choose the endpoints
+        (see get_capabilities).
         """
         self._host = host or self.DEFAULT_HOST
         self._port = port or self.DEFAULT_PORT
         self._base_path = base_path or self.DEFAULT_BASE_PATH
-        self._session = requests.Session()
+        self._timeout = timeout
+        self._detect = detect
+        self._transport = transport or RequestsTransport()
+        self._decoder = get_decoder(decoder)
+        self._hooks = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._adapter = None
 
         # Prefer revocable authentication token over username/password if
         # both are provided
+        self._auth = None
         if token:
-            self._session.auth = token, ''
+            self._auth = token, ''
         elif user and password:
-            self._session.auth = user, password
+            self._auth = user, password
+
+        # Optional circuit breaker, failing fast while the server is down
+        if circuit_breaker is True:
+            circuit_breaker = self._default_circuit_breaker()
+        self._circuit_breaker = circuit_breaker or None
+
+    def _default_circuit_breaker(self):
+        """
+        Return the default circuit breaker of the server, shared by all
+        handlers in the process.
+
+        :return: CircuitBreaker instance
+        """
+        with self._class_lock:
+            return self._circuit_breakers.setdefault(self._get_url(''), CircuitBreaker())
+
+    def __getstate__(self):
+        """
+        Return the state to pickle (ie: to pass the handler to another
+        process): connection settings, credentials, timeout, transport and
+        decoder. Sessions, hooks and locks belong to the process and are
+        not kept, the default circuit breaker is replaced by the one of the
+        server in the new process.
+        """
+        state = self.__dict__.copy()
+        for name in ('_lock', '_local', '_adapter'):
+            del state[name]
+        state['_hooks'] = []
+        if self._circuit_breaker is not None and \
+                self._circuit_breaker is self._circuit_breakers.get(self._get_url('')):
+            state['_circuit_breaker'] = True
+        return state
+
+    def __setstate__(self, state):
+        """
+        Restore a pickled handler, its session is created on first use.
+        """
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._adapter = None
+        if self._circuit_breaker is True:
+            self._circuit_breaker = self._default_circuit_breaker()
+
+    @property
+    def circuit_breaker(self):
+        """
+        Circuit breaker of the handler (None if disabled).
+        """
+        return self._circuit_breaker
+
+    @property
+    def circuit_state(self):
+        """
+        State of the circuit breaker: closed, open or half-open (None if
+        disabled).
+        """
+        return self._circuit_breaker.state if self._circuit_breaker else None
+
+    @property
+    def _session(self):
+        """
+        Requests session with auth of the current thread, created on first
+        use (requests is by far the slowest module to import, and commands
+        may never need it). Sessions share the connection pool adapter.
+        """
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+            with self._lock:
+                if self._adapter is None:
+                    self._adapter = requests.adapters.HTTPAdapter(
+                        pool_connections=1, pool_maxsize=self.POOL_SIZE
+                    )
+            session = self._local.session = requests.Session()
+            session.auth = self._auth
+            session.mount('http://', self._adapter)
+            session.mount('https://', self._adapter)
+
+        return session
 
     def _get_url(self, endpoint):
         """
@@ -90,7 +293,7 @@ class SonarAPIHandler(object):
     def _make_call(self, method, endpoint, **data):
         """
         Make the call to the service with the given method, queryset and data,
-        using the initial session.
+        using the initial session and the transport.
 
         Note: data is not passed as a single dictionary for better testability
         (see https://github.com/kako-nawao/python-sonarqube-api/issues/15).
@@ -100,12 +303,45 @@ class SonarAPIHandler(object):
         :param data: queryset or body
         :return: response
         """
-        # Get method and make the call
+        # Timeout limited by the deadline (raises DeadlineExceeded if expired)
+        # Note: only passed to the transport if set
+        options = {}
+        timeout = bound_timeout(self._timeout, check_deadline())
+        if timeout is not None:
+            options['timeout'] = timeout
+
+        # Fail fast if the circuit is open (raises CircuitOpenError)
+        breaker = self._circuit_breaker
+        if breaker:
+            breaker.before_call()
+
+        # Make the call with the transport
         url = self._get_url(endpoint)
-        if method.lower() == 'get':
-            res = self._session.get(url, params=data or {})
-        else:
-            res = self._session.post(url, data=data or {})
+        start = time.time()
+        try:
+            res = self._transport.request(self._session, method, url, data, **options)
+
+        except Exception as exc:
+            # Connection or transport error, notify and propagate (as
+            # DeadlineExceeded if it timed out because of the deadline)
+            # Note: the deadline of the caller is not a server failure
+            if breaker:
+                left = remaining()
+                if left is not None and left <= 0:
+                    breaker.release()
+                else:
+                    breaker.record_failure()
+            self._fire_request_event(method, endpoint, data, None, start, exc)
+            check_deadline()
+            raise
+
+        if breaker:
+            # Only server errors count as failures
+            if res.status_code < 500:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+        self._fire_request_event(method, endpoint, data, res, start)
 
         # Analyse response status and return or raise exception
         # Note: redirects are followed automatically by requests
@@ -115,13 +351,17 @@ class SonarAPIHandler(object):
 
         elif res.status_code == 400:
             # Validation error
-            msg = ', '.join(e['msg'] for e in res.json()['errors'])
+            msg = ', '.join(e['msg'] for e in self.decode(res)['errors'])
             raise ValidationError(msg)
 
         elif res.status_code in (401, 403):
             # Auth error
             raise AuthError(res.reason)
 
+        elif res.status_code == 404:
+            # Missing resource or web service
+            raise NotFoundError(res.reason)
+
         elif res.status_code < 500:
             # Other 4xx, generic client error
             raise ClientError(res.reason)
@@ -130,6 +370,86 @@ class SonarAPIHandler(object):
             # 5xx is server error
             raise ServerError(res.reason)
 
+    def _fire_request_event(self, method, endpoint, data, res, start,
+                            error=None):
+        """
+        Pass the data of a call to every registered hook (if any).
+
+        :param method: http method of the call
+        :param endpoint: relative url of the call
+        :param data: queryset or body of the call
+        :param res: response (None if the call failed)
+        :param start: time at which the call started
+        :param error: exception raised during the call, if any
+        """
+        if not self._hooks:
+            return
+
+        event = RequestEvent(
+            endpoint=endpoint, method=method.upper(),
+            status=res.status_code if res is not None else None,
+            request_bytes=len(urlencode(sorted(data.items()))) if data else 0,
+            response_bytes=len(res.content) if res is not None else 0,
+            elapsed=time.time() - start, error=error
+        )
+        for hook in self._hooks:
+            hook(event)
+
+    def decode(self, res):
+        """
+        Return the decoded JSON body of a response, notifying the hooks of the
+        time spent decoding it. With a decoder backend, the raw body bytes are
+        decoded directly (without building the text first).
+
+        :param res: response of a call to the server
+        :return: decoded data
+        """
+        start = time.time()
+        if self._decoder is None:
+            data = res.json()
+        else:
+            data = self._decoder(res.content)
+        if self._hooks:
+            event = DecodeEvent(elapsed=time.time() - start)
+            for hook in self._hooks:
+                hook(event)
+
+        return data
+
+    def batch(self, max_workers=4):
+        """
+        Return a batch to make write calls concurrently (ie: create_user or
+        activate_rule), each returning a future. Used as a context manager,
+        it waits for all of them at exit.
+
+        :param max_workers: calls made at once
+        :return: Batch instance
+        """
+        return Batch(self, max_workers)
+
+    def add_hook(self, hook):
+        """
+        Register a callable that receives a RequestEvent after every call
+        made to the server and a DecodeEvent after decoding each response
+        (see instrumentation module).
+
+        :param hook: callable taking an event
+        """
+        # Note: replace the list, calls being made keep iterating the old one
+        with self._lock:
+            self._hooks = self._hooks + [hook]
+
+    def remove_hook(self, hook):
+        """
+        Unregister a previously added hook.
+
+        :param hook: callable taking an event
+        """
+        with self._lock:
+            hooks = list(self._hooks)
+            hooks.remove(hook)
+            self._hooks = hooks
+
     def activate_rule(self, key, profile_key, reset=False, severity=None,
                       **params):
         """
@@ -194,11 +514,55 @@ class SonarAPIHandler(object):
         res = self._make_call('post', self.RULES_CREATE_ENDPOINT, **data)
         return res
 
-    def get_metrics(self, fields=None):
+    def activate_rules(self, profile_key, languages=None, custom_only=False,
+                       severity=None):
+        """
+        Activate all the rules (in status ready, that are not template
+        rules) matching the filters for a given quality profile, in a single
+        call if the server allows bulk activation, or one by one.
+
+        :param profile_key: key of the profile
+        :param languages: key of languages to filter rules
+        :param custom_only: filter only custom rules
+        :param severity: severity of the rules for given profile (their
+            default if None)
+        :return: tuple of succeeded and failed activations count
+        """
+        if self.get_capabilities().supports(self.RULES_BULK_ACTIVATION_ENDPOINT):
+            # Build the rules search queryset, as get_rules
+            data = {'is_template': 'no', 'statuses': 'READY',
+                    'profile_key': profile_key}
+            if languages:
+                if not isinstance(languages, str):
+                    languages = ','.join(languages)
+                data['languages'] = languages.lower()
+            if custom_only:
+                data['has_debt_characteristic'] = 'false'
+            if severity:
+                data['activation_severity'] = severity.upper()
+
+            res = self.decode(self._make_call('post', self.RULES_BULK_ACTIVATION_ENDPOINT, **data))
+            return res.get('succeeded', 0), res.get('failed', 0)
+
+        # One by one (failures don't stop the others)
+        succeeded, failed = 0, 0
+        for rule in self.get_rules(languages=languages, custom_only=custom_only,
+                                   page_size=self.MAX_PAGE_SIZE):
+            try:
+                self.activate_rule(rule['key'], profile_key, severity=severity)
+                succeeded += 1
+            except ClientError:
+                failed += 1
+
+        return succeeded, failed
+
+    def get_metrics(self, fields=None, prefetch=0):
         """
         Yield defined metrics.
 
         :param fields: iterable or comma-separated string of field names
+        :param prefetch: pages fetched in the background while the current
+            one is consumed, at most (0 to fetch them on demand)
         :return: generator that yields metric data dicts
         """
         # Build queryset including fields if required
@@ -208,6 +572,25 @@ class SonarAPIHandler(object):
                 fields = ','.join(fields)
             qs['f'] = fields.lower()
 
+        # Fetch pages (in the background if prefetching) and yield metrics
+        # Note: closing the generator stops the background thread
+        pages = self._get_metrics_pages(qs)
+        if prefetch:
+            pages = prefetch_pages(pages, size=prefetch)
+        try:
+            for page in pages:
+                for metric in page:
+                    yield metric
+        finally:
+            pages.close()
+
+    def _get_metrics_pages(self, qs):
+        """
+        Yield the pages of metrics.
+
+        :param qs: queryset of the metrics search
+        :return: generator that yields lists of metric data dicts
+        """
         # Page counters
         page_num = 1
         page_size = 1
@@ -216,8 +599,7 @@ class SonarAPIHandler(object):
         # Cycle through rules
         while page_num * page_size < n_metrics:
             # Update paging information for calculation
-            res = self._make_call('get', self.METRICS_LIST_ENDPOINT,
-                                  **qs).json()
+            res = self.decode(self._make_call('get', self.METRICS_LIST_ENDPOINT, **qs))
             page_num = res['p']
             page_size = res['ps']
             n_metrics = res['total']
@@ -225,12 +607,128 @@ class SonarAPIHandler(object):
             # Update page number (next) in queryset
             qs['p'] = page_num + 1
 
-            # Yield rules
-            for metric in res['metrics']:
-                yield metric
+            # Yield the page of metrics
+            yield res['metrics']
+
+    def get_metrics_catalog(self, refresh=False):
+        """
+        Return the metric definitions of the server by key. The catalog is
+        loaded once with get_metrics and shared by all handlers of the same
+        server until it expires (see METRICS_CACHE_TTL) or is refreshed.
+
+        :param refresh: reload the catalog even if cached
+        :return: dict of metric data dicts by key
+        """
+        server = self._get_url('')
+        cached = self._metrics_catalogs.get(server)
+        if refresh or not cached or \
+                time.time() - cached[0] > self.METRICS_CACHE_TTL:
+            # Missing or expired, load all metrics
+            catalog = {metric['key']: metric for metric in self.get_metrics()}
+            cached = self._metrics_catalogs[server] = (time.time(), catalog)
+
+        return cached[1]
+
+    def get_capabilities(self, refresh=False):
+        """
+        Return the capabilities of the server: its version and web services.
+        They are detected once and shared by all handlers of the same server
+        until they expire (see CAPABILITIES_CACHE_TTL) or are refreshed.
+
+        Methods with several implementations use them to choose the best
+        one, and the oldest one when unknown (ie: detection is disabled, or
+        not allowed for the user).
+
+        :param refresh: detect them again even if cached
+        :return: ServerCapabilities instance
+        """
+        if not self._detect:
+            return ServerCapabilities()
+
+        cached = None if refresh else self._cached_capabilities()
+        if cached is None:
+            # Missing or expired, detect them
+            # Note: unknown if the server (or user) doesn't allow it, only
+            # cached if it wasn't a server or connection error
+            failures = []
+            version = self._detect_capability(
+                failures, lambda: ServerCapabilities.parse_version(
+                    self._make_call('get', self.SERVER_VERSION_ENDPOINT).text))
+            webservices = self._detect_capability(
+                failures, lambda: ServerCapabilities.parse_webservices(
+                    self.decode(self._make_call('get', self.WEBSERVICES_LIST_ENDPOINT))))
+            cached = ServerCapabilities(version, webservices)
+            if not failures:
+                self._server_capabilities[self._get_url('')] = (time.time(), cached)
+
+        return cached
+
+    def _cached_capabilities(self):
+        """
+        Return the capabilities of the server if they were detected and
+        haven't expired, without calling it.
+
+        :return: ServerCapabilities instance, or None
+        """
+        cached = self._server_capabilities.get(self._get_url('')) if self._detect else None
+        if not cached or time.time() - cached[0] > self.CAPABILITIES_CACHE_TTL:
+            return None
+        return cached[1]
+
+    @staticmethod
+    def _detect_capability(failures, detect):
+        """
+        Run a detection call, returning None if it fails (other than by the
+        deadline), as unknown.
+
+        :param failures: list where server and connection errors are added
+        :param detect: function making the call and parsing its response
+        :return: detected value, or None
+        """
+        try:
+            return detect()
+        except DeadlineExceeded:
+            raise
+        except ClientError:
+            return None
+        except Exception as exc:
+            # Note: server errors, timeouts, and errors of any transport
+            failures.append(exc)
+            return None
+
+    def expand_metrics(self, metrics=None, include_trends=False,
+                       validate=True):
+        """
+        Return the list of metric keys to request, including the differential
+        (new_) variants if trends are included. If validating, the keys are
+        checked against the metrics catalog and only existing variants are
+        added.
+
+        :param metrics: iterable of metrics by name (general by default)
+        :param include_trends: add differential metrics for leak periods
+        :param validate: check metrics against the server catalog
+        :return: list of metric keys
+        """
+        metrics = list(metrics or self.GENERAL_METRICS)
+        catalog = self.get_metrics_catalog() if validate else None
+
+        # Fail early on unknown metrics
+        if catalog is not None:
+            unknown = [m for m in metrics if m not in catalog]
+            if unknown:
+                raise ValidationError('Unknown metrics: {}'.format(', '.join(unknown)))
+
+        # Add differential metrics (only existing ones, if we can tell)
+        if include_trends:
+            for metric in ['new_{}'.format(m) for m in metrics]:
+                if metric not in metrics and (catalog is None or metric in catalog):
+                    metrics.append(metric)
+
+        return metrics
 
     def get_rules(self, active_only=False, profile=None, languages=None,
-                  custom_only=False):
+                  custom_only=False, page_size=None, start_page=1,
+                  include_actives=False, prefetch=0):
         """
         Yield rules in status ready, that are not template rules.
 
@@ -238,6 +736,12 @@ class SonarAPIHandler(object):
         :param profile: key of profile to filter rules
         :param languages: key of languages to filter rules
         :param custom_only: filter only custom rules
+        :param page_size: number of rules per page (server default if None)
+        :param start_page: first page to fetch (ie: to resume a scan)
+        :param include_actives: add the activations of each rule (in the
+            profile, if given) as a list under "actives"
+        :param prefetch: pages fetched in the background while the current
+            one is consumed, at most (0 to fetch them on demand)
         :return: generator that yields rule data dicts
         """
         # Build the queryset
@@ -260,15 +764,46 @@ class SonarAPIHandler(object):
         if custom_only:
             qs['has_debt_characteristic'] = 'false'
 
+        # Actives are returned by page, only if requested with all fields
+        if include_actives:
+            qs['f'] = ','.join(self.RULES_FIELDS + ('actives',))
+
+        # Paging params, only if not defaults
+        if page_size:
+            qs['ps'] = page_size
+        if start_page > 1:
+            qs['p'] = start_page
+
+        # Fetch pages (in the background if prefetching) and yield rules
+        # Note: closing the generator stops the background thread
+        pages = self._get_rules_pages(qs, start_page, include_actives)
+        if prefetch:
+            pages = prefetch_pages(pages, size=prefetch)
+        try:
+            for page in pages:
+                for rule in page:
+                    yield rule
+        finally:
+            pages.close()
+
+    def _get_rules_pages(self, qs, start_page=1, include_actives=False):
+        """
+        Yield the pages of rules.
+
+        :param qs: queryset of the rules search
+        :param start_page: first page to fetch
+        :param include_actives: add the activations of each rule
+        :return: generator that yields lists of rule data dicts
+        """
         # Page counters
-        page_num = 1
+        page_num = start_page
         page_size = 1
-        n_rules = 2
+        n_rules = page_num + 1
 
         # Cycle through rules
         while page_num * page_size < n_rules:
             # Update paging information for calculation
-            res = self._make_call('get', self.RULES_LIST_ENDPOINT, **qs).json()
+            res = self.decode(self._make_call('get', self.RULES_LIST_ENDPOINT, **qs))
             page_num = res['p']
             page_size = res['ps']
             n_rules = res['total']
@@ -276,9 +811,60 @@ class SonarAPIHandler(object):
             # Update page number (next) in queryset
             qs['p'] = page_num + 1
 
-            # Yield rules
-            for rule in res['rules']:
-                yield rule
+            # Yield rules (with their actives if requested)
+            if include_actives:
+                actives = res.get('actives', {})
+                for rule in res['rules']:
+                    rule['actives'] = actives.get(rule['key'], [])
+            yield res['rules']
+
+    def get_issues(self, projects=None, severities=None, types=None,
+                   statuses=None, rules=None, resolved=None,
+                   created_after=None, created_before=None, page_size=None,
+                   max_workers=1):
+        """
+        Yield issues, of any number: the search is split in slices by
+        creation date (and severity, if needed) under the limit of results
+        of the server (see ISSUES_LIMIT and the issues module).
+
+        :param projects: keys of projects to filter issues
+        :param severities: severities to filter issues
+        :param types: types to filter issues (ie: BUG)
+        :param statuses: statuses to filter issues (ie: OPEN)
+        :param rules: keys of rules to filter issues
+        :param resolved: filter only resolved (True) or unresolved (False)
+        :param created_after: filter issues created from this date or
+            datetime (inclusive), as str or datetime
+        :param created_before: filter issues created until this date or
+            datetime (exclusive), as str or datetime
+        :param page_size: number of issues per page (the largest if None)
+        :param max_workers: slices scanned at once (with more than 1, issues
+            are yielded as they arrive, not by creation date)
+        :return: generator that yields issue data dicts
+        """
+        # Build the queryset
+        # Note: we handle comma-separated string or list-like iterable
+        qs = {}
+        for name, values in (('projectKeys', projects), ('severities', severities),
+                             ('types', types), ('statuses', statuses), ('rules', rules)):
+            if values:
+                if not isinstance(values, str):
+                    values = ','.join(values)
+                qs[name] = values if name in ('projectKeys', 'rules') else values.upper()
+        if resolved is not None:
+            qs['resolved'] = 'true' if resolved else 'false'
+
+        scan = IssuesScan(self, qs,
+                          after=parse_date(created_after) if created_after else None,
+                          before=parse_date(created_before) if created_before else None,
+                          page_size=page_size, max_workers=max_workers)
+        # Note: closing the generator stops the scan
+        issues = iter(scan)
+        try:
+            for issue in issues:
+                yield issue
+        finally:
+            issues.close()
 
     def get_resources_debt(self, resource=None, categories=None,
                            include_trends=False, include_modules=False):
@@ -304,14 +890,15 @@ class SonarAPIHandler(object):
             params['qualifiers'] = 'TRK,BRC'
 
         # Get the results
-        res = self._make_call('get', self.RESOURCES_ENDPOINT, **params).json()
+        res = self.decode(self._make_call('get', self.RESOURCES_ENDPOINT, **params))
 
         # Yield results
         for prj in res:
             yield prj
 
     def get_resources_metrics(self, resource=None, metrics=None,
-                              include_trends=False, include_modules=False):
+                              include_trends=False, include_modules=False,
+                              validate_metrics=True):
         """
         Yield first-level resources with generic metrics.
 
@@ -319,31 +906,147 @@ class SonarAPIHandler(object):
         :param metrics: iterable of metrics to return by name
         :param include_trends: include differential values for leak periods
         :param include_modules: include modules data
+        :param validate_metrics: check metrics against the server catalog,
+            failing with ValidationError before the call if unknown
         :return: generator that yields resource metrics data dicts
         """
-        # Build parameters
+        metrics = self.expand_metrics(metrics, include_trends,
+                                      validate=validate_metrics)
+
+        # Use the measures of components if resources are gone (6.3+)
+        # Note: only detected when they are not found, to save the calls
+        capabilities = self._cached_capabilities()
+        if capabilities is None or capabilities.supports(self.RESOURCES_ENDPOINT) is not False:
+            try:
+                res = self._get_resources_metrics(resource, metrics, include_trends,
+                                                  include_modules)
+            except NotFoundError:
+                capabilities = self.get_capabilities()
+                if capabilities.supports(self.RESOURCES_ENDPOINT) is not False or \
+                        not capabilities.supports(self.MEASURES_TREE_ENDPOINT):
+                    raise
+            else:
+                for prj in res:
+                    yield prj
+                return
+
+        for prj in self._get_components_metrics(resource, metrics, include_trends,
+                                                include_modules, capabilities):
+            yield prj
+
+    def _get_resources_metrics(self, resource, metrics, include_trends,
+                               include_modules):
+        """
+        Return first-level resources with generic metrics, from the
+        resources web service (removed in 6.3).
+
+        :param resource: key of the resource to select
+        :param metrics: list of metric keys
+        :param include_trends: include differential values for leak periods
+        :param include_modules: include modules data
+        :return: list of resource metrics data dicts
+        """
         params = {}
-        if not metrics:
-            metrics = self.GENERAL_METRICS
         if resource:
             params['resource'] = resource
         if include_trends:
             params['includetrends'] = 'true'
-            metrics.extend(['new_{}'.format(m) for m in metrics])
         if include_modules:
             params['qualifiers'] = 'TRK,BRC'
         params['metrics'] = ','.join(metrics)
 
         # Make the call
-        res = self._make_call('get', self.RESOURCES_ENDPOINT, **params).json()
+        return self.decode(self._make_call('get', self.RESOURCES_ENDPOINT, **params))
 
-        # Iterate and yield results
-        for prj in res:
-            yield prj
+    def _get_components_metrics(self, resource, metrics, include_trends,
+                                include_modules, capabilities):
+        """
+        Yield first-level resources with generic metrics, from the measures
+        of the components tree of each project, in the same format as the
+        resources web service.
+
+        :param resource: key of the resource to select
+        :param metrics: list of metric keys
+        :param include_trends: include differential values for leak periods
+        :param include_modules: include modules data
+        :param capabilities: ServerCapabilities of the server
+        :return: generator that yields resource metrics data dicts
+        """
+        if resource:
+            projects = [resource]
+        else:
+            projects = (component['key'] for page in self._get_pages(
+                self.COMPONENTS_SEARCH_ENDPOINT, qualifiers='TRK'
+            ) for component in page['components'])
+
+        # Build parameters
+        # Note: the parameter of the base component was renamed in 6.6
+        params = {
+            'metricKeys': ','.join(metrics),
+            'qualifiers': 'BRC' if include_modules else 'TRK',
+        }
+        if include_trends:
+            params['additionalFields'] = 'periods'
+        base = 'component' if capabilities.at_least(6, 6) else 'baseComponentKey'
+
+        # Yield each project, then its modules
+        for project in projects:
+            params[base] = project
+            for page in self._get_pages(self.MEASURES_TREE_ENDPOINT, **params):
+                if page['paging']['pageIndex'] == 1:
+                    yield self._component_resource(page['baseComponent'])
+                for component in page['components']:
+                    yield self._component_resource(component)
+
+    @staticmethod
+    def _component_resource(component):
+        """
+        Convert a component with measures to the format of the resources
+        web service.
+
+        :param component: component data dict
+        :return: resource data dict
+        """
+        msr = []
+        for measure in component.get('measures', []):
+            item = {'key': measure['metric']}
+            if 'value' in measure:
+                item['val'] = _to_number(measure['value'])
+                item['frmt_val'] = measure['value']
+            for period in measure.get('periods', []):
+                item['var{}'.format(period['index'])] = _to_number(period.get('value'))
+            msr.append(item)
+
+        return {'id': component.get('id'), 'key': component['key'],
+                'name': component.get('name'), 'scope': 'PRJ',
+                'qualifier': component.get('qualifier'), 'msr': msr}
+
+    def _get_pages(self, endpoint, method='get', **qs):
+        """
+        Yield the pages of a web service with paging information (newer
+        ones, ie: components search), of the largest size.
+
+        :param endpoint: relative url of the web service
+        :param method: http method
+        :param qs: queryset
+        :return: generator that yields decoded pages
+        """
+        qs['ps'] = self.MAX_PAGE_SIZE
+        page_num = 1
+        while True:
+            qs['p'] = page_num
+            res = self.decode(self._make_call(method, endpoint, **qs))
+            yield res
+
+            # Stop after the last page
+            paging = res['paging']
+            if paging['pageIndex'] * paging['pageSize'] >= paging['total']:
+                break
+            page_num = paging['pageIndex'] + 1
 
     def get_resources_full_data(self, resource=None, metrics=None,
                                 categories=None, include_trends=False,
-                                include_modules=False):
+                                include_modules=False, validate_metrics=True):
         """
         Yield first-level resources with merged generic and debt metrics.
 
@@ -352,6 +1055,8 @@ class SonarAPIHandler(object):
         :param categories: iterable of debt characteristics by name
         :param include_trends: include differential values for leak periods
         :param include_modules: include modules data
+        :param validate_metrics: check metrics against the server catalog,
+            failing with ValidationError before the call if unknown
         :return: generator that yields resource metrics and debt data dicts
         """
         # First make a dict with all resources
@@ -359,7 +1064,8 @@ class SonarAPIHandler(object):
                 self.get_resources_metrics(
                     resource=resource, metrics=metrics,
                     include_trends=include_trends,
-                    include_modules=include_modules
+                    include_modules=include_modules,
+                    validate_metrics=validate_metrics
                 )}
 
         # Now merge the debt data using the key
@@ -384,7 +1090,7 @@ class SonarAPIHandler(object):
 
         :return: True if valid
         """
-        res = self._make_call('get', self.AUTH_VALIDATION_ENDPOINT).json()
+        res = self.decode(self._make_call('get', self.AUTH_VALIDATION_ENDPOINT))
         return res.get('valid', False)
 
     def get_users(self, logins=None, include_deactivated=False):
@@ -407,6 +1113,27 @@ class SonarAPIHandler(object):
         res = self._make_call('post', self.USERS_LIST_ENDPOINT, **params)
         return res
 
+    def iter_users(self, logins=None, include_deactivated=False):
+        """
+        Yield the users of the SonarQube instance, in pages of the largest
+        size if the server paginates them (5.2+), or from a single call.
+
+        :param logins: comma-separated list of user logins
+        :param include_deactivated: include deactivated users
+        :return: generator that yields user data dicts
+        """
+        if not self.get_capabilities().at_least(5, 2):
+            for user in self.decode(self.get_users(logins, include_deactivated))['users']:
+                yield user
+            return
+
+        params = {'includeDeactivated': include_deactivated}
+        if logins:
+            params['logins'] = logins
+        for page in self._get_pages(self.USERS_LIST_ENDPOINT, **params):
+            for user in page['users']:
+                yield user
+
     def create_user(self, login, password, name, email=None):
         """
         Create a user
@@ -0,0 +1,114 @@
+"""
+This module contains the Batch of write calls of a SonarAPIHandler, made
+concurrently by a pool of threads.
+
+Usage::
+
+    with h.batch(max_workers=8) as batch:
+        for login, password, name in new_users:
+            batch.create_user(login, password, name)
+            batch.add_user_group(login, name='developers')
+
+    for response_or_error in batch.results():
+        ...
+"""
+import functools
+import time
+
+from concurrent.futures import CancelledError, ThreadPoolExecutor, wait
+
+from .deadline import remaining, with_deadline
+
+
+class Batch(object):
+    """
+    Batch of write calls of a handler: every call is dispatched to a pool
+    of threads and returns a future, resolved to the response or failed
+    with the same error (ie: ValidationError) as the direct call.
+    """
+    # Handler methods that can be called in a batch
+    METHODS = (
+        'activate_rule', 'activate_rules', 'create_rule',
+        'create_user', 'update_user', 'deactivate_user',
+        'create_group', 'update_group', 'delete_group',
+        'add_user_group', 'remove_user_group',
+    )
+
+    def __init__(self, handler, max_workers=4):
+        """
+        :param handler: SonarAPIHandler instance making the calls
+        :param max_workers: calls made at once
+        """
+        self.handler = handler
+        self.futures = []
+        self._executor = ThreadPoolExecutor(max_workers)
+
+    def __getattr__(self, name):
+        if name not in self.METHODS:
+            raise AttributeError('{} cannot be called in a batch'.format(name))
+        return functools.partial(self.submit, getattr(self.handler, name))
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Dispatch a call (the deadline of the calling thread, if any, applies
+        to it).
+
+        :param func: handler method
+        :param args: positional arguments of the method
+        :param kwargs: keyword arguments of the method
+        :return: Future of the response
+        """
+        left = remaining()
+        expires = None if left is None else time.time() + left
+        future = self._executor.submit(self._run, expires, func, args, kwargs)
+        self.futures.append(future)
+        return future
+
+    @staticmethod
+    def _run(expires, func, args, kwargs):
+        return with_deadline(None if expires is None else expires - time.time(),
+                             func, *args, **kwargs)
+
+    def wait(self):
+        """
+        Wait for all the calls dispatched so far.
+        """
+        wait(self.futures)
+
+    def results(self):
+        """
+        Wait for the calls and return their results, in submission order.
+
+        :return: list of responses, or errors for the failed calls (and
+            CancelledError for the cancelled ones)
+        """
+        results = []
+        for future in self.futures:
+            if future.cancelled():
+                results.append(CancelledError())
+                continue
+            error = future.exception()
+            results.append(future.result() if error is None else error)
+        return results
+
+    def cancel(self):
+        """
+        Cancel the calls not started yet.
+        """
+        for future in self.futures:
+            future.cancel()
+
+    def close(self):
+        """
+        Wait for the running calls and release the workers.
+        """
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        # Note: don't make pending calls if the block failed
+        if exc_type is not None:
+            self.cancel()
+        self.close()
@@ -0,0 +1,91 @@
+"""
+This module contains the ServerCapabilities, the version and web services of
+a SonarQube server, used by SonarAPIHandler to choose the best endpoints
+available (ie: bulk activation of rules, or measures of components instead
+of the deprecated resources).
+
+Usage::
+
+    capabilities = h.get_capabilities()
+    if capabilities.at_least(6, 3):
+        ...
+"""
+import re
+
+
+class ServerCapabilities(object):
+    """
+    Version and web service endpoints of a server. Any of them can be
+    unknown (ie: detection failed, or disabled), and then the checks are
+    inconclusive.
+    """
+    def __init__(self, version=None, webservices=None):
+        """
+        :param version: tuple of ints, or None if unknown
+        :param webservices: set of endpoints (ie: /api/rules/search), or
+            None if unknown
+        """
+        self.version = version
+        self.webservices = frozenset(webservices) if webservices is not None else None
+
+    @staticmethod
+    def parse_version(text):
+        """
+        Parse a version string (ie: "6.7.1.35068" or "5.6-SNAPSHOT").
+
+        :param text: str
+        :return: tuple of ints, or None if invalid
+        """
+        match = re.match(r'\s*(\d+(?:\.\d+)*)', text or '')
+        return tuple(int(n) for n in match.group(1).split('.')) if match else None
+
+    @staticmethod
+    def parse_webservices(data):
+        """
+        Return the endpoints in a list of web services: each action, and
+        the web service itself (ie: /api/resources, answered by its index).
+
+        :param data: decoded data of /api/webservices/list
+        :return: set of endpoints
+        """
+        endpoints = set()
+        for ws in data.get('webServices', []):
+            path = '/' + ws['path'].strip('/')
+            endpoints.add(path)
+            endpoints.update('{}/{}'.format(path, action['key'])
+                             for action in ws.get('actions', []))
+        return endpoints
+
+    @property
+    def known(self):
+        """
+        Whether anything was detected.
+        """
+        return self.version is not None or self.webservices is not None
+
+    def supports(self, endpoint):
+        """
+        Check whether the server has a web service endpoint.
+
+        :param endpoint: endpoint as str (ie: /api/rules/search)
+        :return: True or False, or None if unknown
+        """
+        if self.webservices is None:
+            return None
+        return endpoint in self.webservices
+
+    def at_least(self, *version):
+        """
+        Check whether the server version is the given one or later.
+
+        :param version: version numbers (ie: 6, 3)
+        :return: True or False, or None if unknown
+        """
+        if self.version is None:
+            return None
+        return self.version >= version
+
+    def __repr__(self):
+        version = '.'.join(str(n) for n in self.version) if self.version else 'unknown'
+        endpoints = len(self.webservices) if self.webservices is not None else 'unknown'
+        return '<ServerCapabilities {} ({} endpoints)>'.format(version, endpoints)
@@ -0,0 +1,141 @@
+"""
+This module contains the circuit breaker used by SonarAPIHandler to fail fast
+while a server is down, instead of waiting for every pending call to fail.
+
+The breaker is closed while calls succeed. After a number of consecutive
+failures (connection errors or 5xx) it opens, and calls fail immediately with
+CircuitOpenError. Once the reset timeout has passed it's half-open: a limited
+number of probe calls go through, and their result closes or re-opens it.
+
+Usage::
+
+    # Share the default breaker of the host with all handlers
+    h = SonarAPIHandler(host='http://sonar.example.com', circuit_breaker=True)
+
+    # Or use a custom one
+    breaker = CircuitBreaker(failure_threshold=10, reset_timeout=60)
+    h = SonarAPIHandler(host='http://sonar.example.com', circuit_breaker=breaker)
+"""
+import threading
+import time
+
+from .exceptions import CircuitOpenError
+
+
+class CircuitBreaker(object):
+    """
+    Thread-safe circuit breaker, counting consecutive failures.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0,
+                 half_open_calls=1):
+        """
+        :param failure_threshold: consecutive failures that open the circuit
+        :param reset_timeout: seconds open before allowing probe calls
+        :param half_open_calls: probe calls allowed at once while half-open
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probes = 0
+
+    @property
+    def state(self):
+        """
+        Current state: closed, open or half-open (when open for longer than
+        the reset timeout, even if no probe has been made yet).
+        """
+        with self._lock:
+            if self._state == self.OPEN and self._retry_in() <= 0:
+                return self.HALF_OPEN
+            return self._state
+
+    @property
+    def failures(self):
+        """
+        Number of consecutive failures.
+        """
+        return self._failures
+
+    def _retry_in(self):
+        # Note: call with the lock held
+        return self._opened_at + self.reset_timeout - time.time()
+
+    def before_call(self):
+        """
+        Check whether a call can be made, raising CircuitOpenError if not.
+        Every allowed call must be followed by record_success,
+        record_failure or release.
+        """
+        with self._lock:
+            if self._state == self.OPEN:
+                retry_in = self._retry_in()
+                if retry_in > 0:
+                    raise CircuitOpenError(
+                        'Circuit open after {} failures, retry in {:.1f}s'.format(
+                            self._failures, retry_in))
+
+                # Reset timeout passed, allow probes
+                self._state = self.HALF_OPEN
+                self._probes = 0
+
+            if self._state == self.HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    raise CircuitOpenError('Circuit half-open, waiting for probe calls')
+                self._probes += 1
+
+    def record_success(self):
+        """
+        Record a successful call, closing the circuit.
+        """
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probes = 0
+
+    def record_failure(self):
+        """
+        Record a failed call, opening the circuit if it was a probe or the
+        failure threshold was reached.
+        """
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or \
+                    self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.time()
+                self._probes = 0
+
+    def release(self):
+        """
+        Release the slot of a call that ended without a result (ie: stopped
+        by the deadline of the caller), without counting it as a failure.
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._probes:
+                self._probes -= 1
+
+    def reset(self):
+        """
+        Close the circuit and clear the failures.
+        """
+        self.record_success()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<CircuitBreaker {} ({} failures)>'.format(self.state, self._failures)
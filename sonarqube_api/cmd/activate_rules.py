@@ -3,54 +3,200 @@ Utility to activate rules on a SonarQube server.
 """
 import argparse
 import csv
+import hashlib
+import json
+import os
 import sys
 
 from sonarqube_api.api import SonarAPIHandler, ValidationError
+from sonarqube_api.deadline import deadline
+from sonarqube_api.instrumentation import Profiler
+from sonarqube_api.utils import parse_timeout
 
 
-parser = argparse.ArgumentParser(description='Activate rules in SonarQube server.')
-
-# Rules arguments (required)
-parser.add_argument('profile_key', type=str,
-                    help='Key of the target profile to activate rules.')
-parser.add_argument('filename', type=str,
-                    help='File to use for source of the rules definitions.')
-
-# Server connection params
-parser.add_argument('--host', dest='host', type=str,
-                    default='http://localhost',
-                    help='Host of the source SonarQube server')
-parser.add_argument('--port', dest='port', type=str,
-                    default='9000',
-                    help='Port of the source SonarQube server instance')
-parser.add_argument('--user', dest='user', type=str,
-                    default=None,
-                    help='Authentication user for source server')
-parser.add_argument('--password', dest='password', type=str,
-                    default=None,
-                    help='Authentication password for source server')
-parser.add_argument('--authtoken', dest='authtoken', type=str,
-                    default=None,
-                    help='Authentication token for source server')
-parser.add_argument('--basepath', dest='basepath', type=str,
-                    default=None,
-                    help='The base-path of the Sonar installation. Defaults to "/"')
+def add_arguments(parser):
+    """
+    Add the rules activation arguments (also used by the sonarqube command).
+
+    :param parser: ArgumentParser instance
+    """
+    # Rules arguments (required)
+    parser.add_argument('profile_key', type=str,
+                        help='Key of the target profile to activate rules.')
+    parser.add_argument('filename', type=str,
+                        help='File to use for source of the rules definitions.')
+
+    # Journal of applied rows, to skip them when re-running
+    parser.add_argument('--journal', dest='journal', type=str,
+                        default=None,
+                        help='Journal file of activated rules, skipped on re-runs')
+
+    # Compare with the current activations and only send changes
+    parser.add_argument('--diff', dest='diff', action='store_true',
+                        help='Only activate rules that differ from the current profile')
+
+
+def build_parser():
+    """
+    Build the command line arguments parser (only when the command runs).
+
+    :return: ArgumentParser instance
+    """
+    parser = argparse.ArgumentParser(description='Activate rules in SonarQube server.')
+    add_arguments(parser)
+
+    # Server connection params
+    parser.add_argument('--host', dest='host', type=str,
+                        default='http://localhost',
+                        help='Host of the source SonarQube server')
+    parser.add_argument('--port', dest='port', type=str,
+                        default='9000',
+                        help='Port of the source SonarQube server instance')
+    parser.add_argument('--user', dest='user', type=str,
+                        default=None,
+                        help='Authentication user for source server')
+    parser.add_argument('--password', dest='password', type=str,
+                        default=None,
+                        help='Authentication password for source server')
+    parser.add_argument('--authtoken', dest='authtoken', type=str,
+                        default=None,
+                        help='Authentication token for source server')
+    parser.add_argument('--basepath', dest='basepath', type=str,
+                        default=None,
+                        help='The base-path of the Sonar installation. Defaults to "/"')
+    parser.add_argument('--timeout', dest='timeout', type=parse_timeout,
+                        default=None,
+                        help='Timeout of each call in seconds, or "connect,read"')
+    parser.add_argument('--deadline', dest='deadline', type=float,
+                        default=None,
+                        help='Time budget for the whole command in seconds')
+
+    # Profiling option
+    parser.add_argument('--profile-report', dest='profile_report', action='store_true',
+                        help='Print a latency breakdown report at exit')
+
+    return parser
 
 
 def main():
     """
     Activate rules in a profile using a SonarAPIHandler instance.
     """
-    options = parser.parse_args()
+    options = build_parser().parse_args()
     h = SonarAPIHandler(host=options.host, port=options.port,
                         user=options.user, password=options.password,
-                        token=options.authtoken, base_path=options.basepath)
+                        token=options.authtoken, base_path=options.basepath,
+                        timeout=options.timeout)
+    profiler = Profiler()
+    if options.profile_report:
+        h.add_hook(profiler)
 
-    # Counters (total, created, skipped and failed)
-    a, f = 0, 0
+    with deadline(options.deadline):
+        run(h, options, profiler)
+    if options.profile_report:
+        sys.stderr.write(profiler.report())
+
+
+def journal_entry(profile_key, key, rule_def):
+    """
+    Return the journal line of an activation: profile, rule key and a hash
+    of the severity and params, separated by tabs.
+
+    :param profile_key: key of the profile
+    :param key: key of the rule
+    :param rule_def: clean activation data (reset, severity and params)
+    :return: str
+    """
+    digest = hashlib.sha1(json.dumps(rule_def, sort_keys=True).encode('utf-8')).hexdigest()
+    return u'{}\t{}\t{}\n'.format(profile_key, key, digest)
+
+
+def load_journal(path):
+    """
+    Load the entries of a journal file.
+
+    :param path: journal file name
+    :return: set of journal lines (empty if the file doesn't exist)
+    """
+    if not os.path.exists(path):
+        return set()
+
+    with open(path, 'r') as f:
+        # Note: ignore a last line left incomplete by a crash
+        return set(line for line in f if line.endswith('\n') and line.count('\t') == 2)
+
+
+def load_activations(h, profile_key):
+    """
+    Load the current activations of a profile by rule key.
+
+    :param h: SonarAPIHandler instance
+    :param profile_key: key of the profile
+    :return: dict of activations (severity and params dict) by rule key
+    """
+    activations = {}
+    for rule in h.get_rules(profile=profile_key, include_actives=True):
+        for active in rule['actives']:
+            if active.get('qProfile', profile_key) == profile_key:
+                activations[rule['key']] = {
+                    'severity': active.get('severity'),
+                    'params': {p['key']: p.get('value') for p in active.get('params', [])}
+                }
+                break
+
+    return activations
+
+
+def is_active(activation, rule_def):
+    """
+    Return whether a rule is already active with the values of the row:
+    the severity and params in the row (others are not compared). Resets
+    are never considered applied.
+
+    :param activation: current activation, or None if inactive
+    :param rule_def: clean activation data (reset, severity and params)
+    :return: bool
+    """
+    if activation is None or rule_def.get('reset'):
+        return False
+
+    for name, value in rule_def.items():
+        if name == 'severity':
+            if value.upper() != activation['severity']:
+                return False
+        elif activation['params'].get(name) != value:
+            return False
+
+    return True
+
+
+def run(h, options, profiler):
+    """
+    Activate the rules in the file and profile given in the options.
+
+    If a journal is given, every activated row is appended to it and the
+    rows already in it (same profile, rule and values) are skipped without
+    contacting the server. In diff mode, the current activations of the
+    profile are loaded first and rows that wouldn't change them are skipped.
+
+    :param h: SonarAPIHandler instance
+    :param options: parsed arguments
+    :param profiler: Profiler for local sections
+    :return: True if complete
+    """
+    # Counters (activated, skipped, unchanged and failed)
+    a, s, u, f = 0, 0, 0, 0
 
     # Read file and import
+    journal = None
     try:
+        if options.diff:
+            activations = load_activations(h, options.profile_key)
+
+        if options.journal:
+            journaled = load_journal(options.journal)
+            journal = open(options.journal, 'a')
+
         with open(options.filename, 'r') as import_file:
             # Init reader and check headers
             reader = csv.DictReader(import_file)
@@ -59,11 +205,29 @@ def main():
             for rule_def in reader:
                 key = rule_def.pop('key', None)
                 try:
-                    # Pop key, clean data and attempt activation
+                    # Pop key, clean data
                     rule_def['reset'] = rule_def.get('reset', '').lower() in ('y', 'yes', 'true')
                     rule_def = {k: v for k, v in rule_def.items() if v}
+
+                    # Skip if already journaled, or attempt activation
+                    if journal:
+                        entry = journal_entry(options.profile_key, key, rule_def)
+                        if entry in journaled:
+                            s += 1
+                            continue
+
+                    if options.diff and is_active(activations.get(key), rule_def):
+                        u += 1
+                        continue
+
                     h.activate_rule(key, options.profile_key, **rule_def)
                     a += 1
+                    profiler.count()
+
+                    if journal:
+                        journal.write(entry)
+                        journal.flush()
+                        journaled.add(entry)
 
                 except ValidationError as e:
                     # Invalid data, print error
@@ -80,6 +244,17 @@ def main():
         # No errors, write result
         status = 'Complete'
 
-    # Finally, write results
-    sys.stdout.write("{} rules activation: {} activated and "
-                     "{} failed.\n".format(status, a, f))
+    finally:
+        if journal:
+            journal.close()
+
+    # Finally, write results (skipped counters only if used)
+    counters = ['{} activated'.format(a)]
+    if options.journal:
+        counters.append('{} skipped (journaled)'.format(s))
+    if options.diff:
+        counters.append('{} unchanged'.format(u))
+    sys.stdout.write("{} rules activation: {} and {} failed.\n".format(
+        status, ', '.join(counters), f))
+    return status == 'Complete'
+
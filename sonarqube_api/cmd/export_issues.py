@@ -0,0 +1,178 @@
+"""
+Utility to export the issues on a SonarQube server, of any number, to a
+JSONL or CSV file.
+"""
+import argparse
+import sys
+
+from sonarqube_api.api import SonarAPIHandler
+from sonarqube_api.deadline import deadline
+from sonarqube_api.instrumentation import Profiler
+from sonarqube_api.utils import parse_timeout
+
+
+def add_arguments(parser):
+    """
+    Add the issues export arguments (also used by the sonarqube command).
+
+    :param parser: ArgumentParser instance
+    """
+    # Output arguments
+    parser.add_argument('--output', dest='output', type=str,
+                        default='-',
+                        help='Output file (stdout by default)')
+    parser.add_argument('--format', dest='format', choices=('jsonl', 'csv'),
+                        default=None,
+                        help='Output format (by the output file extension, '
+                             'or jsonl by default)')
+
+    # Issue filtering options
+    parser.add_argument('--projects', dest='projects', type=str, default='',
+                        help='Comma-separated keys of the projects of the issues')
+    parser.add_argument('--severities', dest='severities', type=str, default='',
+                        help='Comma-separated severities of the issues')
+    parser.add_argument('--types', dest='types', type=str, default='',
+                        help='Comma-separated types of the issues (ie: BUG)')
+    parser.add_argument('--statuses', dest='statuses', type=str, default='',
+                        help='Comma-separated statuses of the issues (ie: OPEN)')
+    parser.add_argument('--rules', dest='rules', type=str, default='',
+                        help='Comma-separated keys of the rules of the issues')
+    parser.add_argument('--resolved', dest='resolved', choices=('true', 'false'),
+                        default=None,
+                        help='Export only resolved or unresolved issues')
+    parser.add_argument('--created-after', dest='created_after', type=str, default=None,
+                        help='Export issues created from this date (ie: 2017-10-19)')
+    parser.add_argument('--created-before', dest='created_before', type=str, default=None,
+                        help='Export issues created before this date')
+
+    # Scan options
+    parser.add_argument('--page-size', dest='page_size', type=int, default=500,
+                        help='Number of issues fetched per call')
+    parser.add_argument('--workers', dest='workers', type=int, default=4,
+                        help='Date slices scanned at once (in order of creation if 1)')
+
+
+def build_parser():
+    """
+    Build the command line arguments parser (only when the command runs).
+
+    :return: ArgumentParser instance
+    """
+    parser = argparse.ArgumentParser(description='Export issues from a SonarQube server')
+
+    # Connection arguments
+    parser.add_argument('--host', dest='host', type=str,
+                        default='http://localhost',
+                        help='Host of the SonarQube server')
+    parser.add_argument('--port', dest='port', type=str,
+                        default='9000',
+                        help='Port of the SonarQube server instance')
+    parser.add_argument('--user', dest='user', type=str,
+                        default=None,
+                        help='Authentication user')
+    parser.add_argument('--password', dest='password', type=str,
+                        default=None,
+                        help='Authentication password')
+    parser.add_argument('--authtoken', dest='authtoken', type=str,
+                        default=None,
+                        help='Authentication token')
+    parser.add_argument('--basepath', dest='basepath', type=str,
+                        default=None,
+                        help='The base-path of the Sonar installation. Defaults to "/"')
+    parser.add_argument('--timeout', dest='timeout', type=parse_timeout,
+                        default=None,
+                        help='Timeout of each call in seconds, or "connect,read"')
+    parser.add_argument('--deadline', dest='deadline', type=float,
+                        default=None,
+                        help='Time budget for the whole command in seconds')
+
+    # Output and filtering arguments
+    add_arguments(parser)
+
+    # Profiling option
+    parser.add_argument('--profile-report', dest='profile_report', action='store_true',
+                        help='Print a latency breakdown report at exit')
+
+    return parser
+
+
+def main():
+    """
+    Export a SonarQube's issues to a JSONL or CSV file, using a
+    SonarAPIHandler connected to the given host.
+    """
+    options = build_parser().parse_args()
+    h = SonarAPIHandler(host=options.host, port=options.port,
+                        user=options.user, password=options.password,
+                        token=options.authtoken, base_path=options.basepath,
+                        timeout=options.timeout)
+    profiler = Profiler()
+    if options.profile_report:
+        h.add_hook(profiler)
+
+    try:
+        with deadline(options.deadline):
+            ok = run(h, options, profiler)
+    finally:
+        if options.profile_report:
+            sys.stderr.write(profiler.report())
+
+    if not ok:
+        sys.exit(1)
+
+
+def run(h, options, profiler):
+    """
+    Export the issues selected in the options to the output file, writing
+    them as they arrive.
+
+    :param h: SonarAPIHandler instance
+    :param options: parsed arguments
+    :param profiler: Profiler for local sections
+    :return: True if complete
+    """
+    # Note: import here, only needed when the command runs
+    from sonarqube_api.issues import write_csv, write_jsonl
+
+    # Determine the format, and where to write the results
+    fmt = options.format or ('csv' if options.output.lower().endswith('.csv') else 'jsonl')
+    to_stdout = options.output == '-'
+    results = sys.stderr if to_stdout else sys.stdout
+
+    issues = h.get_issues(options.projects, options.severities, options.types,
+                          options.statuses, options.rules,
+                          resolved=None if options.resolved is None else options.resolved == 'true',
+                          created_after=options.created_after,
+                          created_before=options.created_before,
+                          page_size=options.page_size, max_workers=options.workers)
+
+    # Counter of exported issues
+    exported = [0]
+
+    def counted(issues):
+        for issue in issues:
+            exported[0] += 1
+            profiler.count()
+            yield issue
+
+    f = sys.stdout if to_stdout else open(options.output, 'w')
+    try:
+        write = write_csv if fmt == 'csv' else write_jsonl
+        write(counted(issues), f)
+
+    except Exception as exc:
+        # Stop execution, the file keeps the issues written so far
+        results.write("Error: {}\n".format(exc))
+        status = 'Incomplete'
+
+    else:
+        status = 'Complete'
+
+    finally:
+        issues.close()
+        if not to_stdout:
+            f.close()
+
+    # Finally, write results
+    results.write("{} issues export: {} exported.\n".format(status, exported[0]))
+    return status == 'Complete'
@@ -2,50 +2,115 @@
 Utility to export the rules on a SonarQube server.
 """
 import argparse
+import collections
 import csv
+import json
 import os
+import re
 import sys
 
 from sonarqube_api.api import SonarAPIHandler
-from sonarqube_api.utils import utf_encode
-
-
-parser = argparse.ArgumentParser(description='Export rules from a SonarQube server')
-
-# Connection arguments
-parser.add_argument('--host', dest='host', type=str,
-                    default='http://localhost',
-                    help='Host of the SonarQube server')
-parser.add_argument('--port', dest='port', type=str,
-                    default='9000',
-                    help='Port of the SonarQube server instance')
-parser.add_argument('--user', dest='user', type=str,
-                    default=None,
-                    help='Authentication user')
-parser.add_argument('--password', dest='password', type=str,
-                    default=None,
-                    help='Authentication password')
-parser.add_argument('--authtoken', dest='authtoken', type=str,
-                    default=None,
-                    help='Authentication token')
-parser.add_argument('--basepath', dest='basepath', type=str,
-                    default=None,
-                    help='The base-path of the Sonar installation. Defaults to "/"')
-
-# Output directory argument
-parser.add_argument('--output-dir', dest='output', type=str,
-                    default='~',
-                    help='Output file')
-
-# Rule filtering options
-parser.add_argument('--active-only', dest='active', action='store_true',
-                    help='Export only active rules')
-parser.add_argument('--profile', dest='profile', type=str,
-                    default='',
-                    help='Export only rules for a given profile')
-parser.add_argument('--languages', dest='languages', type=str,
-                    default='',
-                    help='Language to filter the rules to export')
+from sonarqube_api.deadline import deadline
+from sonarqube_api.instrumentation import Profiler
+from sonarqube_api.utils import parse_timeout, prefetch, utf_encode
+
+
+def page_size(value):
+    """
+    Parse a page size, capped to the largest the server returns: pages of
+    rules must match the pages of the server, to resume from a checkpoint.
+
+    :param value: str
+    :return: int
+    :raises ArgumentTypeError: if it isn't a positive number
+    """
+    try:
+        size = int(value)
+    except ValueError:
+        size = 0
+    if size < 1:
+        raise argparse.ArgumentTypeError('invalid page size: {}'.format(value))
+    return min(size, SonarAPIHandler.MAX_PAGE_SIZE)
+
+
+def add_arguments(parser):
+    """
+    Add the rules export arguments (also used by the sonarqube command).
+
+    :param parser: ArgumentParser instance
+    """
+    # Output directory argument
+    parser.add_argument('--output-dir', dest='output', type=str,
+                        default='~',
+                        help='Output file')
+
+    # Rule filtering options
+    parser.add_argument('--active-only', dest='active', action='store_true',
+                        help='Export only active rules')
+    parser.add_argument('--profile', dest='profile', type=str,
+                        default='',
+                        help='Export only rules for a given profile')
+    parser.add_argument('--languages', dest='languages', type=str,
+                        default='',
+                        help='Language to filter the rules to export')
+
+    # Paging and checkpoint options
+    parser.add_argument('--page-size', dest='page_size', type=page_size,
+                        default=100,
+                        help='Number of rules fetched per call (500 at most)')
+    parser.add_argument('--resume', dest='resume', action='store_true',
+                        help='Resume an incomplete export from its last checkpoint')
+
+    # Rendering and output options
+    parser.add_argument('--workers', dest='workers', type=int,
+                        default=1,
+                        help='Processes rendering the rules (in the main one if 1)')
+    parser.add_argument('--shard-by-language', dest='shard', action='store_true',
+                        help='Write a CSV and an HTML file by language, plus an index page')
+
+
+def build_parser():
+    """
+    Build the command line arguments parser (only when the command runs).
+
+    :return: ArgumentParser instance
+    """
+    parser = argparse.ArgumentParser(description='Export rules from a SonarQube server')
+
+    # Connection arguments
+    parser.add_argument('--host', dest='host', type=str,
+                        default='http://localhost',
+                        help='Host of the SonarQube server')
+    parser.add_argument('--port', dest='port', type=str,
+                        default='9000',
+                        help='Port of the SonarQube server instance')
+    parser.add_argument('--user', dest='user', type=str,
+                        default=None,
+                        help='Authentication user')
+    parser.add_argument('--password', dest='password', type=str,
+                        default=None,
+                        help='Authentication password')
+    parser.add_argument('--authtoken', dest='authtoken', type=str,
+                        default=None,
+                        help='Authentication token')
+    parser.add_argument('--basepath', dest='basepath', type=str,
+                        default=None,
+                        help='The base-path of the Sonar installation. Defaults to "/"')
+    parser.add_argument('--timeout', dest='timeout', type=parse_timeout,
+                        default=None,
+                        help='Timeout of each call in seconds, or "connect,read"')
+    parser.add_argument('--deadline', dest='deadline', type=float,
+                        default=None,
+                        help='Time budget for the whole command in seconds')
+
+    # Output and filtering arguments
+    add_arguments(parser)
+
+    # Profiling option
+    parser.add_argument('--profile-report', dest='profile_report', action='store_true',
+                        help='Print a latency breakdown report at exit')
+
+    return parser
 
 
 # HTML rule section template
@@ -55,83 +120,350 @@ HTML_RULE_TEMPLATE = u'<h1 id="{}">{}</h1><dl><dt>Language</dt><dd>{}</dd>'\
                      u'</dl><div>{}</div><hr>'
 
 
+def render_rule(rule):
+    """
+    Render the CSV row and the HTML section of a rule.
+
+    :param rule: rule data dict
+    :return: tuple of CSV row (list) and HTML (str)
+    :raises KeyError: if the rule is missing required values
+    """
+    # Note: debt can be in diff. fields depending on type
+    debt = rule.get('debtRemFnOffset', rule.get('debtRemFnCoeff', u'-'))
+    row = [rule['langName'], rule['key'], rule['name'], debt, rule['severity']]
+
+    # Render parameters sublist
+    params_htmls = []
+    if rule['params']:
+        for param in rule['params']:
+            params_htmls.append(u'<li>{}: {}</li>'.format(
+                param.get('key', u'-'),
+                param.get('defaultValue', u'-')
+            ))
+    else:
+        params_htmls.append(u'-')
+
+    # Build values and render html
+    values = (
+        rule['key'], rule['name'], rule['langName'],
+        rule['key'], rule['severity'], debt,
+        u''.join(params_htmls), rule.get('htmlDesc', u'-')
+    )
+    html = utf_encode(HTML_RULE_TEMPLATE.format(*values))
+    return row, html
+
+
 def main():
     """
     Export a SonarQube's rules to a CSV and an HTML file, using a
     SonarAPIHandler connected to the given host.
     """
-    options = parser.parse_args()
+    options = build_parser().parse_args()
     h = SonarAPIHandler(host=options.host, port=options.port,
                         user=options.user, password=options.password,
-                        token=options.authtoken, base_path=options.basepath)
+                        token=options.authtoken, base_path=options.basepath,
+                        timeout=options.timeout)
+    profiler = Profiler()
+    if options.profile_report:
+        h.add_hook(profiler)
+
+    with deadline(options.deadline):
+        run(h, options, profiler)
+    if options.profile_report:
+        sys.stderr.write(profiler.report())
+
+
+def load_checkpoint(path, filters):
+    """
+    Load the checkpoint of an incomplete export.
+
+    :param path: checkpoint file name
+    :param filters: filters of the current export, must match the saved ones
+    :return: checkpoint data dict, or None if there's none
+    :raises ValueError: if the checkpoint is for other filters
+    """
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'r') as f:
+        checkpoint = json.load(f)
+    if checkpoint['filters'] != filters:
+        raise ValueError('checkpoint in {} is for other filters, '
+                         'remove it to start over'.format(path))
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    """
+    Save the checkpoint of an export, replacing the previous one atomically.
+
+    :param path: checkpoint file name
+    :param checkpoint: checkpoint data dict
+    """
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(checkpoint, f)
+    getattr(os, 'replace', os.rename)(tmp, path)
+
+
+def render_page(rules):
+    """
+    Render a page of rules (in a worker process if there are several).
+
+    :param rules: list of rule data dicts
+    :return: list of tuples of language (key and name), CSV row and HTML,
+        or of None and the missing keys for rules missing values
+    """
+    rendered = []
+    for rule in rules:
+        try:
+            row, html = render_rule(rule)
+            language = rule.get('lang') or rule['langName'], rule['langName']
+            rendered.append((language, row, html))
+        except KeyError as exc:
+            rendered.append((None, exc.args, None))
+
+    return rendered
+
+
+def render_pages(pages, workers, profiler):
+    """
+    Render pages of rules in order, in a pool of processes if more than one
+    worker (keeping them all busy while the results are written).
+
+    :param pages: iterable of lists of rule data dicts
+    :param workers: number of processes
+    :param profiler: Profiler for the formatting section
+    :return: generator that yields rendered pages (see render_page)
+    """
+    if workers <= 1:
+        for page in pages:
+            with profiler.timer('formatting'):
+                rendered = render_page(page)
+            yield rendered
+        return
+
+    # Note: import here, only needed with several workers
+    from concurrent.futures import ProcessPoolExecutor
+    executor = ProcessPoolExecutor(workers)
+    pending = collections.deque()
+    try:
+        for page in pages:
+            pending.append(executor.submit(render_page, page))
+            while len(pending) > workers or (pending and pending[0].done()):
+                with profiler.timer('formatting'):
+                    rendered = pending.popleft().result()
+                yield rendered
+        while pending:
+            with profiler.timer('formatting'):
+                rendered = pending.popleft().result()
+            yield rendered
+
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown()
+
+
+def paginate(rules, page_size):
+    """
+    Group rules in pages.
+
+    :param rules: iterable of rule data dicts
+    :param page_size: number of rules by page
+    :return: generator that yields lists of rule data dicts
+    """
+    page = []
+    for rule in rules:
+        page.append(rule)
+        if len(page) == page_size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+class RulesWriter(object):
+    """
+    Writer of the exported rules to a CSV and an HTML file, or to a pair of
+    files by language plus an index page, resuming from the offsets of a
+    checkpoint if given.
+    """
+    def __init__(self, output, shard=False, offsets=None, shards=None):
+        """
+        :param output: output directory
+        :param shard: write files by language
+        :param offsets: sizes of the files to resume, by file name
+        :param shards: name and rules written by language key (to resume)
+        """
+        self.output = output
+        self.shard = shard
+        self.offsets = offsets or {}
+        self.shards = dict(shards or {})
+        self._files = {}
+
+        # Single files are always written, even if empty
+        if not shard:
+            self._open(None)
 
-    # Determine output csv and html file names
-    csv_fn = os.path.expanduser(os.path.join(options.output, 'rules.csv'))
-    html_fn = os.path.expanduser(os.path.join(options.output, 'rules.html'))
+    def _open(self, language):
+        """
+        Open the files for a language key (all languages if None), truncated
+        to their offsets if resuming, or with their headers otherwise.
+        """
+        name = 'rules-{}'.format(
+            re.sub(r'[^a-z0-9]+', '-', language.lower()).strip('-')) if language else 'rules'
+        files = []
+        for fn in (name + '.csv', name + '.html'):
+            offset = self.offsets.get(fn)
+            f = open(os.path.join(self.output, fn), 'w' if offset is None else 'a')
+            if offset is not None:
+                f.truncate(offset)
+            files.append((fn, f))
 
-    # Open csv and html files
-    with open(csv_fn, 'w') as csv_f, open(html_fn, 'w') as html_f:
-        # Init csv writer and write header
-        csv_w = csv.writer(csv_f)
-        csv_w.writerow(['language', 'key', 'name', 'debt', 'severity'])
+        csv_w = csv.writer(files[0][1])
+        if self.offsets.get(files[0][0]) is None:
+            # Write csv header and start html file
+            csv_w.writerow(['language', 'key', 'name', 'debt', 'severity'])
+            files[1][1].write(u'<html><body>')
 
-        # Start html file
-        html_f.write(u'<html><body>')
+        self._files[language] = csv_w, files
+        return self._files[language]
 
-        # Get the rules generator
+    def write(self, language, row, html):
+        """
+        Write the CSV row and the HTML of a rule.
+
+        :param language: tuple of key and name of the rule language
+        :param row: CSV row as list
+        :param html: HTML section
+        """
+        key = language[0] if self.shard else None
+        csv_w, files = self._files.get(key) or self._open(key)
+        csv_w.writerow(row)
+        files[1][1].write(html)
+        if self.shard:
+            self.shards.setdefault(key, [language[1], 0])[1] += 1
+
+    def positions(self):
+        """
+        Flush the files and return their sizes.
+
+        :return: dict of offsets by file name
+        """
+        positions = {}
+        for csv_w, files in self._files.values():
+            for fn, f in files:
+                f.flush()
+                positions[fn] = f.tell()
+        return positions
+
+    def finish(self):
+        """
+        Close the HTML documents and write the index page (if sharding).
+        """
+        # Note: open files of languages only written before resuming
+        for language in self.shards:
+            if language not in self._files:
+                self._open(language)
+
+        for csv_w, files in self._files.values():
+            files[1][1].write(u'</body></html>')
+
+        if self.shard:
+            with open(os.path.join(self.output, 'index.html'), 'w') as f:
+                f.write(u'<html><body><h1>Rules</h1><ul>')
+                for language, (name, count) in sorted(self.shards.items()):
+                    csv_fn, html_fn = (fn for fn, _ in self._files[language][1])
+                    f.write(utf_encode(u'<li><a href="{}">{}</a>: {} rules '
+                                       u'(<a href="{}">CSV</a>)</li>'.format(
+                                           html_fn, name, count, csv_fn)))
+                f.write(u'</ul></body></html>')
+
+    def close(self):
+        """
+        Close all the files.
+        """
+        for csv_w, files in self._files.values():
+            for fn, f in files:
+                f.close()
+
+
+def run(h, options, profiler):
+    """
+    Export the rules selected in the options to the output directory.
+
+    The export is pipelined: pages are fetched in the background while the
+    previous ones are rendered (by a pool of processes, if several workers)
+    and written in order. After each page is written, a checkpoint with the
+    page and the offsets of the output files is saved, so that an
+    incomplete export can be resumed from there (see --resume). It's
+    removed once complete.
+
+    :param h: SonarAPIHandler instance
+    :param options: parsed arguments
+    :param profiler: Profiler for local sections
+    :return: True if complete
+    """
+    # Determine output directory and checkpoint file name
+    output = os.path.expanduser(options.output)
+    checkpoint_fn = os.path.join(output, 'rules.checkpoint.json')
+
+    # Load checkpoint to resume from, if any
+    filters = {'active': options.active, 'profile': options.profile,
+               'languages': options.languages, 'page_size': options.page_size,
+               'shard': options.shard}
+    checkpoint = None
+    if options.resume:
+        try:
+            checkpoint = load_checkpoint(checkpoint_fn, filters)
+        except ValueError as exc:
+            sys.stderr.write("Error: {}\n".format(exc))
+            return False
+
+    # Open output files, truncated to the checkpoint if resuming
+    if checkpoint:
+        writer = RulesWriter(output, options.shard, checkpoint['offsets'], checkpoint['shards'])
+    else:
+        writer = RulesWriter(output, options.shard)
+
+    try:
+        # Get the rules generator, starting after the checkpoint page
+        page = checkpoint['page'] if checkpoint else 0
         rules = h.get_rules(options.active,
                             options.profile,
-                            options.languages)
+                            options.languages,
+                            page_size=options.page_size,
+                            start_page=page + 1)
 
-        # Counters (total, exported and failed)
-        s, f = 0, 0
+        # Counters (exported and failed)
+        s, f = (checkpoint['exported'], checkpoint['failed']) if checkpoint else (0, 0)
 
-        # Now import and keep count
+        # Fetch pages in the background, render and write them in order
+        pages = prefetch(paginate(rules, options.page_size), size=2)
         try:
-            for rule in rules:
-                try:
-                    # Write CSV row
-                    csv_w.writerow([
-                        rule['langName'],
-                        rule['key'],
-                        rule['name'],
-                        # Note: debt can be in diff. fields depending on type
-                        rule.get('debtRemFnOffset',
-                                 rule.get('debtRemFnCoeff', u'-')),
-                        rule['severity']
-                    ])
-
-                    # Render parameters sublist
-                    params_htmls = []
-                    if rule['params']:
-                        for param in rule['params']:
-                            params_htmls.append(u'<li>{}: {}</li>'.format(
-                                param.get('key', u'-'),
-                                param.get('defaultValue', u'-')
-                            ))
-                    else:
-                        params_htmls.append(u'-')
-
-                    # Build values to write in html
-                    values = (
-                        rule['key'], rule['name'], rule['langName'],
-                        rule['key'], rule['severity'],
-                        rule.get('debtRemFnOffset', rule.get('debtRemFnCoeff', u'-')),
-                        u''.join(params_htmls), rule.get('htmlDesc', u'-')
-                    )
-
-                    # Render html and write to file
-                    html = utf_encode(HTML_RULE_TEMPLATE.format(*values))
-                    html_f.write(html)
-                    s += 1
-
-                except KeyError as exc:
-                    # Key error, should continue execution afterwards
-                    sys.stderr.write("Error: missing values for {}\n".format(','.join(exc.args)))
-                    f += 1
-
-            # Done with rules, close html body and document
-            html_f.write(u'</body></html>')
+            for rendered in render_pages(pages, options.workers, profiler):
+                with profiler.timer('writing'):
+                    for language, row, html in rendered:
+                        if language is None:
+                            # Missing values, should continue execution afterwards
+                            sys.stderr.write("Error: missing values for {}\n".format(','.join(row)))
+                            f += 1
+                        else:
+                            writer.write(language, row, html)
+                            s += 1
+                            profiler.count()
+
+                    if len(rendered) == options.page_size:
+                        # Page fully written, save checkpoint
+                        page += 1
+                        save_checkpoint(checkpoint_fn, {
+                            'filters': filters, 'page': page, 'offsets': writer.positions(),
+                            'shards': writer.shards, 'exported': s, 'failed': f
+                        })
+
+            # Done with rules, close html documents
+            writer.finish()
 
         except Exception as exc:
             # Other errors, stop execution immediately
@@ -141,7 +473,13 @@ def main():
         else:
             # No errors, complete
             status = 'Complete'
+            if os.path.exists(checkpoint_fn):
+                os.remove(checkpoint_fn)
+
+    finally:
+        writer.close()
 
-        # Finally, write results
-        sys.stdout.write("{} rules export: {} exported and "
-                         "{} failed.\n".format(status, s, f))
+    # Finally, write results
+    sys.stdout.write("{} rules export: {} exported and "
+                     "{} failed.\n".format(status, s, f))
+    return status == 'Complete'
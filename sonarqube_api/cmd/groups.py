@@ -2,66 +2,94 @@
 Utility to manage the groups on a SonarQube server.
 """
 import argparse
-from prettytable import PrettyTable
+import sys
+
 from sonarqube_api.api import SonarAPIHandler
+from sonarqube_api.deadline import deadline
+from sonarqube_api.instrumentation import Profiler
+from sonarqube_api.utils import parse_timeout
+
+
+def add_commands(commands):
+    """
+    Add the groups management commands (also used by the sonarqube command).
+
+    :param commands: subparsers action
+    """
+    # List
+    groups_list = commands.add_parser("list", help="Search for user groups")
+    groups_list.add_argument("--fields", help="Comma-separated list of the fields")
+    groups_list.add_argument("--query", help="Limit search to names in this query")
+    # Create
+    groups_create = commands.add_parser("create", help="Create a group")
+    groups_create.add_argument("name", help="Name for the new group")
+    groups_create.add_argument("--description", help="Description for the new group")
+    # Update
+    groups_update = commands.add_parser("update", help="Update a group")
+    groups_update.add_argument("gid", help="Identifier of the group")
+    groups_update.add_argument("--name", help="New name for the group")
+    groups_update.add_argument("--description", help="New description for the group")
+    # Delete
+    groups_delete = commands.add_parser("delete", help="Delete a group")
+    groups_delete.add_argument("--gid", help="Group id")
+    groups_delete.add_argument("--name", help="Group name")
+    # Add user
+    groups_adduser = commands.add_parser("add-user", help="Add a user to a group")
+    groups_adduser.add_argument("login", help="User login")
+    groups_adduser.add_argument("--gid", help="Group id")
+    groups_adduser.add_argument("--name", help="Group name")
+    # Remove user
+    groups_remuser = commands.add_parser("remove-user", help="Remove a user from a group")
+    groups_remuser.add_argument("login", help="User login")
+    groups_remuser.add_argument("--gid", help="Group id")
+    groups_remuser.add_argument("--name", help="Group name")
+    # List users
+    groups_lstusers = commands.add_parser("list-users", help="List users in a group")
+    groups_lstusers.add_argument("--gid", help="Group id")
+    groups_lstusers.add_argument("--name", help="Group name")
+    groups_lstusers.add_argument("--query", help="Limit search to names in this query")
+
+
+def build_parser():
+    """
+    Build the command line arguments parser (only when the command runs).
 
+    :return: ArgumentParser instance
+    """
+    parser = argparse.ArgumentParser(description='Manage groups on a SonarQube server')
+
+    # Connection arguments
+    parser.add_argument('--host', dest='host', type=str,
+                        default='http://localhost',
+                        help='Host of the SonarQube server')
+    parser.add_argument('--port', dest='port', type=str,
+                        default='9000',
+                        help='Port of the SonarQube server instance')
+    parser.add_argument('--user', dest='user', type=str,
+                        default=None,
+                        help='Authentication user')
+    parser.add_argument('--password', dest='password', type=str,
+                        default=None,
+                        help='Authentication password')
+    parser.add_argument('--authtoken', dest='authtoken', type=str,
+                        default=None,
+                        help='Authentication token')
+    parser.add_argument('--basepath', dest='basepath', type=str,
+                        default=None,
+                        help='The base-path of the Sonar installation. Defaults to "/"')
+    parser.add_argument('--timeout', dest='timeout', type=parse_timeout,
+                        default=None,
+                        help='Timeout of each call in seconds, or "connect,read"')
+    parser.add_argument('--deadline', dest='deadline', type=float,
+                        default=None,
+                        help='Time budget for the whole command in seconds')
+    parser.add_argument('--profile-report', dest='profile_report', action='store_true',
+                        help='Print a latency breakdown report at exit')
+
+    # Groups management arguments
+    add_commands(parser.add_subparsers(help='commands', dest='command'))
 
-parser = argparse.ArgumentParser(description='Manage groups on a SonarQube server')
-
-# Connection arguments
-parser.add_argument('--host', dest='host', type=str,
-                    default='http://localhost',
-                    help='Host of the SonarQube server')
-parser.add_argument('--port', dest='port', type=str,
-                    default='9000',
-                    help='Port of the SonarQube server instance')
-parser.add_argument('--user', dest='user', type=str,
-                    default=None,
-                    help='Authentication user')
-parser.add_argument('--password', dest='password', type=str,
-                    default=None,
-                    help='Authentication password')
-parser.add_argument('--authtoken', dest='authtoken', type=str,
-                    default=None,
-                    help='Authentication token')
-parser.add_argument('--basepath', dest='basepath', type=str,
-                    default=None,
-                    help='The base-path of the Sonar installation. Defaults to "/"')
-
-# Groups management arguments
-commands = parser.add_subparsers(help='commands', dest='command')
-# List
-groups_list = commands.add_parser("list", help="Search for user groups")
-groups_list.add_argument("--fields", help="Comma-separated list of the fields")
-groups_list.add_argument("--query", help="Limit search to names in this query")
-# Create
-groups_create = commands.add_parser("create", help="Create a group")
-groups_create.add_argument("name", help="Name for the new group")
-groups_create.add_argument("--description", help="Description for the new group")
-# Update
-groups_update = commands.add_parser("update", help="Update a group")
-groups_update.add_argument("gid", help="Identifier of the group")
-groups_update.add_argument("--name", help="New name for the group")
-groups_update.add_argument("--description", help="New description for the group")
-# Delete
-groups_delete = commands.add_parser("delete", help="Delete a group")
-groups_delete.add_argument("--gid", help="Group id")
-groups_delete.add_argument("--name", help="Group name")
-# Add user
-groups_adduser = commands.add_parser("add-user", help="Add a user to a group")
-groups_adduser.add_argument("login", help="User login")
-groups_adduser.add_argument("--gid", help="Group id")
-groups_adduser.add_argument("--name", help="Group name")
-# Remove user
-groups_remuser = commands.add_parser("remove-user", help="Remove a user from a group")
-groups_remuser.add_argument("login", help="User login")
-groups_remuser.add_argument("--gid", help="Group id")
-groups_remuser.add_argument("--name", help="Group name")
-# List users
-groups_lstusers = commands.add_parser("list-users", help="List users in a group")
-groups_lstusers.add_argument("--gid", help="Group id")
-groups_lstusers.add_argument("--name", help="Group name")
-groups_lstusers.add_argument("--query", help="Limit search to names in this query")
+    return parser
 
 
 def main():
@@ -69,26 +97,53 @@ def main():
     Manage a SonarQube's groups, using a
     SonarAPIHandler connected to the given host.
     """
-    options = parser.parse_args()
+    options = build_parser().parse_args()
     h = SonarAPIHandler(host=options.host, port=options.port,
                         user=options.user, password=options.password,
-                        token=options.authtoken, base_path=options.basepath)
+                        token=options.authtoken, base_path=options.basepath,
+                        timeout=options.timeout)
+
+    profiler = Profiler()
+    if options.profile_report:
+        h.add_hook(profiler)
+
+    try:
+        with deadline(options.deadline):
+            run(h, options, profiler)
+    finally:
+        if options.profile_report:
+            sys.stderr.write(profiler.report())
 
+
+def run(h, options, profiler):
+    """
+    Run the groups command given in the options.
+
+    :param h: SonarAPIHandler instance
+    :param options: parsed arguments
+    :param profiler: Profiler for local sections
+    """
     if options.command == 'list':
-        groups = h.get_groups(options.fields, options.query).json()
-        table = PrettyTable(['ID', 'Name', 'Description', 'Members', 'Default'])
-        for group in groups['groups']:
-            table.add_row([group.get('id'),
-                           group.get('name'),
-                           group.get('description'),
-                           group.get('membersCount'),
-                           group.get('default')])
-        print(table)
+        groups = h.decode(h.get_groups(options.fields, options.query))
+        with profiler.timer('formatting'):
+            # Note: import here, only needed to print tables
+            from prettytable import PrettyTable
+            table = PrettyTable(['ID', 'Name', 'Description', 'Members', 'Default'])
+            for group in groups['groups']:
+                table.add_row([group.get('id'),
+                               group.get('name'),
+                               group.get('description'),
+                               group.get('membersCount'),
+                               group.get('default')])
+                profiler.count()
+            # Note: the table is rendered when printed, time it too
+            text = table.get_string()
+        print(text)
     elif options.command == 'create':
-        res = h.create_group(options.name, options.description).json()
+        res = h.decode(h.create_group(options.name, options.description))
         print(res['group'])
     elif options.command == 'update':
-        res = h.update_group(options.gid, options.name, options.description).json()
+        res = h.decode(h.update_group(options.gid, options.name, options.description))
         print(res['group'])
     elif options.command == 'delete':
         res = h.delete_group(options.gid, options.name)
@@ -109,8 +164,14 @@ def main():
         else:
             print("Error[%s] %s" % (res.status_code, res.reason))
     elif options.command == 'list-users':
-        users = h.get_group_users(options.gid, options.name, options.query).json()
-        table = PrettyTable(['Login', 'Name'])
-        for user in users['users']:
-            table.add_row([user['login'], user['name']])
-        print(table)
+        users = h.decode(h.get_group_users(options.gid, options.name, options.query))
+        with profiler.timer('formatting'):
+            # Note: import here, only needed to print tables
+            from prettytable import PrettyTable
+            table = PrettyTable(['Login', 'Name'])
+            for user in users['users']:
+                table.add_row([user['login'], user['name']])
+                profiler.count()
+            # Note: the table is rendered when printed, time it too
+            text = table.get_string()
+        print(text)
@@ -4,117 +4,256 @@ Utility to migrate custom rules from one SonarQube server to another one.
 import argparse
 import sys
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from sonarqube_api.api import SonarAPIHandler, ValidationError
+from sonarqube_api.deadline import deadline, remaining, with_deadline
+from sonarqube_api.instrumentation import Profiler
+from sonarqube_api.utils import parse_timeout
+
+
+def build_parser():
+    """
+    Build the command line arguments parser (only when the command runs).
 
+    :return: ArgumentParser instance
+    """
+    parser = argparse.ArgumentParser(description='Migrate custom rules from one '
+                                                 'SonarQube server to another')
 
-parser = argparse.ArgumentParser(description='Migrate custom rules from one '
-                                             'SonarQube server to another')
-
-# Source connection arguments
-parser.add_argument('--source-host', dest='source_host', type=str,
-                    default='http://localhost',
-                    help='Host of the source SonarQube server')
-parser.add_argument('--source-port', dest='source_port', type=str,
-                    default='9000',
-                    help='Port of the source SonarQube server instance')
-parser.add_argument('--source-user', dest='source_user', type=str,
-                    default=None,
-                    help='Authentication user for source server')
-parser.add_argument('--source-password', dest='source_password', type=str,
-                    default=None,
-                    help='Authentication password for source server')
-parser.add_argument('--source-authtoken', dest='source_authtoken', type=str,
-                    default=None,
-                    help='Authentication token for source server')
-parser.add_argument('--source-basepath', dest='source_basepath', type=str,
-                    default=None,
-                    help='The base-path of the source Sonar installation. Defaults to "/"')
-
-# Target connection arguments
-parser.add_argument('--target-host', dest='target_host', type=str,
-                    default='http://localhost',
-                    help='Host of the target SonarQube server')
-parser.add_argument('--target-port', dest='target_port', type=str,
-                    default='9000',
-                    help='Port of the target SonarQube server instance')
-parser.add_argument('--target-user', dest='target_user', type=str,
-                    default=None,
-                    help='Authentication user for target server')
-parser.add_argument('--target-password', dest='target_password', type=str,
-                    default=None,
-                    help='Authentication password for target server')
-parser.add_argument('--target-authtoken', dest='target_authtoken', type=str,
-                    default=None,
-                    help='Authentication token for target server')
-parser.add_argument('--target-basepath', dest='target_basepath', type=str,
-                    default=None,
-                    help='The base-path of the target Sonar installation. Defaults to "/"')
+    # Source connection arguments
+    parser.add_argument('--source-host', dest='source_host', type=str,
+                        default='http://localhost',
+                        help='Host of the source SonarQube server')
+    parser.add_argument('--source-port', dest='source_port', type=str,
+                        default='9000',
+                        help='Port of the source SonarQube server instance')
+    parser.add_argument('--source-user', dest='source_user', type=str,
+                        default=None,
+                        help='Authentication user for source server')
+    parser.add_argument('--source-password', dest='source_password', type=str,
+                        default=None,
+                        help='Authentication password for source server')
+    parser.add_argument('--source-authtoken', dest='source_authtoken', type=str,
+                        default=None,
+                        help='Authentication token for source server')
+    parser.add_argument('--source-basepath', dest='source_basepath', type=str,
+                        default=None,
+                        help='The base-path of the source Sonar installation. Defaults to "/"')
 
+    # Target connection arguments, repeat them to migrate to several targets
+    # Note: a single port, user, etc. applies to all targets
+    parser.add_argument('--target-host', dest='target_host', type=str,
+                        action='append', default=None,
+                        help='Host of the target SonarQube server (repeatable)')
+    parser.add_argument('--target-port', dest='target_port', type=str,
+                        action='append', default=None,
+                        help='Port of the target SonarQube server instance')
+    parser.add_argument('--target-user', dest='target_user', type=str,
+                        action='append', default=None,
+                        help='Authentication user for target server')
+    parser.add_argument('--target-password', dest='target_password', type=str,
+                        action='append', default=None,
+                        help='Authentication password for target server')
+    parser.add_argument('--target-authtoken', dest='target_authtoken', type=str,
+                        action='append', default=None,
+                        help='Authentication token for target server')
+    parser.add_argument('--target-basepath', dest='target_basepath', type=str,
+                        action='append', default=None,
+                        help='The base-path of the target Sonar installation. Defaults to "/"')
 
-def main():
+    # Timeouts (for both servers)
+    parser.add_argument('--timeout', dest='timeout', type=parse_timeout,
+                        default=None,
+                        help='Timeout of each call in seconds, or "connect,read"')
+    parser.add_argument('--deadline', dest='deadline', type=float,
+                        default=None,
+                        help='Time budget for the whole command in seconds')
+
+    # Profiling option
+    parser.add_argument('--profile-report', dest='profile_report', action='store_true',
+                        help='Print a latency breakdown report at exit')
+
+    return parser
+
+
+def target_option(values, i, default=None):
     """
-    Migrate custom rules from one server to another one using two
-    SonarAPIHandler instances.
+    Return the value of a target option for the i-th target: its own value,
+    or the only one given (for all targets).
+
+    :param values: list of values given, or None
+    :param i: index of the target
+    :param default: value if none given
+    :return: value
     """
-    options = parser.parse_args()
-    sh = SonarAPIHandler(host=options.source_host, port=options.source_port,
-                         user=options.source_user, password=options.source_password,
-                         token=options.source_authtoken, base_path=options.source_basepath)
-    th = SonarAPIHandler(host=options.target_host, port=options.target_port,
-                         user=options.target_user, password=options.target_password,
-                         token=options.target_authtoken, base_path=options.target_basepath)
+    if not values:
+        return default
+    elif len(values) == 1:
+        return values[0]
+    else:
+        return values[i]
+
+
+def check_target_options(parser, options, count):
+    """
+    Check that each repeated target option is given once (for all targets)
+    or once by target, exiting with a usage error otherwise.
+
+    :param parser: ArgumentParser instance
+    :param options: parsed arguments
+    :param count: number of targets
+    """
+    for name in ('port', 'user', 'password', 'authtoken', 'basepath'):
+        values = getattr(options, 'target_' + name)
+        if values and len(values) not in (1, count):
+            parser.error('--target-{} given {} times, expected once or once by '
+                         '--target-host ({})'.format(name, len(values), count))
+
+
+def extract_rules(rules):
+    """
+    Extract the definitions of the custom rules to create: key, name,
+    description, message, xpath, severity, status and template.
+
+    :param rules: iterable of rule data dicts
+    :return: generator that yields tuples of source key and definition dict
+    """
+    for rule in rules:
+        # Ensure we have params (only custom rules have them)
+        params = rule.get('params')
+        if params:
+            # Get key, message, and xpath params
+            definition = {
+                'key': rule['key'].split(':')[-1], 'name': rule['name'],
+                'description': rule['mdDesc'], 'message': None, 'xpath': None,
+                'severity': rule['severity'], 'status': rule['status'],
+                'template_key': rule['templateKey']
+            }
+            for p in params:
+                if p['key'] == 'message':
+                    definition['message'] = p['defaultValue']
+                elif p['key'] == 'xpathQuery':
+                    definition['xpath'] = p['defaultValue']
+
+            yield rule['key'], definition
 
-    # Get the generator of source rules
-    rules = sh.get_rules(active_only=True, custom_only=True)
 
-    # Counters (total, created, skipped and failed)
+def push_rules(th, definitions, profiler, target=None):
+    """
+    Create the rules in a target server.
+
+    :param th: SonarAPIHandler instance of the target
+    :param definitions: list of tuples of source key and definition dict
+    :param profiler: Profiler to count created rules
+    :param target: name of the target for errors (if several)
+    :return: tuple of status and counters (created, skipped and failed)
+    """
+    # Counters (created, skipped and failed)
     c, s, f = 0, 0, 0
 
     # Now import and keep count
     try:
-        for rule in rules:
-            # Ensure we have params (only custom rules have them)
-            params = rule.get('params')
-            if params:
-                # Ok, let's try to create it
-                try:
-                    # Get key, message, and xpath params
-                    key = rule['key'].split(':')[-1]
-                    message = None
-                    xpath = None
-                    for p in params:
-                        if p['key'] == 'message':
-                            message = p['defaultValue']
-                        elif p['key'] == 'xpathQuery':
-                            xpath = p['defaultValue']
-
-                    # Now create it and increase counter
-                    th.create_rule(key, rule['name'], rule['mdDesc'], message,
-                                   xpath, rule['severity'], rule['status'],
-                                   rule['templateKey'])
-                    c += 1
-
-                except ValidationError as e:
-                    # Validation error, should continue execution afterwards
-                    if 'already exists' in str(e):
-                        # Rule already exists, skip
-                        s += 1
-
-                    else:
-                        # Invalid data for rule creation, fail
-                        f += 1
-                        sys.stderr.write("Failed to create rule {}: "
-                                         "{}\n".format(rule['key'], e))
+        for source_key, definition in definitions:
+            # Ok, let's try to create it
+            try:
+                th.create_rule(**definition)
+                c += 1
+                profiler.count()
+
+            except ValidationError as e:
+                # Validation error, should continue execution afterwards
+                if 'already exists' in str(e):
+                    # Rule already exists, skip
+                    s += 1
+
+                else:
+                    # Invalid data for rule creation, fail
+                    f += 1
+                    sys.stderr.write("Failed to create rule {}{}: {}\n".format(
+                        source_key, ' in {}'.format(target) if target else '', e))
 
     except Exception as e:
         # Other errors, stop execution immediately
-        sys.stderr.write("Error: {}\n".format(e))
-        status = 'Incomplete'
+        sys.stderr.write("Error{}: {}\n".format(' in {}'.format(target) if target else '', e))
+        return 'Incomplete', (c, s, f)
 
     else:
-        # No errors, write result
-        status = 'Complete'
+        # No errors
+        return 'Complete', (c, s, f)
+
+
+def write_result(target, status, counters):
+    """
+    Write the results of the migration to a target, as soon as it finishes.
+
+    :param target: name of the target (None if it's the only one)
+    :param status: status of the migration
+    :param counters: tuple of created, skipped and failed rules
+    """
+    sys.stdout.write("{} rules migration{}: {} created, {} skipped (already "
+                     "existing) and {} failed.\n".format(
+                         status, ' to {}'.format(target) if target else '', *counters))
+    sys.stdout.flush()
+
+
+def main():
+    """
+    Migrate custom rules from one server to other ones using SonarAPIHandler
+    instances. The source is scanned once, then the rules are created in all
+    the targets concurrently.
+    """
+    parser = build_parser()
+    options = parser.parse_args()
+    sh = SonarAPIHandler(host=options.source_host, port=options.source_port,
+                         user=options.source_user, password=options.source_password,
+                         token=options.source_authtoken, base_path=options.source_basepath,
+                         timeout=options.timeout)
+    targets = options.target_host or ['http://localhost']
+    check_target_options(parser, options, len(targets))
+    ths = [SonarAPIHandler(host=host,
+                           port=target_option(options.target_port, i, '9000'),
+                           user=target_option(options.target_user, i),
+                           password=target_option(options.target_password, i),
+                           token=target_option(options.target_authtoken, i),
+                           base_path=target_option(options.target_basepath, i),
+                           timeout=options.timeout)
+           for i, host in enumerate(targets)]
+    names = [th._get_url('') for th in ths]
+    profiler = Profiler()
+    if options.profile_report:
+        for h in [sh] + ths:
+            h.add_hook(profiler)
+
+    with deadline(options.deadline):
+        # Scan the source once, keeping the rule definitions
+        definitions = []
+        source_status = 'Complete'
+        try:
+            for item in extract_rules(sh.get_rules(active_only=True, custom_only=True)):
+                definitions.append(item)
+        except Exception as e:
+            # Push the rules read so far anyway
+            sys.stderr.write("Error: {}\n".format(e))
+            source_status = 'Incomplete'
+
+        # Push to all targets concurrently (with the same deadline), writing
+        # the results of each one as it finishes
+        # Note: incomplete everywhere if the source scan failed
+        if len(ths) == 1:
+            status, counters = push_rules(ths[0], definitions, profiler)
+            write_result(None, status if source_status == 'Complete' else source_status, counters)
+        else:
+            left = remaining()
+            executor = ThreadPoolExecutor(len(ths))
+            futures = {executor.submit(with_deadline, left, push_rules, th, definitions,
+                                       profiler, target): target
+                       for th, target in zip(ths, names)}
+            for future in as_completed(futures):
+                status, counters = future.result()
+                write_result(futures[future],
+                             status if source_status == 'Complete' else source_status, counters)
+            executor.shutdown()
 
-    # Finally, write results
-    sys.stdout.write("{} rules migration: {} created, {} skipped (already "
-                     "existing) and {} failed.\n".format(status, c, s, f))
+    if options.profile_report:
+        sys.stderr.write(profiler.report())
@@ -0,0 +1,137 @@
+"""
+Utility to search the rules of a SonarQube server offline, in a local
+full-text index built from the server.
+"""
+import argparse
+import os
+import sys
+
+from sonarqube_api.api import SonarAPIHandler
+from sonarqube_api.deadline import deadline
+from sonarqube_api.exceptions import ValidationError
+from sonarqube_api.instrumentation import Profiler
+from sonarqube_api.search import RuleSearchIndex
+from sonarqube_api.utils import parse_timeout
+
+
+def build_parser():
+    """
+    Build the command line arguments parser (only when the command runs).
+
+    :return: ArgumentParser instance
+    """
+    parser = argparse.ArgumentParser(description='Search rules in a local index '
+                                                 'of a SonarQube server')
+
+    # Connection arguments (only needed to build the index)
+    parser.add_argument('--host', dest='host', type=str,
+                        default='http://localhost',
+                        help='Host of the SonarQube server')
+    parser.add_argument('--port', dest='port', type=str,
+                        default='9000',
+                        help='Port of the SonarQube server instance')
+    parser.add_argument('--user', dest='user', type=str,
+                        default=None,
+                        help='Authentication user')
+    parser.add_argument('--password', dest='password', type=str,
+                        default=None,
+                        help='Authentication password')
+    parser.add_argument('--authtoken', dest='authtoken', type=str,
+                        default=None,
+                        help='Authentication token')
+    parser.add_argument('--basepath', dest='basepath', type=str,
+                        default=None,
+                        help='The base-path of the Sonar installation. Defaults to "/"')
+    parser.add_argument('--timeout', dest='timeout', type=parse_timeout,
+                        default=None,
+                        help='Timeout of each call in seconds, or "connect,read"')
+    parser.add_argument('--deadline', dest='deadline', type=float,
+                        default=None,
+                        help='Time budget for the whole command in seconds')
+    parser.add_argument('--profile-report', dest='profile_report', action='store_true',
+                        help='Print a latency breakdown report at exit')
+
+    # Index file argument
+    parser.add_argument('--index', dest='index', type=str,
+                        default='~/.sonarqube-rules.db',
+                        help='Index file')
+
+    commands = parser.add_subparsers(help='commands', dest='command')
+    commands.required = True
+
+    # Build
+    index_build = commands.add_parser('build', help='Build the index from the server rules')
+    index_build.add_argument('--active-only', dest='active', action='store_true',
+                             help='Index only active rules')
+    index_build.add_argument('--profile', dest='profile', type=str, default='',
+                             help='Index only rules for a given profile')
+    index_build.add_argument('--languages', dest='languages', type=str, default='',
+                             help='Languages of the rules to index')
+    index_build.add_argument('--page-size', dest='page_size', type=int, default=500,
+                             help='Number of rules fetched per call')
+    # Search
+    index_search = commands.add_parser('search', help='Search rules in the index')
+    index_search.add_argument('text', nargs='+', help='Words to search')
+    index_search.add_argument('--languages', dest='languages', type=str, default='',
+                              help='Comma-separated languages of the rules to find')
+    index_search.add_argument('--severities', dest='severities', type=str, default='',
+                              help='Comma-separated severities of the rules to find')
+    index_search.add_argument('--limit', dest='limit', type=int, default=50,
+                              help='Maximum number of rules to find (0 for all)')
+    index_search.add_argument('--raw', dest='raw', action='store_true',
+                              help='Use the words as an SQLite full-text query')
+
+    return parser
+
+
+def main():
+    """
+    Build a local rules index using a SonarAPIHandler connected to the
+    given host, or search the rules in it.
+    """
+    parser = build_parser()
+    options = parser.parse_args()
+    h = SonarAPIHandler(host=options.host, port=options.port,
+                        user=options.user, password=options.password,
+                        token=options.authtoken, base_path=options.basepath,
+                        timeout=options.timeout)
+    profiler = Profiler()
+    if options.profile_report:
+        h.add_hook(profiler)
+
+    try:
+        with deadline(options.deadline):
+            run(h, options, profiler)
+    except ValidationError as exc:
+        # Invalid search query, ie: with --raw
+        parser.error(str(exc))
+    finally:
+        if options.profile_report:
+            sys.stderr.write(profiler.report())
+
+
+def run(h, options, profiler):
+    """
+    Run the index command given in the options.
+
+    :param h: SonarAPIHandler instance (unused for searches)
+    :param options: parsed arguments
+    :param profiler: Profiler for local sections
+    """
+    with RuleSearchIndex(os.path.expanduser(options.index)) as index:
+        if options.command == 'build':
+            rules = h.get_rules(options.active, options.profile, options.languages,
+                                page_size=options.page_size)
+            count = index.build(rules)
+            profiler.count(count)
+            sys.stdout.write('Indexed {} rules in {} ({}).\n'.format(
+                count, options.index, index.fts))
+
+        elif options.command == 'search':
+            with profiler.timer('searching'):
+                rules = index.search(' '.join(options.text), options.languages,
+                                     options.severities, options.limit, options.raw)
+            profiler.count(len(rules))
+            for rule in rules:
+                sys.stdout.write(u'{}\t{}\t{}\n'.format(
+                    rule['key'], rule.get('severity', u'-'), rule.get('name', u'')))
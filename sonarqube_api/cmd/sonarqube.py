@@ -0,0 +1,186 @@
+"""
+Utility to run operations on a SonarQube server, either a single one from the
+command line or many of them from a script file (or stdin), all in the same
+process and over the same session.
+"""
+import argparse
+import shlex
+import sys
+
+from sonarqube_api.api import SonarAPIHandler
+from sonarqube_api.cmd import activate_rules, export_issues, export_rules, groups, users
+from sonarqube_api.deadline import deadline
+from sonarqube_api.instrumentation import Profiler
+from sonarqube_api.utils import parse_timeout
+
+
+# Function running each operation, taking handler, options and profiler
+OPERATIONS = {
+    'users': users.run,
+    'groups': groups.run,
+    'activate-rules': activate_rules.run,
+    'export-rules': export_rules.run,
+    'export-issues': export_issues.run,
+}
+
+
+class ScriptParser(argparse.ArgumentParser):
+    """
+    Parser for script lines, raising errors instead of exiting.
+    """
+    def error(self, message):
+        raise ValueError(message)
+
+
+def add_operations(commands):
+    """
+    Add the operations that can be run from the command line or a script.
+
+    :param commands: subparsers action
+    """
+    users_parser = commands.add_parser('users', help='Manage users')
+    users.add_commands(users_parser.add_subparsers(help='commands', dest='command'))
+    groups_parser = commands.add_parser('groups', help='Manage groups')
+    groups.add_commands(groups_parser.add_subparsers(help='commands', dest='command'))
+    activate_rules.add_arguments(commands.add_parser(
+        'activate-rules', help='Activate rules in a profile from a CSV file'))
+    export_rules.add_arguments(commands.add_parser(
+        'export-rules', help='Export rules to CSV and HTML files'))
+    export_issues.add_arguments(commands.add_parser(
+        'export-issues', help='Export issues to a JSONL or CSV file'))
+
+
+def build_parser():
+    """
+    Build the command line arguments parser (only when the command runs).
+
+    :return: ArgumentParser instance
+    """
+    parser = argparse.ArgumentParser(description='Run operations on a SonarQube server')
+
+    # Connection arguments
+    parser.add_argument('--host', dest='host', type=str,
+                        default='http://localhost',
+                        help='Host of the SonarQube server')
+    parser.add_argument('--port', dest='port', type=str,
+                        default='9000',
+                        help='Port of the SonarQube server instance')
+    parser.add_argument('--user', dest='user', type=str,
+                        default=None,
+                        help='Authentication user')
+    parser.add_argument('--password', dest='password', type=str,
+                        default=None,
+                        help='Authentication password')
+    parser.add_argument('--authtoken', dest='authtoken', type=str,
+                        default=None,
+                        help='Authentication token')
+    parser.add_argument('--basepath', dest='basepath', type=str,
+                        default=None,
+                        help='The base-path of the Sonar installation. Defaults to "/"')
+    parser.add_argument('--timeout', dest='timeout', type=parse_timeout,
+                        default=None,
+                        help='Timeout of each call in seconds, or "connect,read"')
+    parser.add_argument('--deadline', dest='deadline', type=float,
+                        default=None,
+                        help='Time budget for the whole command in seconds')
+    parser.add_argument('--profile-report', dest='profile_report', action='store_true',
+                        help='Print a latency breakdown report at exit')
+
+    # Operations, plus script mode
+    commands = parser.add_subparsers(help='operations', dest='operation')
+    commands.required = True
+    add_operations(commands)
+    script = commands.add_parser('run', help='Run the operations in a script, one per line')
+    script.add_argument('script', nargs='?', default='-',
+                        help='Script file (stdin by default)')
+    script.add_argument('--keep-going', dest='keep_going', action='store_true',
+                        help='Continue after failed operations')
+
+    return parser
+
+
+def build_script_parser():
+    """
+    Build the parser for script lines (operations only).
+
+    :return: ScriptParser instance
+    """
+    parser = ScriptParser(prog='', add_help=False)
+    add_operations(parser.add_subparsers(help='operations', dest='operation'))
+    return parser
+
+
+def main():
+    """
+    Run one operation, or the operations in a script, using a single
+    SonarAPIHandler connected to the given host.
+    """
+    options = build_parser().parse_args()
+    h = SonarAPIHandler(host=options.host, port=options.port,
+                        user=options.user, password=options.password,
+                        token=options.authtoken, base_path=options.basepath,
+                        timeout=options.timeout)
+    profiler = Profiler()
+    if options.profile_report:
+        h.add_hook(profiler)
+
+    try:
+        with deadline(options.deadline):
+            if options.operation == 'run':
+                if options.script == '-':
+                    ok = run_script(h, sys.stdin, profiler, options.keep_going)
+                else:
+                    with open(options.script, 'r') as script:
+                        ok = run_script(h, script, profiler, options.keep_going)
+            else:
+                ok = OPERATIONS[options.operation](h, options, profiler) is not False
+
+    finally:
+        if options.profile_report:
+            sys.stderr.write(profiler.report())
+
+    if not ok:
+        sys.exit(1)
+
+
+def run_script(h, script, profiler, keep_going=False):
+    """
+    Run the operations in a script, one per line with the same arguments as
+    the command line (ie: "groups add-user jdoe --name devs"). Empty lines
+    and comments (starting with #) are ignored.
+
+    :param h: SonarAPIHandler instance
+    :param script: iterable of lines
+    :param profiler: Profiler for local sections
+    :param keep_going: continue after failed operations
+    :return: True if all operations succeeded
+    """
+    parser = build_script_parser()
+
+    # Counters (run and failed)
+    r, f = 0, 0
+
+    for num, line in enumerate(script, 1):
+        args = shlex.split(line, comments=True)
+        if not args:
+            continue
+
+        try:
+            # Parse and run, operations return False if incomplete
+            options = parser.parse_args(args)
+            ok = OPERATIONS[options.operation](h, options, profiler) is not False
+        except (Exception, SystemExit) as e:
+            # Invalid line or failed operation, print error
+            sys.stderr.write("Error in line {}: {}\n".format(num, e))
+            ok = False
+
+        r += 1
+        if not ok:
+            f += 1
+            if not keep_going:
+                break
+
+    # Finally, write results
+    status = 'Complete' if not f or keep_going else 'Incomplete'
+    sys.stdout.write("{} script: {} operations run and {} failed.\n".format(status, r, f))
+    return not f
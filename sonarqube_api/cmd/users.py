@@ -2,52 +2,80 @@
 Utility to manage the users on a SonarQube server.
 """
 import argparse
-from prettytable import PrettyTable
+import sys
+
 from sonarqube_api.api import SonarAPIHandler
+from sonarqube_api.deadline import deadline
+from sonarqube_api.instrumentation import Profiler
+from sonarqube_api.utils import parse_timeout
+
+
+def add_commands(commands):
+    """
+    Add the users management commands (also used by the sonarqube command).
+
+    :param commands: subparsers action
+    """
+    # List
+    users_list = commands.add_parser("list", help="Get all the active users of the SonarQube instance")
+    users_list.add_argument("--deactivated", action='store_true', help="Include deactivated users")
+    users_list.add_argument("--logins", help="comma-separated list of user logins")
+    # Create
+    users_create = commands.add_parser("create", help="Create a user")
+    users_create.add_argument("login", help="User login")
+    users_create.add_argument("user_pass", help="User password")
+    users_create.add_argument("name", help="User name")
+    users_create.add_argument("--email", help="User email")
+    # Update
+    users_update = commands.add_parser("update", help="Update a user")
+    users_update.add_argument("login", help="User login")
+    users_update.add_argument("--name", help="User name")
+    users_update.add_argument("--email", help="User email")
+    # Deactivate
+    users_deactivate = commands.add_parser("deactivate", help="Deactivate a user")
+    users_deactivate.add_argument("login", help="User login")
+
+
+def build_parser():
+    """
+    Build the command line arguments parser (only when the command runs).
 
+    :return: ArgumentParser instance
+    """
+    parser = argparse.ArgumentParser(description='Manage users on a SonarQube server')
+
+    # Connection arguments
+    parser.add_argument('--host', dest='host', type=str,
+                        default='http://localhost',
+                        help='Host of the SonarQube server')
+    parser.add_argument('--port', dest='port', type=str,
+                        default='9000',
+                        help='Port of the SonarQube server instance')
+    parser.add_argument('--user', dest='user', type=str,
+                        default=None,
+                        help='Authentication user')
+    parser.add_argument('--password', dest='password', type=str,
+                        default=None,
+                        help='Authentication password')
+    parser.add_argument('--authtoken', dest='authtoken', type=str,
+                        default=None,
+                        help='Authentication token')
+    parser.add_argument('--basepath', dest='basepath', type=str,
+                        default=None,
+                        help='The base-path of the Sonar installation. Defaults to "/"')
+    parser.add_argument('--timeout', dest='timeout', type=parse_timeout,
+                        default=None,
+                        help='Timeout of each call in seconds, or "connect,read"')
+    parser.add_argument('--deadline', dest='deadline', type=float,
+                        default=None,
+                        help='Time budget for the whole command in seconds')
+    parser.add_argument('--profile-report', dest='profile_report', action='store_true',
+                        help='Print a latency breakdown report at exit')
+
+    # User management arguments
+    add_commands(parser.add_subparsers(help='commands', dest='command'))
 
-parser = argparse.ArgumentParser(description='Manage users on a SonarQube server')
-
-# Connection arguments
-parser.add_argument('--host', dest='host', type=str,
-                    default='http://localhost',
-                    help='Host of the SonarQube server')
-parser.add_argument('--port', dest='port', type=str,
-                    default='9000',
-                    help='Port of the SonarQube server instance')
-parser.add_argument('--user', dest='user', type=str,
-                    default=None,
-                    help='Authentication user')
-parser.add_argument('--password', dest='password', type=str,
-                    default=None,
-                    help='Authentication password')
-parser.add_argument('--authtoken', dest='authtoken', type=str,
-                    default=None,
-                    help='Authentication token')
-parser.add_argument('--basepath', dest='basepath', type=str,
-                    default=None,
-                    help='The base-path of the Sonar installation. Defaults to "/"')
-
-# User management arguments
-commands = parser.add_subparsers(help='commands', dest='command')
-# List
-users_list = commands.add_parser("list", help="Get all the active users of the SonarQube instance")
-users_list.add_argument("--deactivated", action='store_true', help="Include deactivated users")
-users_list.add_argument("--logins", help="comma-separated list of user logins")
-# Create
-users_create = commands.add_parser("create", help="Create a user")
-users_create.add_argument("login", help="User login")
-users_create.add_argument("user_pass", help="User password")
-users_create.add_argument("name", help="User name")
-users_create.add_argument("--email", help="User email")
-# Update
-users_update = commands.add_parser("update", help="Update a user")
-users_update.add_argument("login", help="User login")
-users_update.add_argument("--name", help="User name")
-users_update.add_argument("--email", help="User email")
-# Deactivate
-users_deactivate = commands.add_parser("deactivate", help="Deactivate a user")
-users_deactivate.add_argument("login", help="User login")
+    return parser
 
 
 def main():
@@ -55,27 +83,54 @@ def main():
     Manage a SonarQube's users, using a
     SonarAPIHandler connected to the given host.
     """
-    options = parser.parse_args()
+    options = build_parser().parse_args()
     h = SonarAPIHandler(host=options.host, port=options.port,
                         user=options.user, password=options.password,
-                        token=options.authtoken, base_path=options.basepath)
+                        token=options.authtoken, base_path=options.basepath,
+                        timeout=options.timeout)
+
+    profiler = Profiler()
+    if options.profile_report:
+        h.add_hook(profiler)
+
+    try:
+        with deadline(options.deadline):
+            run(h, options, profiler)
+    finally:
+        if options.profile_report:
+            sys.stderr.write(profiler.report())
 
+
+def run(h, options, profiler):
+    """
+    Run the users command given in the options.
+
+    :param h: SonarAPIHandler instance
+    :param options: parsed arguments
+    :param profiler: Profiler for local sections
+    """
     if options.command == 'list':
-        users = h.get_users(options.logins, options.deactivated).json()
-        table = PrettyTable(['Login', 'Name', 'Email', 'Groups', 'Active'])
-        for user in users['users']:
-            table.add_row([user.get('login'),
-                           user.get('name'),
-                           user.get('email'),
-                           user.get('groups'),
-                           user.get('active')])
-        print(table)
+        users = h.decode(h.get_users(options.logins, options.deactivated))
+        with profiler.timer('formatting'):
+            # Note: import here, only needed to print tables
+            from prettytable import PrettyTable
+            table = PrettyTable(['Login', 'Name', 'Email', 'Groups', 'Active'])
+            for user in users['users']:
+                table.add_row([user.get('login'),
+                               user.get('name'),
+                               user.get('email'),
+                               user.get('groups'),
+                               user.get('active')])
+                profiler.count()
+            # Note: the table is rendered when printed, time it too
+            text = table.get_string()
+        print(text)
     elif options.command == 'create':
-        res = h.create_user(options.login, options.user_pass, options.name, options.email).json()
+        res = h.decode(h.create_user(options.login, options.user_pass, options.name, options.email))
         print(res['user'])
     elif options.command == 'update':
-        res = h.update_user(options.login, options.name, options.email).json()
+        res = h.decode(h.update_user(options.login, options.name, options.email))
         print(res['user'])
     elif options.command == 'deactivate':
-        res = h.deactivate_user(options.login).json()
+        res = h.decode(h.deactivate_user(options.login))
         print(res['user'])
@@ -0,0 +1,90 @@
+"""
+This module contains the deadlines, time budgets for whole operations (such
+as a paginated scan, or a migration) shared by all the calls made by any
+SonarAPIHandler in the same thread. Every call is given at most the remaining
+time as timeout, and DeadlineExceeded is raised once the budget runs out.
+
+Usage::
+
+    with deadline(60):
+        rules = list(h.get_rules())
+"""
+import contextlib
+import threading
+import time
+
+from .exceptions import DeadlineExceeded
+
+
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def deadline(seconds):
+    """
+    Context manager setting a deadline for the calls made in the current
+    thread. Nested deadlines can only shorten the current one.
+
+    :param seconds: time budget in seconds (None for no deadline)
+    """
+    previous = getattr(_local, 'expires', None)
+    if seconds is not None:
+        expires = time.time() + seconds
+        _local.expires = expires if previous is None else min(expires, previous)
+    try:
+        yield
+    finally:
+        _local.expires = previous
+
+
+def remaining():
+    """
+    Return the seconds left before the deadline of the current thread.
+
+    :return: float (negative if expired), or None if there's no deadline
+    """
+    expires = getattr(_local, 'expires', None)
+    return None if expires is None else expires - time.time()
+
+
+def check():
+    """
+    Raise DeadlineExceeded if the deadline of the current thread expired.
+
+    :return: seconds left, or None if there's no deadline
+    """
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded('Deadline exceeded by {:.3f}s'.format(-left))
+    return left
+
+
+def bound_timeout(timeout, left):
+    """
+    Return the timeout for a call, limited to the time left.
+
+    :param timeout: timeout in seconds or (connect, read) tuple, or None
+    :param left: seconds left before the deadline, or None
+    :return: timeout in seconds or (connect, read) tuple, or None
+    """
+    if left is None:
+        return timeout
+    elif timeout is None:
+        return left
+    elif isinstance(timeout, tuple):
+        return tuple(left if t is None else min(t, left) for t in timeout)
+    else:
+        return min(timeout, left)
+
+
+def with_deadline(seconds, func, *args, **kwargs):
+    """
+    Call a function with a deadline, ie: to pass the deadline of a thread
+    to the calls made in a worker thread.
+
+    :param seconds: time budget in seconds (None for no deadline)
+    :param func: function to call
+    :return: value returned by the function
+    """
+    with deadline(seconds):
+        return func(*args, **kwargs)
@@ -9,6 +9,10 @@ class ServerError(Exception):
     pass
 
 
+class CircuitOpenError(ServerError):
+    pass
+
+
 class AuthError(ClientError):
     pass
 
@@ -16,3 +20,14 @@ class AuthError(ClientError):
 class ValidationError(ClientError):
     pass
 
+
+class NotFoundError(ClientError):
+    pass
+
+
+class ReplayError(Exception):
+    pass
+
+
+class DeadlineExceeded(Exception):
+    pass
@@ -0,0 +1,635 @@
+"""
+This module contains a fake SonarQube server, running in-process on a local
+port, that implements the web service endpoints used by SonarAPIHandler with
+a generated dataset. It's meant for offline tests and benchmarks.
+
+Usage::
+
+    with FakeSonarQube(rules=5000, latency=0.01) as server:
+        h = server.handler(user='admin', password='admin')
+        rules = list(h.get_rules())
+"""
+import datetime
+import json
+import random
+import socket
+import sys
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+
+from .api import SonarAPIHandler
+from .issues import format_date, parse_date
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    # Note: the default backlog (5) delays bursts of concurrent connections
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # Note: clients going away (ie: timed out) are expected
+        if not isinstance(sys.exc_info()[1], socket.error):
+            HTTPServer.handle_error(self, request, client_address)
+
+
+class FakeSonarQube(object):
+    """
+    Fake SonarQube server with a configurable dataset size, latency and
+    error injection.
+    """
+    LANGUAGES = (('py', 'Python'), ('js', 'JavaScript'), ('java', 'Java'))
+    SEVERITIES = ('INFO', 'MINOR', 'MAJOR', 'CRITICAL', 'BLOCKER')
+    ISSUE_TYPES = ('BUG', 'VULNERABILITY', 'CODE_SMELL')
+    DEFAULT_PAGE_SIZE = 100
+    MAX_PAGE_SIZE = 500
+
+    # Issues search results that can be paged through
+    ISSUES_LIMIT = 10000
+
+    # Date of the first analysis (issues are created after it)
+    FIRST_ANALYSIS = datetime.datetime(2019, 1, 1)
+
+    def __init__(self, rules=1000, metrics=100, resources=20, users=50,
+                 groups=10, custom_ratio=0.1, latency=0.0, error_rate=0.0,
+                 seed=0, version='5.6.7', issues=0, first_analysis_ratio=0.2):
+        """
+        Generate the dataset (the server is not started until start).
+
+        :param rules: number of rules
+        :param metrics: number of metrics (at least the general ones)
+        :param resources: number of projects
+        :param users: number of users
+        :param groups: number of groups
+        :param custom_ratio: ratio of custom (xpath template) rules
+        :param latency: seconds to wait before answering each request
+        :param error_rate: ratio of requests answered with a 503 error
+        :param seed: seed for data generation and error injection
+        :param version: SonarQube version, the endpoints added later or
+            removed since are not available (see ENDPOINT_VERSIONS)
+        :param issues: number of issues, created over two years
+        :param first_analysis_ratio: ratio of issues created at once, in
+            the first analysis
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.version = version
+        self._version = tuple(int(n) for n in version.split('.'))
+        self.requests = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+        # Generate dataset
+        self.rules = [self._make_rule(i, custom_ratio) for i in range(rules)]
+        self.metrics = self._make_metrics(metrics)
+        self.resources = [self._make_resource(i) for i in range(resources)]
+        self.issues = sorted((self._make_issue(i, first_analysis_ratio) for i in range(issues)),
+                             key=lambda issue: (issue['created'], issue['key']))
+        self.users = {}
+        for i in range(users):
+            self._add_user('user{}'.format(i), 'User {}'.format(i))
+        self.groups = {}
+        for i in range(groups):
+            self._add_group('group{}'.format(i))
+
+        # Active rules by profile: {profile: {rule_key: activation}}
+        self.activations = {}
+
+    def _make_rule(self, i, custom_ratio):
+        lang, lang_name = self.LANGUAGES[i % len(self.LANGUAGES)]
+        custom = self._random.random() < custom_ratio
+        rule = {
+            'key': '{}:{}{}'.format(lang, 'X' if custom else 'S', i),
+            'repo': lang, 'lang': lang, 'langName': lang_name,
+            'name': 'Rule number {}'.format(i),
+            'htmlDesc': '<p>Description of rule {} with <b>some</b> text.</p>'.format(i) * 3,
+            'mdDesc': 'Description of rule {}'.format(i),
+            'severity': self.SEVERITIES[i % len(self.SEVERITIES)],
+            'status': 'READY', 'isTemplate': False, 'tags': [],
+            'sysTags': ['tag{}'.format(i % 7)], 'params': []
+        }
+        if custom:
+            rule['templateKey'] = '{}:XPath'.format(lang)
+            rule['params'] = [
+                {'key': 'message', 'defaultValue': 'Violation of rule {}'.format(i)},
+                {'key': 'xpathQuery', 'defaultValue': '//node[@id={}]'.format(i)}
+            ]
+        else:
+            rule['debtRemFnOffset'] = '{}min'.format(5 + i % 30)
+            if i % 4 == 0:
+                rule['params'] = [{'key': 'format', 'defaultValue': '^[a-z]+$'}]
+
+        return rule
+
+    def _make_issue(self, i, first_analysis_ratio):
+        rule = self.rules[i % len(self.rules)] if self.rules else {'key': 'py:S0'}
+        project = self.resources[i % len(self.resources)]['key'] if self.resources else 'project:0'
+        created = self.FIRST_ANALYSIS
+        if self._random.random() >= first_analysis_ratio:
+            created += datetime.timedelta(seconds=self._random.randint(1, 2 * 365 * 24 * 3600))
+        closed = self._random.random() < 0.3
+        issue = {
+            'key': 'issue-{}'.format(i), 'rule': rule['key'],
+            'severity': self.SEVERITIES[self._random.randint(0, 4)],
+            'type': self.ISSUE_TYPES[i % len(self.ISSUE_TYPES)],
+            'status': 'CLOSED' if closed else 'OPEN',
+            'project': project, 'component': '{}:src/file{}.py'.format(project, i % 50),
+            'line': 1 + i % 400, 'message': 'Issue number {}'.format(i),
+            'effort': '{}min'.format(5 + i % 30), 'author': 'user{}@example.com'.format(i % 9),
+            'tags': ['tag{}'.format(i % 7)], 'created': created,
+            'creationDate': format_date(created), 'updateDate': format_date(created),
+        }
+        if closed:
+            issue['resolution'] = 'FIXED'
+        return issue
+
+    def _make_metrics(self, n):
+        keys = list(SonarAPIHandler.GENERAL_METRICS)
+        keys.extend('new_{}'.format(k) for k in SonarAPIHandler.GENERAL_METRICS)
+        keys.extend('metric_{}'.format(i) for i in range(max(n - len(keys), 0)))
+        return [{'id': i, 'key': key, 'name': key.replace('_', ' ').title(),
+                 'type': 'INT', 'domain': 'General'}
+                for i, key in enumerate(keys)]
+
+    def _make_resource(self, i):
+        return {'id': i, 'key': 'project:{}'.format(i),
+                'name': 'Project {}'.format(i), 'scope': 'PRJ',
+                'qualifier': 'TRK'}
+
+    def _add_user(self, login, name, email=None):
+        user = {'login': login, 'name': name, 'active': True, 'groups': []}
+        if email:
+            user['email'] = email
+        self.users[login] = user
+        return user
+
+    def _add_group(self, name, description=None):
+        group = {'id': len(self.groups) + 1, 'name': name,
+                 'description': description or '', 'membersCount': 0,
+                 'default': False, 'members': set()}
+        self.groups[name] = group
+        return group
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.port)
+
+    def handler(self, **kwargs):
+        """
+        Return a SonarAPIHandler connected to this server.
+
+        :param kwargs: other SonarAPIHandler arguments
+        :return: SonarAPIHandler instance
+        """
+        return SonarAPIHandler(host='http://127.0.0.1', port=self.port, **kwargs)
+
+    def start(self, port=0):
+        """
+        Start serving in a background thread.
+
+        :param port: port to listen on (any free port by default)
+        :return: self
+        """
+        self._server = _ThreadingHTTPServer(('127.0.0.1', port), _build_request_handler(self))
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,))
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop serving and close the socket.
+        """
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def dispatch(self, method, path, params):
+        """
+        Answer a request.
+
+        :param method: http method
+        :param path: path of the endpoint
+        :param params: dict of params (single values)
+        :return: tuple of status and data to encode as json (None if empty)
+        """
+        with self._lock:
+            self.requests.append((method, path))
+            if self.error_rate and self._random.random() < self.error_rate:
+                return 503, None
+
+            view = self.ROUTES.get(path)
+            if view is None or not self.available(path):
+                return 404, None
+
+            return view(self, params)
+
+    def available(self, path):
+        """
+        Check whether an endpoint is available in the server version.
+
+        :param path: path of the endpoint
+        :return: bool
+        """
+        since, removed = self.ENDPOINT_VERSIONS.get(path, (None, None))
+        return (since is None or self._version >= since) and \
+            (removed is None or self._version < removed)
+
+    # Helpers
+    @staticmethod
+    def _error(msg):
+        return 400, {'errors': [{'msg': msg}]}
+
+    @classmethod
+    def _page(cls, params, items, name):
+        page = int(params.get('p', 1))
+        size = min(int(params.get('ps', cls.DEFAULT_PAGE_SIZE)), cls.MAX_PAGE_SIZE)
+        start = (page - 1) * size
+        return 200, {'p': page, 'ps': size, 'total': len(items),
+                     name: items[start:start + size]}
+
+    @classmethod
+    def _paging(cls, params, items, name):
+        # Note: newer web services, with paging information
+        page = int(params.get('p', 1))
+        size = min(int(params.get('ps', cls.DEFAULT_PAGE_SIZE)), cls.MAX_PAGE_SIZE)
+        start = (page - 1) * size
+        return {'paging': {'pageIndex': page, 'pageSize': size, 'total': len(items)},
+                name: items[start:start + size]}
+
+    @staticmethod
+    def _public(data, hidden=('members',)):
+        return {k: v for k, v in data.items() if k not in hidden}
+
+    def _find_group(self, params):
+        if 'name' in params:
+            return self.groups.get(params['name'])
+        for group in self.groups.values():
+            if str(group['id']) == params.get('id'):
+                return group
+
+    # Views
+    def _validate_auth(self, params):
+        return 200, {'valid': True}
+
+    def _server_version(self, params):
+        return 200, self.version
+
+    def _webservices(self, params):
+        actions = {}
+        for path in sorted(self.ROUTES):
+            if self.available(path):
+                # Note: web services with a single path are answered by index
+                parts = path.strip('/').split('/')
+                ws, action = ('/'.join(parts[:2]), 'index') if len(parts) == 2 \
+                    else ('/'.join(parts[:-1]), parts[-1])
+                actions.setdefault(ws, []).append({'key': action})
+        return 200, {'webServices': [{'path': ws, 'actions': actions[ws]}
+                                     for ws in sorted(actions)]}
+
+    def _search_metrics(self, params):
+        return self._page(params, self.metrics, 'metrics')
+
+    def _search_rules(self, params):
+        rules = self.rules
+        if params.get('languages'):
+            languages = params['languages'].split(',')
+            rules = [r for r in rules if r['lang'] in languages]
+        if params.get('has_debt_characteristic') == 'false':
+            rules = [r for r in rules if 'templateKey' in r]
+        if params.get('activation') == 'true':
+            if params.get('qprofile'):
+                active = set(self.activations.get(params['qprofile'], {}))
+            else:
+                active = set(k for p in self.activations.values() for k in p)
+            rules = [r for r in rules if r['key'] in active]
+
+        status, data = self._page(params, rules, 'rules')
+
+        # Activations of the page rules, only if requested
+        if 'actives' in params.get('f', '').split(','):
+            profiles = [params['qprofile']] if params.get('qprofile') else sorted(self.activations)
+            data['actives'] = {}
+            for rule in data['rules']:
+                actives = [dict(self.activations[p][rule['key']], qProfile=p, inherit='NONE')
+                           for p in profiles if rule['key'] in self.activations.get(p, {})]
+                if actives:
+                    data['actives'][rule['key']] = actives
+
+        return status, data
+
+    def _resources(self, params):
+        resources = self.resources
+        if params.get('resource'):
+            resources = [r for r in resources if r['key'] == params['resource']]
+            if not resources:
+                return 404, None
+
+        result = []
+        for resource in resources:
+            resource = dict(resource)
+            if params.get('characteristics'):
+                resource['msr'] = [{'key': 'sqale_index', 'ctic_key': c, 'val': 10.0 * resource['id']}
+                                   for c in params['characteristics'].split(',')]
+            else:
+                resource['msr'] = [{'key': m, 'val': float(resource['id']), 'frmt_val': str(resource['id'])}
+                                   for m in params.get('metrics', '').split(',') if m]
+            result.append(resource)
+
+        return 200, result
+
+    def _search_issues(self, params):
+        issues = self.issues
+        for param, field in (('projectKeys', 'project'), ('severities', 'severity'),
+                             ('types', 'type'), ('statuses', 'status'), ('rules', 'rule')):
+            if params.get(param):
+                values = params[param].split(',')
+                issues = [i for i in issues if i[field] in values]
+        if params.get('resolved'):
+            resolved = params['resolved'] == 'true'
+            issues = [i for i in issues if ('resolution' in i) == resolved]
+        if params.get('createdAfter'):
+            after = parse_date(params['createdAfter'])
+            issues = [i for i in issues if i['created'] >= after]
+        if params.get('createdBefore'):
+            before = parse_date(params['createdBefore'])
+            issues = [i for i in issues if i['created'] < before]
+        if params.get('asc') == 'false':
+            issues = issues[::-1]
+
+        # Only the first results can be paged through
+        page, size = int(params.get('p', 1)), int(params.get('ps', self.DEFAULT_PAGE_SIZE))
+        if page * min(size, self.MAX_PAGE_SIZE) > self.ISSUES_LIMIT:
+            return self._error('Can return only the first {} results. {}th result asked.'.format(
+                self.ISSUES_LIMIT, page * size))
+
+        data = self._paging(params, issues, 'issues')
+        data['total'] = data['paging']['total']
+        data['issues'] = [self._public(i, hidden=('created',)) for i in data['issues']]
+        return 200, data
+
+    def _search_components(self, params):
+        qualifiers = params.get('qualifiers', 'TRK').split(',')
+        components = [{'id': r['id'], 'key': r['key'], 'name': r['name'],
+                       'qualifier': r['qualifier']}
+                      for r in self.resources if r['qualifier'] in qualifiers]
+        return 200, self._paging(params, components, 'components')
+
+    def _measures_tree(self, params):
+        key = params.get('component') if self._version >= (6, 6) else params.get('baseComponentKey')
+        resource = next((r for r in self.resources if r['key'] == key), None)
+        if resource is None:
+            return 404, None
+
+        measures = []
+        for metric in params.get('metricKeys', '').split(','):
+            measure = {'metric': metric, 'value': str(resource['id'])}
+            if 'periods' in params.get('additionalFields', ''):
+                measure['periods'] = [{'index': 1, 'value': '1.0'}]
+            measures.append(measure)
+        base = {'id': resource['id'], 'key': resource['key'], 'name': resource['name'],
+                'qualifier': resource['qualifier'], 'measures': measures}
+
+        # Note: projects have no modules
+        data = self._paging(params, [], 'components')
+        data['baseComponent'] = base
+        return 200, data
+
+    def _activate_rules(self, params):
+        succeeded = 0
+        for rule in self.rules:
+            if params.get('languages') and rule['lang'] not in params['languages'].split(','):
+                continue
+            if params.get('has_debt_characteristic') == 'false' and 'templateKey' not in rule:
+                continue
+            activation = {'severity': params.get('activation_severity') or rule['severity'],
+                          'params': []}
+            self.activations.setdefault(params['profile_key'], {})[rule['key']] = activation
+            succeeded += 1
+        return 200, {'succeeded': succeeded, 'failed': 0}
+
+    def _activate_rule(self, params):
+        rules = dict((r['key'], r) for r in self.rules)
+        if params.get('rule_key') not in rules:
+            return self._error('Rule {} not found'.format(params.get('rule_key')))
+        severity = params.get('severity')
+        if severity and severity not in self.SEVERITIES:
+            return self._error("Value of parameter 'severity' ({}) must be one of: "
+                               "[{}].".format(severity, ', '.join(self.SEVERITIES)))
+
+        # Note: defaults are used on reset or if not given
+        rule = rules[params['rule_key']]
+        activation = {'severity': severity or rule['severity'], 'params': []}
+        if params.get('reset') == 'true':
+            activation['severity'] = rule['severity']
+        elif params.get('params'):
+            activation['params'] = [dict(zip(('key', 'value'), p.split('=', 1)))
+                                    for p in params['params'].split(';')]
+        self.activations.setdefault(params['profile_key'], {})[params['rule_key']] = activation
+        return 204, None
+
+    def _create_rule(self, params):
+        template = params.get('template_key', '')
+        key = '{}:{}'.format(template.split(':')[0], params.get('custom_key'))
+        if any(r['key'] == key for r in self.rules):
+            return self._error('A rule with the key {} already exists'.format(key))
+
+        lang = template.split(':')[0]
+        rule = {
+            'key': key, 'repo': lang, 'lang': lang, 'langName': lang,
+            'name': params.get('name'), 'mdDesc': params.get('markdown_description'),
+            'htmlDesc': params.get('markdown_description'),
+            'severity': params.get('severity'), 'status': params.get('status'),
+            'isTemplate': False, 'tags': [], 'sysTags': [], 'templateKey': template,
+            'params': [dict(zip(('key', 'defaultValue'), p.split('=', 1)))
+                       for p in params.get('params', '').split(';') if p]
+        }
+        self.rules.append(rule)
+        return 200, {'rule': rule}
+
+    def _search_users(self, params):
+        users = list(self.users.values())
+        if params.get('logins'):
+            logins = params['logins'].split(',')
+            users = [u for u in users if u['login'] in logins]
+        if params.get('includeDeactivated') != 'True':
+            users = [u for u in users if u['active']]
+        if self._version < (5, 2):
+            return 200, {'users': users}
+        return 200, self._paging(dict({'ps': 50}, **params), users, 'users')
+
+    def _create_user(self, params):
+        if params.get('login') in self.users:
+            return self._error('An active user with login {} already exists'.format(params['login']))
+        return 200, {'user': self._add_user(params.get('login'), params.get('name'), params.get('email'))}
+
+    def _update_user(self, params):
+        user = self.users.get(params.get('login'))
+        if not user:
+            return 404, None
+        user.update((k, params[k]) for k in ('name', 'email') if k in params)
+        return 200, {'user': user}
+
+    def _deactivate_user(self, params):
+        user = self.users.get(params.get('login'))
+        if not user:
+            return 404, None
+        user['active'] = False
+        return 200, {'user': user}
+
+    def _search_groups(self, params):
+        groups = [self._public(g) for g in self.groups.values()
+                  if params.get('q', '') in g['name']]
+        return 200, {'groups': groups}
+
+    def _create_group(self, params):
+        if params.get('name') in self.groups:
+            return self._error('Group {} already exists'.format(params['name']))
+        group = self._add_group(params.get('name'), params.get('description'))
+        return 200, {'group': self._public(group)}
+
+    def _update_group(self, params):
+        group = self._find_group(params)
+        if not group:
+            return 404, None
+        if 'name' in params:
+            del self.groups[group['name']]
+            group['name'] = params['name']
+            self.groups[group['name']] = group
+        if 'description' in params:
+            group['description'] = params['description']
+        return 200, {'group': self._public(group)}
+
+    def _delete_group(self, params):
+        group = self._find_group(params)
+        if not group:
+            return 404, None
+        del self.groups[group['name']]
+        return 204, None
+
+    def _add_user_group(self, params):
+        group = self._find_group(params)
+        if not group or params.get('login') not in self.users:
+            return 404, None
+        group['members'].add(params['login'])
+        group['membersCount'] = len(group['members'])
+        return 204, None
+
+    def _remove_user_group(self, params):
+        group = self._find_group(params)
+        if not group:
+            return 404, None
+        group['members'].discard(params.get('login'))
+        group['membersCount'] = len(group['members'])
+        return 204, None
+
+    def _group_users(self, params):
+        group = self._find_group(params)
+        if not group:
+            return 404, None
+        users = [{'login': u['login'], 'name': u['name'], 'selected': True}
+                 for login, u in sorted(self.users.items()) if login in group['members']]
+        return 200, {'users': users}
+
+    ROUTES = {
+        SonarAPIHandler.AUTH_VALIDATION_ENDPOINT: _validate_auth,
+        SonarAPIHandler.SERVER_VERSION_ENDPOINT: _server_version,
+        SonarAPIHandler.WEBSERVICES_LIST_ENDPOINT: _webservices,
+        SonarAPIHandler.METRICS_LIST_ENDPOINT: _search_metrics,
+        SonarAPIHandler.RESOURCES_ENDPOINT: _resources,
+        SonarAPIHandler.COMPONENTS_SEARCH_ENDPOINT: _search_components,
+        SonarAPIHandler.ISSUES_SEARCH_ENDPOINT: _search_issues,
+        SonarAPIHandler.MEASURES_TREE_ENDPOINT: _measures_tree,
+        SonarAPIHandler.RULES_ACTIVATION_ENDPOINT: _activate_rule,
+        SonarAPIHandler.RULES_BULK_ACTIVATION_ENDPOINT: _activate_rules,
+        SonarAPIHandler.RULES_LIST_ENDPOINT: _search_rules,
+        SonarAPIHandler.RULES_CREATE_ENDPOINT: _create_rule,
+        SonarAPIHandler.USERS_LIST_ENDPOINT: _search_users,
+        SonarAPIHandler.USERS_CREATE_ENDPOINT: _create_user,
+        SonarAPIHandler.USERS_UPDATE_ENDPOINT: _update_user,
+        SonarAPIHandler.USERS_DEACTIVATE_ENDPOINT: _deactivate_user,
+        SonarAPIHandler.GROUPS_LIST_ENDPOINT: _search_groups,
+        SonarAPIHandler.GROUPS_CREATE_ENDPOINT: _create_group,
+        SonarAPIHandler.GROUPS_UPDATE_ENDPOINT: _update_group,
+        SonarAPIHandler.GROUPS_DELETE_ENDPOINT: _delete_group,
+        SonarAPIHandler.GROUPS_ADDUSER_ENDPOINT: _add_user_group,
+        SonarAPIHandler.GROUPS_REMOVEUSER_ENDPOINT: _remove_user_group,
+        SonarAPIHandler.GROUPS_USERS_ENDPOINT: _group_users,
+    }
+
+    # Versions adding and removing endpoints (None for any)
+    ENDPOINT_VERSIONS = {
+        SonarAPIHandler.WEBSERVICES_LIST_ENDPOINT: ((4, 2), None),
+        SonarAPIHandler.RESOURCES_ENDPOINT: (None, (6, 3)),
+        SonarAPIHandler.COMPONENTS_SEARCH_ENDPOINT: ((5, 2), None),
+        SonarAPIHandler.MEASURES_TREE_ENDPOINT: ((5, 4), None),
+        SonarAPIHandler.RULES_BULK_ACTIVATION_ENDPOINT: ((4, 4), None),
+    }
+
+
+def _build_request_handler(server):
+    """
+    Return the BaseHTTPRequestHandler class bound to a FakeSonarQube.
+    """
+    class RequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def _answer(self, method, body=''):
+            url = urlparse(self.path)
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            params.update((k, v[-1]) for k, v in parse_qs(body).items())
+
+            if server.latency:
+                time.sleep(server.latency)
+            status, data = server.dispatch(method, url.path, params)
+
+            # Note: plain text for strings (ie: server version)
+            content_type = 'application/json'
+            if isinstance(data, str):
+                payload = data.encode('utf-8')
+                content_type = 'text/plain'
+            else:
+                payload = json.dumps(data).encode('utf-8') if data is not None else b''
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self._answer('GET')
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length).decode('utf-8')
+            self._answer('POST', body)
+
+        def log_message(self, *args):
+            # Quiet, please
+            pass
+
+    return RequestHandler
@@ -0,0 +1,296 @@
+"""
+This module contains the events fired by the SonarAPIHandler hooks, a
+collector that aggregates them by endpoint exporting the results in the
+Prometheus text format, and a profiler used by the commands.
+"""
+import contextlib
+import math
+import threading
+import time
+
+
+class RequestEvent(object):
+    """
+    Data of a single call to the server, passed to the handler hooks.
+    """
+    def __init__(self, endpoint, method, status, request_bytes,
+                 response_bytes, elapsed, error=None):
+        """
+        :param endpoint: relative url of the call
+        :param method: http method in upper case
+        :param status: http status code (None if no response was received)
+        :param request_bytes: size of the encoded queryset or body
+        :param response_bytes: size of the response body
+        :param elapsed: wall time of the call in seconds
+        :param error: exception raised by the transport, if any
+        """
+        self.endpoint = endpoint
+        self.method = method
+        self.status = status
+        self.request_bytes = request_bytes
+        self.response_bytes = response_bytes
+        self.elapsed = elapsed
+        self.error = error
+
+    def __repr__(self):
+        return '<RequestEvent {} {} {} ({:.3f}s)>'.format(
+            self.method, self.endpoint, self.status, self.elapsed
+        )
+
+
+class DecodeEvent(object):
+    """
+    Data of the decoding of a response body, passed to the handler hooks.
+    """
+    def __init__(self, elapsed):
+        """
+        :param elapsed: wall time of the decoding in seconds
+        """
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        return '<DecodeEvent ({:.3f}s)>'.format(self.elapsed)
+
+
+class RequestStatsCollector(object):
+    """
+    Hook that keeps request counters and latency histograms by endpoint.
+
+    Usage::
+
+        stats = RequestStatsCollector()
+        h.add_hook(stats)
+        ...
+        print(stats.export_prometheus())
+    """
+    # Upper bounds of the latency histogram buckets (seconds)
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                       5.0, 10.0)
+
+    def __init__(self, buckets=None, prefix='sonarqube_api'):
+        """
+        :param buckets: iterable of histogram upper bounds in seconds
+        :param prefix: prefix for the exported metric names
+        """
+        self.buckets = tuple(sorted(buckets or self.DEFAULT_BUCKETS))
+        self.prefix = prefix
+        self._lock = threading.Lock()
+
+        # Counters by (endpoint, method, status)
+        self.requests = {}
+
+        # Latency histograms and byte counters by (endpoint, method)
+        self.latencies = {}
+        self.request_bytes = {}
+        self.response_bytes = {}
+
+    def __call__(self, event):
+        """
+        Record a request event (other kinds of events are ignored).
+
+        :param event: event fired by the handler
+        """
+        if not isinstance(event, RequestEvent):
+            return
+
+        key = event.endpoint, event.method
+        status = 'error' if event.status is None else str(event.status)
+        with self._lock:
+            counter = key + (status,)
+            self.requests[counter] = self.requests.get(counter, 0) + 1
+
+            # Histogram: a count for each bucket plus +Inf, then sum
+            histogram = self.latencies.setdefault(
+                key, {'buckets': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            )
+            index = len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if event.elapsed <= bound:
+                    index = i
+                    break
+            histogram['buckets'][index] += 1
+            histogram['sum'] += event.elapsed
+
+            self.request_bytes[key] = self.request_bytes.get(key, 0) + event.request_bytes
+            self.response_bytes[key] = self.response_bytes.get(key, 0) + event.response_bytes
+
+    def reset(self):
+        """
+        Clear all the collected data.
+        """
+        with self._lock:
+            self.requests.clear()
+            self.latencies.clear()
+            self.request_bytes.clear()
+            self.response_bytes.clear()
+
+    def export_prometheus(self):
+        """
+        Return the collected data in the Prometheus text exposition format.
+
+        :return: str
+        """
+        name = self.prefix + '_{}'
+        lines = []
+        with self._lock:
+            # Request counters
+            lines.extend(self._header(name.format('requests_total'), 'counter',
+                                      'Calls made to the SonarQube server.'))
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append('{}{} {}'.format(
+                    name.format('requests_total'),
+                    self._labels(endpoint=endpoint, method=method, status=status),
+                    count
+                ))
+
+            # Latency histograms (buckets are cumulative)
+            metric = name.format('request_duration_seconds')
+            lines.extend(self._header(metric, 'histogram',
+                                      'Wall time of the calls to the SonarQube server.'))
+            for (endpoint, method), histogram in sorted(self.latencies.items()):
+                cumulative = 0
+                bounds = ['{!r}'.format(float(b)) for b in self.buckets] + ['+Inf']
+                for bound, count in zip(bounds, histogram['buckets']):
+                    cumulative += count
+                    lines.append('{}_bucket{} {}'.format(metric, self._labels(
+                        endpoint=endpoint, method=method, le=bound
+                    ), cumulative))
+                labels = self._labels(endpoint=endpoint, method=method)
+                lines.append('{}_sum{} {!r}'.format(metric, labels, histogram['sum']))
+                lines.append('{}_count{} {}'.format(metric, labels, cumulative))
+
+            # Transferred bytes
+            for suffix, data, desc in (
+                    ('request_bytes_total', self.request_bytes, 'Bytes sent to'),
+                    ('response_bytes_total', self.response_bytes, 'Bytes received from')):
+                lines.extend(self._header(name.format(suffix), 'counter',
+                                          '{} the SonarQube server.'.format(desc)))
+                for (endpoint, method), size in sorted(data.items()):
+                    lines.append('{}{} {}'.format(
+                        name.format(suffix),
+                        self._labels(endpoint=endpoint, method=method), size
+                    ))
+
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _header(metric, kind, description):
+        return ['# HELP {} {}'.format(metric, description),
+                '# TYPE {} {}'.format(metric, kind)]
+
+    @staticmethod
+    def _labels(**labels):
+        # Note: sort labels and escape values as required by the format
+        return '{' + ','.join('{}="{}"'.format(
+            k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        ) for k, v in sorted(labels.items())) + '}'
+
+
+class Profiler(object):
+    """
+    Hook that keeps the latencies of every call and the time spent decoding
+    responses, plus the time of local sections and processed items reported
+    by the caller, to build a latency breakdown report.
+
+    Usage::
+
+        profiler = Profiler()
+        h.add_hook(profiler)
+        for rule in h.get_rules():
+            with profiler.timer('formatting'):
+                ...
+            profiler.count()
+        sys.stderr.write(profiler.report())
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.start = time.time()
+        self.items = 0
+
+        # Latency samples by endpoint and time by section
+        self.latencies = {}
+        self.sections = {'network': 0.0, 'decoding': 0.0}
+
+    def __call__(self, event):
+        """
+        Record a request or decode event.
+
+        :param event: event fired by the handler
+        """
+        with self._lock:
+            if isinstance(event, RequestEvent):
+                self.latencies.setdefault(event.endpoint, []).append(event.elapsed)
+                self.sections['network'] += event.elapsed
+            elif isinstance(event, DecodeEvent):
+                self.sections['decoding'] += event.elapsed
+
+    @contextlib.contextmanager
+    def timer(self, section):
+        """
+        Context manager that adds its wall time to the given section.
+
+        :param section: name of the section (ie: formatting)
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start
+            with self._lock:
+                self.sections[section] = self.sections.get(section, 0.0) + elapsed
+
+    def count(self, items=1):
+        """
+        Add processed items, used to compute the throughput.
+
+        :param items: number of items
+        """
+        with self._lock:
+            self.items += items
+
+    @staticmethod
+    def percentile(samples, pct):
+        """
+        Return the percentile of the samples (nearest rank).
+
+        :param samples: sorted list of values
+        :param pct: percentile as a number from 0 to 100
+        :return: value
+        """
+        if not samples:
+            return 0.0
+        rank = int(math.ceil(pct / 100.0 * len(samples))) - 1
+        return samples[min(max(rank, 0), len(samples) - 1)]
+
+    def report(self):
+        """
+        Return the profile report as text.
+
+        :return: str
+        """
+        total = time.time() - self.start
+        lines = ['Profile report',
+                 '{:<40} {:>8} {:>10} {:>10} {:>10}'.format(
+                     'Endpoint', 'Calls', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)')]
+        with self._lock:
+            for endpoint, samples in sorted(self.latencies.items()):
+                samples = sorted(samples)
+                lines.append('{:<40} {:>8} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+                    endpoint, len(samples),
+                    *(1000 * self.percentile(samples, p) for p in (50, 95, 99))
+                ))
+
+            # Time breakdown, rest of the time goes to "other"
+            names = ['network', 'decoding'] + sorted(
+                set(self.sections) - {'network', 'decoding'})
+            sections = [(name, self.sections[name]) for name in names]
+            sections.append(('other', max(total - sum(t for _, t in sections), 0.0)))
+            lines.append('Time: {:.3f}s total, {}'.format(total, ', '.join(
+                '{} {:.3f}s ({:.0%})'.format(name, t, t / total if total else 0)
+                for name, t in sections
+            )))
+            lines.append('Throughput: {} items in {:.3f}s ({:.1f} items/s)'.format(
+                self.items, total, self.items / total if total else 0
+            ))
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,311 @@
+"""
+This module contains the scan of issues used by SonarAPIHandler.get_issues,
+and the writers streaming them to JSONL and CSV files.
+
+The issues search can only page through its first results (see
+SonarAPIHandler.ISSUES_LIMIT). Larger searches are split into slices by
+creation date, halving the range until every slice is under the limit, and
+by severity when too many issues were created at once (ie: in the first
+analysis of a project). Slices can be scanned by several threads.
+
+Usage::
+
+    with open('issues.jsonl', 'w') as f:
+        write_jsonl(h.get_issues(projects='my:project', max_workers=4), f)
+"""
+import collections
+import csv
+import datetime
+import json
+import re
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .deadline import deadline, remaining
+from .exceptions import ValidationError
+from .utils import put_until, utf_encode
+
+
+# Date format of the issues search params (UTC)
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S+0000'
+_DATE_RE = re.compile(r'^(\d{4}-\d{2}-\d{2})(?:T(\d{2}:\d{2}:\d{2})([+-]\d{2}):?(\d{2}))?$')
+
+# Severities, to split slices of issues created at once
+SEVERITIES = ('INFO', 'MINOR', 'MAJOR', 'CRITICAL', 'BLOCKER')
+
+# Columns of the CSV export
+CSV_FIELDS = (
+    'key', 'rule', 'severity', 'type', 'status', 'resolution', 'project',
+    'component', 'line', 'message', 'effort', 'author', 'assignee', 'tags',
+    'creationDate', 'updateDate',
+)
+
+# Creation date range of a slice, [after, before) (None if unbounded),
+# and its severities (None for the filter of the search)
+IssuesSlice = collections.namedtuple('IssuesSlice', ('after', 'before', 'severities'))
+
+# End of the issues of a concurrent scan
+_END = object()
+
+
+def parse_date(value):
+    """
+    Parse a date of the issues API (ie: "2017-10-19" or
+    "2017-10-19T13:00:00+0200") as a naive UTC datetime.
+
+    :param value: str or datetime (naive ones are taken as UTC)
+    :return: datetime
+    :raises ValueError: if the format is invalid
+    """
+    if isinstance(value, datetime.datetime):
+        if value.utcoffset() is not None:
+            value = value.replace(tzinfo=None) - value.utcoffset()
+        return value
+    elif isinstance(value, datetime.date):
+        return datetime.datetime(value.year, value.month, value.day)
+
+    match = _DATE_RE.match(value.strip())
+    if not match:
+        raise ValueError('Invalid date: {}'.format(value))
+    day, hour, offset_hours, offset_minutes = match.groups()
+    date = datetime.datetime.strptime('{}T{}'.format(day, hour or '00:00:00'), '%Y-%m-%dT%H:%M:%S')
+    if offset_hours:
+        # Note: strptime has no %z in Python 2
+        sign = -1 if offset_hours.startswith('-') else 1
+        date -= sign * datetime.timedelta(hours=abs(int(offset_hours)), minutes=int(offset_minutes))
+    return date
+
+
+def format_date(date):
+    """
+    Format a naive UTC datetime for the issues search params.
+
+    :param date: datetime
+    :return: str
+    """
+    return date.strftime(DATE_FORMAT)
+
+
+class IssuesScan(object):
+    """
+    Scan of the issues matching a search, split in slices under the limit
+    of results of the server.
+    """
+    def __init__(self, handler, qs, after=None, before=None, page_size=None,
+                 max_workers=1):
+        """
+        :param handler: SonarAPIHandler instance
+        :param qs: queryset of the issues search (filters)
+        :param after: scan issues created from this datetime (inclusive)
+        :param before: scan issues created until this datetime (exclusive)
+        :param page_size: number of issues per page (the largest if None)
+        :param max_workers: slices scanned at once (1 to scan them in order
+            of creation date)
+        """
+        self.handler = handler
+        self.qs = qs
+        self.start = IssuesSlice(after, before, None)
+        self.limit = handler.ISSUES_LIMIT
+        self.page_size = min(page_size or handler.MAX_PAGE_SIZE, self.limit)
+        self.max_workers = max_workers
+        # Note: the last page must end within the limit
+        self.reachable = self.limit // self.page_size * self.page_size
+
+    def __iter__(self):
+        if self.max_workers > 1:
+            return self._scan_concurrently()
+        return self._scan()
+
+    def _fetch(self, issues_slice, page=1, page_size=None, **options):
+        """
+        Fetch a page of the issues of a slice.
+
+        :return: decoded page
+        """
+        qs = dict(self.qs, p=page, ps=page_size or self.page_size, **options)
+        if issues_slice.after:
+            qs['createdAfter'] = format_date(issues_slice.after)
+        if issues_slice.before:
+            qs['createdBefore'] = format_date(issues_slice.before)
+        if issues_slice.severities:
+            qs['severities'] = ','.join(issues_slice.severities)
+        return self.handler.decode(self.handler._make_call(
+            'get', self.handler.ISSUES_SEARCH_ENDPOINT, **qs))
+
+    @staticmethod
+    def _total(res):
+        # Note: older versions only have the total in the page
+        return res['paging']['total'] if 'paging' in res else res['total']
+
+    def _split(self, issues_slice):
+        """
+        Split a slice in two halves of its creation date range, or by
+        severity if it's a single second.
+
+        :param issues_slice: IssuesSlice
+        :return: list of IssuesSlice
+        :raises ValidationError: if the slice can't be split
+        """
+        after, before = issues_slice.after, issues_slice.before
+        if after is None:
+            # Bound the range from the first issue created
+            first = self._fetch(issues_slice, page_size=1, s='CREATION_DATE', asc='true')
+            after = parse_date(first['issues'][0]['creationDate'])
+        if before is None:
+            # Note: dates have no microseconds
+            before = datetime.datetime.utcnow().replace(microsecond=0) + datetime.timedelta(seconds=1)
+
+        seconds = int((before - after).total_seconds())
+        if seconds > 1:
+            middle = after + datetime.timedelta(seconds=seconds // 2)
+            return [issues_slice._replace(after=after, before=middle),
+                    issues_slice._replace(after=middle, before=before)]
+
+        severities = issues_slice.severities or \
+            (self.qs['severities'].split(',') if self.qs.get('severities') else SEVERITIES)
+        if len(severities) > 1:
+            return [issues_slice._replace(after=after, before=before, severities=(severity,))
+                    for severity in severities]
+
+        raise ValidationError('More than {} issues created at {} with severity {}, '
+                              'add filters to scan them'.format(
+                                  self.limit, format_date(after), severities[0]))
+
+    def _scan_slice(self, issues_slice):
+        """
+        Scan a slice, or split it if its last issues are over the limit.
+
+        :param issues_slice: IssuesSlice
+        :return: generator that yields pages of issues (lists), or list of
+            slices if it must be split
+        """
+        res = self._fetch(issues_slice)
+        total = self._total(res)
+        if total > self.reachable:
+            return self._split(issues_slice)
+
+        def pages():
+            yield res['issues']
+            pages_count = (total + self.page_size - 1) // self.page_size
+            for page in range(2, pages_count + 1):
+                yield self._fetch(issues_slice, page)['issues']
+
+        return pages()
+
+    def _scan(self):
+        """
+        Yield the issues, scanning the slices in order of creation date.
+        """
+        pending = collections.deque([self.start])
+        while pending:
+            result = self._scan_slice(pending.popleft())
+            if isinstance(result, list):
+                pending.extendleft(reversed(result))
+                continue
+            for page in result:
+                for issue in page:
+                    yield issue
+
+    def _scan_concurrently(self):
+        """
+        Yield the issues as they arrive, scanning the slices in a pool of
+        threads. Closing the generator stops the scan, and the deadline of
+        the calling thread (if any) applies to it.
+        """
+        results = queue.Queue(self.max_workers * 2)
+        stop = threading.Event()
+        left = remaining()
+        expires = None if left is None else time.time() + left
+        lock = threading.Lock()
+        pending = [0]
+        executor = ThreadPoolExecutor(self.max_workers)
+
+        def submit(issues_slice):
+            # Note: counted before the slice submitting it is done
+            with lock:
+                pending[0] += 1
+            executor.submit(work, issues_slice)
+
+        def work(issues_slice):
+            try:
+                if stop.is_set():
+                    return
+                with deadline(None if expires is None else expires - time.time()):
+                    result = self._scan_slice(issues_slice)
+                    if isinstance(result, list):
+                        for sub_slice in result:
+                            submit(sub_slice)
+                    else:
+                        for page in result:
+                            if not put_until(results, (page, None), stop):
+                                break
+
+            except Exception as exc:
+                put_until(results, (None, exc), stop)
+
+            finally:
+                with lock:
+                    pending[0] -= 1
+                    done = not pending[0]
+                if done:
+                    put_until(results, (_END, None), stop)
+
+        submit(self.start)
+        try:
+            while True:
+                page, exc = results.get()
+                if exc is not None:
+                    raise exc
+                if page is _END:
+                    return
+                for issue in page:
+                    yield issue
+        finally:
+            stop.set()
+            executor.shutdown(wait=False)
+
+
+def write_jsonl(issues, f):
+    """
+    Write issues to a file as they come, one JSON object per line.
+
+    :param issues: iterable of issue data dicts
+    :param f: file opened for writing
+    :return: number of issues written
+    """
+    count = 0
+    for count, issue in enumerate(issues, 1):
+        f.write(json.dumps(issue, sort_keys=True))
+        f.write('\n')
+    return count
+
+
+def write_csv(issues, f, fields=CSV_FIELDS):
+    """
+    Write issues to a CSV file as they come, with a header. Lists (ie:
+    tags) are joined by semicolons.
+
+    :param issues: iterable of issue data dicts
+    :param f: file opened for writing
+    :param fields: issue fields, one by column
+    :return: number of issues written
+    """
+    writer = csv.writer(f)
+    writer.writerow(fields)
+    count = 0
+    for count, issue in enumerate(issues, 1):
+        row = []
+        for field in fields:
+            value = issue.get(field, u'')
+            if isinstance(value, list):
+                value = u';'.join(value)
+            row.append(utf_encode(value) if isinstance(value, type(u'')) else value)
+        writer.writerow(row)
+    return count
@@ -0,0 +1,164 @@
+"""
+This module contains the SonarAPIPool, used for running the same call on
+several SonarQube servers at once.
+
+Usage::
+
+    pool = SonarAPIPool({
+        'eu': {'host': 'https://sonar-eu.example.com', 'token': '...'},
+        'us': SonarAPIHandler(host='https://sonar-us.example.com', token='...'),
+    })
+    for server, rule, error in pool.call('get_rules', active_only=True):
+        ...
+"""
+import collections
+import inspect
+import threading
+import time
+import types
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .api import SonarAPIHandler
+from .deadline import deadline, remaining
+
+
+# Result of a call in a server: value (or item, for generators) or error
+PoolResult = collections.namedtuple('PoolResult', ('server', 'value', 'error'))
+
+# End of the results of a server
+_DONE = object()
+
+
+class SonarAPIPool(object):
+    """
+    Pool of handlers for several SonarQube servers, running calls on all of
+    them concurrently. Failures are isolated by server.
+    """
+    # Results waiting to be consumed, before blocking the servers
+    QUEUE_SIZE = 1000
+
+    def __init__(self, handlers, max_workers=None):
+        """
+        :param handlers: dict of SonarAPIHandler instances (or their kwargs)
+            by server name, or iterable of handlers (named by their url)
+        :param max_workers: servers called at once (all by default)
+        """
+        if not isinstance(handlers, dict):
+            handlers = {h._get_url(''): h for h in handlers}
+        self.handlers = collections.OrderedDict(
+            (name, h if isinstance(h, SonarAPIHandler) else SonarAPIHandler(**h))
+            for name, h in sorted(handlers.items())
+        )
+        self._executor = ThreadPoolExecutor(max_workers or len(self.handlers) or 1)
+
+    def call(self, method, *args, **kwargs):
+        """
+        Run a handler method in all the servers, yielding results as they
+        arrive. Generator methods (ie: get_rules) yield a result for each
+        item, others a single result with the returned value. A failed
+        server yields a result with the exception, and no more.
+
+        Closing the generator early stops the pending calls. The deadline
+        of the calling thread (if any) applies to all the servers.
+
+        :param method: name of the SonarAPIHandler method
+        :param args: positional arguments of the method
+        :param kwargs: keyword arguments of the method
+        :return: generator that yields PoolResult tuples
+        """
+        results = queue.Queue(self.QUEUE_SIZE)
+        stop = threading.Event()
+        left = remaining()
+        expires = None if left is None else time.time() + left
+        for name, handler in self.handlers.items():
+            self._executor.submit(self._run, name, getattr(handler, method),
+                                  args, kwargs, expires, results, stop)
+
+        # Yield until all servers are done
+        pending = len(self.handlers)
+        try:
+            while pending:
+                result = results.get()
+                if result is _DONE:
+                    pending -= 1
+                else:
+                    yield result
+        finally:
+            stop.set()
+
+    def gather(self, method, *args, **kwargs):
+        """
+        Run a handler method in all the servers and wait for the results.
+        Items of generator methods are collected in lists.
+
+        :param method: name of the SonarAPIHandler method
+        :param args: positional arguments of the method
+        :param kwargs: keyword arguments of the method
+        :return: dict of PoolResult tuples by server name
+        """
+        many = inspect.isgeneratorfunction(getattr(SonarAPIHandler, method))
+        gathered = {name: PoolResult(name, [] if many else None, None)
+                    for name in self.handlers}
+        for result in self.call(method, *args, **kwargs):
+            if result.error is not None:
+                gathered[result.server] = result
+            elif many:
+                gathered[result.server].value.append(result.value)
+            else:
+                gathered[result.server] = result
+
+        return gathered
+
+    @staticmethod
+    def _put(results, result, stop):
+        # Note: give up if the consumer is gone
+        while not stop.is_set():
+            try:
+                results.put(result, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self, server, func, args, kwargs, expires, results, stop):
+        """
+        Run a call in a server and put its results in the queue.
+        """
+        if stop.is_set():
+            # Consumer gone before starting
+            return
+
+        try:
+            with deadline(None if expires is None else expires - time.time()):
+                value = func(*args, **kwargs)
+                if isinstance(value, types.GeneratorType):
+                    for item in value:
+                        if not self._put(results, PoolResult(server, item, None), stop):
+                            value.close()
+                            break
+                else:
+                    self._put(results, PoolResult(server, value, None), stop)
+
+        except Exception as exc:
+            self._put(results, PoolResult(server, None, exc), stop)
+
+        finally:
+            self._put(results, _DONE, stop)
+
+    def close(self):
+        """
+        Wait for the running calls and release the workers.
+        """
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,377 @@
+"""
+This module contains the local indexes of rules, used to query them offline:
+
+* RuleSearchIndex, an SQLite full-text index, to search them by key, name,
+  tags and description. It uses FTS5 when the SQLite library supports it,
+  FTS4 otherwise.
+* RuleIndex, an in-memory index answering the filters of get_rules.
+
+Usage::
+
+    index = RuleSearchIndex('rules.db')
+    index.build(h.get_rules())
+    for rule in index.search('xpath injection', languages='java'):
+        ...
+"""
+import itertools
+import json
+import re
+import sqlite3
+import time
+
+from .exceptions import ValidationError
+
+try:
+    from html import unescape
+except ImportError:
+    from HTMLParser import HTMLParser
+    unescape = HTMLParser().unescape
+
+
+# HTML tags and whitespace runs, removed from descriptions
+_TAGS_RE = re.compile(r'<[^>]*>')
+_SPACES_RE = re.compile(r'\s+')
+
+
+def html_text(html):
+    """
+    Return the text of an HTML fragment, without tags or entities.
+
+    :param html: str
+    :return: str
+    """
+    text = unescape(_TAGS_RE.sub(u' ', html or u''))
+    return _SPACES_RE.sub(u' ', text).strip()
+
+
+class RuleSearchIndex(object):
+    """
+    Full-text index of rules in an SQLite database. Rules are stored as
+    returned by the server, and searches return them the same way.
+    """
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)',
+        'CREATE TABLE IF NOT EXISTS rules ('
+        'id INTEGER PRIMARY KEY, key TEXT UNIQUE, lang TEXT, severity TEXT, data TEXT)',
+        'CREATE INDEX IF NOT EXISTS rules_lang ON rules (lang, severity)',
+    )
+    FTS_COLUMNS = ('key', 'name', 'tags', 'description')
+
+    def __init__(self, path=':memory:'):
+        """
+        :param path: database file name (in memory by default)
+        """
+        self.path = path
+        self._db = sqlite3.connect(path)
+        for statement in self.SCHEMA:
+            self._db.execute(statement)
+        self.fts = self._create_fts()
+        self._db.commit()
+
+    def _create_fts(self):
+        """
+        Create the full-text table if needed, using the best FTS version.
+
+        :return: FTS version in use, 'fts5' or 'fts4'
+        """
+        row = self._db.execute("SELECT sql FROM sqlite_master "
+                               "WHERE name = 'rules_fts'").fetchone()
+        if row:
+            return 'fts5' if 'fts5' in row[0].lower() else 'fts4'
+
+        columns = ', '.join(self.FTS_COLUMNS)
+        try:
+            self._db.execute('CREATE VIRTUAL TABLE rules_fts USING fts5({})'.format(columns))
+            return 'fts5'
+        except sqlite3.OperationalError:
+            # Note: fts5 is missing in older SQLite builds
+            self._db.execute('CREATE VIRTUAL TABLE rules_fts USING fts4({})'.format(columns))
+            return 'fts4'
+
+    def build(self, rules):
+        """
+        Replace the indexed rules, in a single transaction: searches see the
+        previous rules until it's done.
+
+        :param rules: iterable of rule data dicts (ie: from get_rules)
+        :return: number of rules indexed
+        """
+        count = 0
+        with self._db:
+            self._db.execute('DELETE FROM rules')
+            self._db.execute('DELETE FROM rules_fts')
+            for count, rule in enumerate(rules, 1):
+                cursor = self._db.execute(
+                    'INSERT OR REPLACE INTO rules (key, lang, severity, data) VALUES (?, ?, ?, ?)',
+                    (rule['key'], rule.get('lang'), rule.get('severity'), json.dumps(rule))
+                )
+                tags = rule.get('tags', []) + rule.get('sysTags', [])
+                description = html_text(rule['htmlDesc']) if rule.get('htmlDesc') \
+                    else rule.get('mdDesc', u'')
+                self._db.execute(
+                    'INSERT INTO rules_fts (rowid, key, name, tags, description) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (cursor.lastrowid, rule['key'], rule.get('name', u''),
+                     u' '.join(tags), description)
+                )
+            self._db.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)', (
+                ('built_at', str(time.time())), ('count', str(count))
+            ))
+        return count
+
+    def info(self):
+        """
+        Return the index metadata: rules count and build time (None if it
+        wasn't built yet).
+
+        :return: dict
+        """
+        meta = dict(self._db.execute('SELECT name, value FROM meta'))
+        return {
+            'fts': self.fts,
+            'count': int(meta.get('count', 0)),
+            'built_at': float(meta['built_at']) if 'built_at' in meta else None,
+        }
+
+    def query(self, text):
+        """
+        Build a full-text query matching all the words in a text (words
+        ending with * match as prefixes).
+
+        :param text: str
+        :return: FTS query str
+        """
+        terms = []
+        for word in text.split():
+            prefix = word.endswith('*')
+            word = u'"{}"'.format(word.rstrip('*').replace('"', '""'))
+            if prefix:
+                word = word + '*' if self.fts == 'fts5' else word[:-1] + '*"'
+            terms.append(word)
+        return u' '.join(terms)
+
+    def search(self, text, languages=None, severities=None, limit=50, raw=False):
+        """
+        Search rules, best matches first (by key if ranking isn't available).
+
+        :param text: words to search in keys, names, tags and descriptions
+        :param languages: key of languages to filter rules
+        :param severities: severities to filter rules
+        :param limit: maximum number of rules (None for all)
+        :param raw: use the text as a full-text query, with SQLite's syntax
+        :return: list of rule data dicts
+        :raises ValidationError: if the query is invalid
+        """
+        sql = 'SELECT r.data FROM rules_fts JOIN rules r ON r.id = rules_fts.rowid ' \
+              'WHERE rules_fts MATCH ?'
+        params = [text if raw else self.query(text)]
+
+        # Add filters
+        # Note: we handle comma-separated string or list-like iterable
+        for column, values in (('lang', languages), ('severity', severities)):
+            if values:
+                if isinstance(values, str):
+                    values = values.split(',')
+                values = [v.strip() for v in values]
+                if column == 'lang':
+                    values = [v.lower() for v in values]
+                else:
+                    values = [v.upper() for v in values]
+                sql += ' AND r.{} IN ({})'.format(column, ', '.join('?' * len(values)))
+                params.extend(values)
+
+        sql += ' ORDER BY bm25(rules_fts)' if self.fts == 'fts5' else ' ORDER BY r.key'
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+
+        try:
+            return [json.loads(data) for data, in self._db.execute(sql, params)]
+        except sqlite3.OperationalError as exc:
+            # Note: syntax errors of the query are only found when it runs
+            raise ValidationError('Invalid search query {!r}: {}'.format(params[0], exc))
+
+    def get(self, key):
+        """
+        Return an indexed rule by key.
+
+        :param key: rule key
+        :return: rule data dict, or None if it's not indexed
+        """
+        row = self._db.execute('SELECT data FROM rules WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RuleIndex(object):
+    """
+    In-memory index of rules, answering the filters of
+    SonarAPIHandler.get_rules without calling the server.
+
+    Keys are indexed by language, severity, activation (by profile) and
+    custom/template flags, so queries are set intersections.
+
+    Usage::
+
+        index = RuleIndex.from_handler(h)
+        for rule in index.get_rules(profile='py-test-18349', custom_only=True):
+            ...
+    """
+    def __init__(self, rules=()):
+        """
+        :param rules: iterable of rule data dicts, with their activations
+            under "actives" (ie: from get_rules with include_actives)
+        """
+        self.rules = {}
+        self._positions = {}
+        self._added = itertools.count()
+        self.by_language = {}
+        self.by_severity = {}
+        self.by_profile = {}
+        self.active = set()
+        self.custom = set()
+        self.templates = set()
+        self.ready = set()
+        self._cache = {}
+        for rule in rules:
+            self.add(rule)
+
+    @classmethod
+    def from_handler(cls, h, languages=None, page_size=None):
+        """
+        Build the index from a scan of the server rules, with their
+        activations in all profiles.
+
+        :param h: SonarAPIHandler instance
+        :param languages: key of languages to filter rules
+        :param page_size: number of rules per page (server default if None)
+        :return: RuleIndex instance
+        """
+        return cls(h.get_rules(languages=languages, page_size=page_size,
+                               include_actives=True))
+
+    def add(self, rule):
+        """
+        Add a rule to the index, replacing the previous one with its key.
+
+        :param rule: rule data dict
+        """
+        key = rule['key']
+        if key in self.rules:
+            self.remove(key)
+        self.rules[key] = rule
+        self._positions[key] = next(self._added)
+        self._cache.clear()
+
+        self.by_language.setdefault(rule.get('lang'), set()).add(key)
+        self.by_severity.setdefault(rule.get('severity'), set()).add(key)
+        for active in rule.get('actives', []):
+            self.by_profile.setdefault(active['qProfile'], set()).add(key)
+            self.active.add(key)
+        # Note: custom rules are created from templates (and have no debt)
+        if rule.get('templateKey'):
+            self.custom.add(key)
+        if rule.get('isTemplate'):
+            self.templates.add(key)
+        if rule.get('status', 'READY') == 'READY':
+            self.ready.add(key)
+
+    def remove(self, key):
+        """
+        Remove a rule from the index.
+
+        :param key: rule key
+        :raises KeyError: if the rule is not indexed
+        """
+        del self.rules[key]
+        del self._positions[key]
+        self._cache.clear()
+        for index in (self.by_language, self.by_severity, self.by_profile):
+            for keys in index.values():
+                keys.discard(key)
+        for keys in (self.active, self.custom, self.templates, self.ready):
+            keys.discard(key)
+
+    def keys(self, active_only=False, profile=None, languages=None,
+             custom_only=False, severities=None):
+        """
+        Return the keys of the rules in status ready, that are not template
+        rules, matching the filters (the same of get_rules).
+
+        :param active_only: filter only active rules
+        :param profile: key of profile to filter rules
+        :param languages: key of languages to filter rules
+        :param custom_only: filter only custom rules
+        :param severities: severities to filter rules
+        :return: frozenset of rule keys
+        """
+        # Note: we handle comma-separated string or list-like iterable
+        if languages and isinstance(languages, str):
+            languages = languages.split(',')
+        if severities and isinstance(severities, str):
+            severities = severities.split(',')
+        query = (
+            bool(active_only), profile or None,
+            frozenset(l.strip().lower() for l in languages) if languages else None,
+            bool(custom_only),
+            frozenset(s.strip().upper() for s in severities) if severities else None,
+        )
+        if query in self._cache:
+            return self._cache[query]
+
+        # Sets to intersect, excluding the template rules
+        sets = [self.ready]
+        if profile:
+            sets.append(self.by_profile.get(profile, set()))
+        elif active_only:
+            sets.append(self.active)
+        if custom_only:
+            sets.append(self.custom)
+        for index, values in ((self.by_language, query[2]), (self.by_severity, query[4])):
+            if values is not None:
+                sets.append(set().union(*(index.get(v, set()) for v in values)))
+
+        # Intersect from the smallest set
+        sets.sort(key=len)
+        keys = frozenset(sets[0].intersection(*sets[1:]).difference(self.templates))
+        self._cache[query] = keys
+        return keys
+
+    def get_rules(self, active_only=False, profile=None, languages=None,
+                  custom_only=False, severities=None):
+        """
+        Yield the rules matching the filters, in the order they were added.
+
+        :param active_only: filter only active rules
+        :param profile: key of profile to filter rules
+        :param languages: key of languages to filter rules
+        :param custom_only: filter only custom rules
+        :param severities: severities to filter rules
+        :return: generator that yields rule data dicts
+        """
+        keys = self.keys(active_only, profile, languages, custom_only, severities)
+        for key in sorted(keys, key=self._positions.__getitem__):
+            yield self.rules[key]
+
+    def get(self, key):
+        """
+        Return an indexed rule by key.
+
+        :param key: rule key
+        :return: rule data dict, or None if it's not indexed
+        """
+        return self.rules.get(key)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def __contains__(self, key):
+        return key in self.rules
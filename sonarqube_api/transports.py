@@ -0,0 +1,281 @@
+"""
+This module contains the transports used by SonarAPIHandler to make the calls
+to the server: the default one (using requests), an HTTP/2 one (using httpx,
+optional), and the recording and replay transports, used to run realistic
+workloads offline and reproducibly.
+
+Usage::
+
+    # Record the interactions with a live server
+    with RecordingTransport('rules.jsonl') as transport:
+        h = SonarAPIHandler(host='http://sonar.example.com', transport=transport)
+        rules = list(h.get_rules())
+
+    # Replay them later, without server, simulating the recorded latency
+    h = SonarAPIHandler(transport=ReplayTransport('rules.jsonl', recorded_latency=True))
+    rules = list(h.get_rules())
+"""
+import json
+import threading
+import time
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+from .exceptions import ReplayError
+
+
+class RequestsTransport(object):
+    """
+    Default transport, making the calls with the handler's requests session.
+    """
+    def request(self, session, method, url, data, timeout=None):
+        """
+        Make a call to the server.
+
+        :param session: requests session of the handler (with auth)
+        :param method: http method (get or post)
+        :param url: complete url of the call
+        :param data: queryset or body as dict
+        :param timeout: seconds or (connect, read) tuple (None to wait forever)
+        :return: response
+        """
+        options = {'timeout': timeout} if timeout is not None else {}
+        if method.lower() == 'get':
+            return session.get(url, params=data or {}, **options)
+        else:
+            return session.post(url, data=data or {}, **options)
+
+
+class HttpxResponse(object):
+    """
+    Response of the httpx transport, with the same interface as the requests
+    responses used by the handler.
+    """
+    def __init__(self, res):
+        self.url = str(res.url)
+        self.status_code = res.status_code
+        self.reason = res.reason_phrase
+        self.content = res.content
+        self.http_version = res.http_version
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class HttpxTransport(object):
+    """
+    Transport making the calls with an httpx client, which can multiplex
+    concurrent calls over a single HTTP/2 connection (the server, or the
+    proxy in front of it, must support HTTP/2; otherwise HTTP/1.1 is used).
+
+    Requires the optional dependencies: pip install sonarqube_api[http2]
+    """
+    def __init__(self, http2=True, max_connections=10, **options):
+        """
+        :param http2: enable HTTP/2 (negotiated with the server over TLS)
+        :param max_connections: maximum number of open connections
+        :param options: other arguments for httpx.Client (ie: verify, http1)
+        """
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError('HttpxTransport requires httpx, install it with: '
+                              'pip install sonarqube_api[http2]')
+
+        # Note: follow redirects and wait indefinitely, as requests does
+        options.setdefault('follow_redirects', True)
+        options.setdefault('timeout', None)
+        self._httpx = httpx
+        self._arguments = http2, max_connections, options
+        self.client = httpx.Client(
+            http2=http2, limits=httpx.Limits(max_connections=max_connections),
+            **options
+        )
+
+    def __getstate__(self):
+        # Note: the client (and its connections) can't be pickled
+        return self._arguments
+
+    def __setstate__(self, state):
+        http2, max_connections, options = state
+        self.__init__(http2, max_connections, **options)
+
+    def request(self, session, method, url, data, timeout=None):
+        """
+        Make a call to the server (only the auth of the session is used).
+
+        :param session: requests session of the handler (with auth)
+        :param method: http method (get or post)
+        :param url: complete url of the call
+        :param data: queryset or body as dict
+        :param timeout: seconds or (connect, read) tuple (None to wait forever)
+        :return: response
+        """
+        options = {'auth': session.auth}
+        if isinstance(timeout, tuple):
+            options['timeout'] = self._httpx.Timeout(None, connect=timeout[0], read=timeout[1])
+        elif timeout is not None:
+            options['timeout'] = timeout
+
+        if method.lower() == 'get':
+            res = self.client.get(url, params=data or {}, **options)
+        else:
+            res = self.client.post(url, data=data or {}, **options)
+        return HttpxResponse(res)
+
+    def close(self):
+        """
+        Close the connections of the client.
+        """
+        self.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ReplayResponse(object):
+    """
+    Response replayed from a cassette, with the same interface as the
+    requests responses used by the handler.
+    """
+    def __init__(self, url, status_code, reason, content):
+        self.url = url
+        self.status_code = status_code
+        self.reason = reason
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def _interaction_key(method, url, data):
+    # Note: host and port are ignored, so cassettes can be replayed anywhere
+    params = sorted((str(k), str(v)) for k, v in (data or {}).items())
+    return method.upper(), urlparse(url).path, json.dumps(params)
+
+
+class RecordingTransport(object):
+    """
+    Transport that makes the calls with another transport and records the
+    request/response pairs in a cassette file, one JSON object per line.
+    """
+    def __init__(self, path, transport=None):
+        """
+        :param path: cassette file to write (overwritten)
+        :param transport: transport making the actual calls (default: requests)
+        """
+        self.path = path
+        self.transport = transport or RequestsTransport()
+        self._file = open(path, 'w')
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Note: the file and the lock can't be pickled
+        state = self.__dict__.copy()
+        del state['_file'], state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        # Note: copies append to the cassette, instead of overwriting it
+        self.__dict__.update(state)
+        self._file = open(self.path, 'a')
+        self._lock = threading.Lock()
+
+    def request(self, session, method, url, data, timeout=None):
+        start = time.time()
+        options = {'timeout': timeout} if timeout is not None else {}
+        res = self.transport.request(session, method, url, data, **options)
+        elapsed = time.time() - start
+
+        # Write interaction (credentials are never part of the data)
+        method, path, params = _interaction_key(method, url, data)
+        line = json.dumps({
+            'method': method, 'path': path, 'params': json.loads(params),
+            'status': res.status_code, 'reason': res.reason,
+            'body': res.content.decode('utf-8'), 'elapsed': round(elapsed, 6)
+        }, separators=(',', ':'))
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+        return res
+
+    def close(self):
+        """
+        Close the cassette file.
+        """
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ReplayTransport(object):
+    """
+    Transport that answers the calls with the responses recorded in a
+    cassette, without contacting any server. Calls are matched by method,
+    path and params; identical calls get the recorded responses in order
+    (repeating the last one once they're exhausted).
+    """
+    def __init__(self, path, latency=0.0, recorded_latency=False):
+        """
+        :param path: cassette file to read
+        :param latency: seconds to wait before answering each call
+        :param recorded_latency: wait the recorded time of each call instead
+        """
+        self.latency = latency
+        self.recorded_latency = recorded_latency
+        self._lock = threading.Lock()
+
+        # Load interactions by key, in recording order
+        self._interactions = {}
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    key = item['method'], item['path'], json.dumps(item['params'])
+                    self._interactions.setdefault(key, []).append(item)
+
+    def __getstate__(self):
+        # Note: the interactions left are kept, not the lock
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def request(self, session, method, url, data, timeout=None):
+        # Note: timeouts are ignored, latency is only simulated
+        key = _interaction_key(method, url, data)
+        with self._lock:
+            interactions = self._interactions.get(key)
+            if not interactions:
+                raise ReplayError('No recorded response for {} {} {}'.format(*key))
+            item = interactions.pop(0) if len(interactions) > 1 else interactions[0]
+
+        # Simulate latency
+        delay = item.get('elapsed', 0.0) if self.recorded_latency else self.latency
+        if delay:
+            time.sleep(delay)
+
+        return ReplayResponse(url, item['status'], item['reason'],
+                              item['body'].encode('utf-8'))
@@ -1,6 +1,14 @@
 __author__ = 'kako'
 
 import sys
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from .deadline import deadline, remaining
 
 
 # Encoding cleanup function
@@ -8,3 +16,88 @@ if sys.version_info.major == 3:
     utf_encode = lambda x: x
 else:
     utf_encode = lambda x: x.encode('utf-8')
+
+
+def parse_timeout(value):
+    """
+    Parse a timeout argument: seconds, or connect and read seconds separated
+    by a comma (ie: "3.05,27").
+
+    :param value: str
+    :return: float or tuple of floats
+    """
+    if ',' in value:
+        connect, read = value.split(',', 1)
+        return float(connect), float(read)
+    return float(value)
+
+
+# End of the items of a prefetched iterable
+_END = object()
+
+
+def put_until(items, item, stop):
+    """
+    Put an item in a bounded queue, waiting until there's room or stop is
+    set (ie: the consumer is gone).
+
+    :param items: Queue instance
+    :param item: item to put
+    :param stop: threading.Event
+    :return: True if the item was put
+    """
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def prefetch(iterable, size=1):
+    """
+    Iterate in a background thread, keeping up to size items ready, so that
+    producing the next items (ie: fetching pages) overlaps with consuming
+    the current one. Errors are raised in the consumer, and closing the
+    generator stops the producer. The deadline of the calling thread
+    applies to the producer.
+
+    :param iterable: iterable to consume in the background
+    :param size: maximum number of items waiting to be consumed
+    :return: generator that yields the items
+    """
+    items = queue.Queue(size)
+    stop = threading.Event()
+    left = remaining()
+
+    def produce():
+        try:
+            with deadline(left):
+                for item in iterable:
+                    if not put_until(items, (item, None), stop):
+                        break
+                else:
+                    put_until(items, (_END, None), stop)
+
+        except Exception as exc:
+            put_until(items, (_END, exc), stop)
+
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+
+    try:
+        while True:
+            item, exc = items.get()
+            if item is _END:
+                if exc is not None:
+                    raise exc
+                return
+            yield item
+    finally:
+        stop.set()
@@ -1,2 +1,12 @@
 from .test_api import *
 from .test_cmd import *
+from .test_instrumentation import *
+from .test_fakeserver import *
+from .test_transports import *
+from .test_circuit import *
+from .test_deadline import *
+from .test_pool import *
+from .test_search import *
+from .test_batch import *
+from .test_capabilities import *
+from .test_issues import *
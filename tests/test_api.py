@@ -1,5 +1,8 @@
 __author__ = 'claudio.melendrez'
 
+import pickle
+import threading
+import time
 import uuid
 
 from unittest import TestCase
@@ -9,8 +12,19 @@ try:
 except ImportError:
     import mock
 
+from concurrent.futures import ProcessPoolExecutor
+
 from sonarqube_api import SonarAPIHandler
-from sonarqube_api.exceptions import ClientError, AuthError, ValidationError, ServerError
+from sonarqube_api.circuit import CircuitBreaker
+from sonarqube_api.deadline import deadline
+from sonarqube_api.exceptions import ClientError, AuthError, DeadlineExceeded, ValidationError, ServerError
+from sonarqube_api.fakeserver import FakeSonarQube
+from sonarqube_api.instrumentation import Profiler
+
+
+# Metrics catalog of the server (general metrics and their variants)
+METRICS_CATALOG = {key: {'key': key} for metric in SonarAPIHandler.GENERAL_METRICS
+                   for key in (metric, 'new_{}'.format(metric))}
 
 
 class SonarAPIHandlerTest(TestCase):
@@ -35,7 +49,7 @@ class SonarAPIHandlerTest(TestCase):
             "http://localhost:9000{}".format(test.RESOURCES_ENDPOINT),
             test._get_url(test.RESOURCES_ENDPOINT))
 
-    @mock.patch('sonarqube_api.api.requests.Session.get')
+    @mock.patch('requests.Session.get')
     def test_validate_auth(self, mock_res):
         resp = mock.MagicMock(status_code=200)
         mock_res.return_value = resp
@@ -52,7 +66,7 @@ class SonarAPIHandlerTest(TestCase):
         resp.json.return_value = {'valid': True}
         self.assertTrue(self.h.validate_authentication())
 
-    @mock.patch('sonarqube_api.api.requests.Session.get')
+    @mock.patch('requests.Session.get')
     def test_errors(self, mock_get):
         # Empty response , cannot get next
         resp = mock.MagicMock(status_code=200)
@@ -85,7 +99,7 @@ class SonarAPIHandlerTest(TestCase):
         resp.reason = 'Internal Server Error'
         self.assertRaises(ServerError, next, self.h.get_metrics())
 
-    @mock.patch('sonarqube_api.api.requests.Session.post')
+    @mock.patch('requests.Session.post')
     def test_activate_rule(self, mock_post):
         # Missing param key
         resp = mock.MagicMock(status_code=400)
@@ -108,7 +122,7 @@ class SonarAPIHandlerTest(TestCase):
         mock_post.assert_called_with(url, data={'rule_key': 'py:S1291', 'profile_key': 'py-234454',
                                                 'reset': 'false', 'params': 'format=^setUp|tearDown$'})
 
-    @mock.patch('sonarqube_api.api.requests.Session.post')
+    @mock.patch('requests.Session.post')
     def test_create_rule(self, mock_post):
         # Rule exists, error
         resp = mock.MagicMock(status_code=400)
@@ -160,6 +174,52 @@ class SonarAPIHandlerTest(TestCase):
             'get', self.h.METRICS_LIST_ENDPOINT, f='coverage,violations', p=2
         )
 
+    @mock.patch('sonarqube_api.api.SonarAPIHandler.get_metrics')
+    def test_get_metrics_catalog(self, mock_metrics):
+        SonarAPIHandler._metrics_catalogs.clear()
+        mock_metrics.return_value = [{'key': 'coverage'}, {'key': 'new_coverage'}]
+
+        # Loaded once and shared by handlers of the same server
+        catalog = self.h.get_metrics_catalog()
+        self.assertEqual(sorted(catalog), ['coverage', 'new_coverage'])
+        SonarAPIHandler(token='lala').get_metrics_catalog()
+        self.assertEqual(mock_metrics.call_count, 1)
+
+        # Another server loads its own catalog
+        SonarAPIHandler(port=9001).get_metrics_catalog()
+        self.assertEqual(mock_metrics.call_count, 2)
+
+        # Reloaded on refresh and when expired
+        self.h.get_metrics_catalog(refresh=True)
+        self.assertEqual(mock_metrics.call_count, 3)
+        with mock.patch('sonarqube_api.api.time.time') as mock_time:
+            mock_time.return_value = 2 ** 40
+            self.h.get_metrics_catalog()
+        self.assertEqual(mock_metrics.call_count, 4)
+
+    @mock.patch('sonarqube_api.api.SonarAPIHandler._make_call')
+    @mock.patch('sonarqube_api.api.SonarAPIHandler.get_metrics_catalog')
+    def test_expand_metrics(self, mock_catalog, mock_call):
+        mock_catalog.return_value = {'coverage': {}, 'new_coverage': {}, 'violations': {}}
+
+        # Without validation, all differential variants are added
+        self.assertEqual(self.h.expand_metrics(['coverage', 'violations'], include_trends=True, validate=False),
+                         ['coverage', 'violations', 'new_coverage', 'new_violations'])
+        self.assertEqual(self.h.expand_metrics(validate=False), list(self.h.GENERAL_METRICS))
+        self.assertFalse(mock_catalog.called)
+
+        # Validating, only existing variants are added
+        self.assertEqual(self.h.expand_metrics(['coverage', 'violations'], include_trends=True),
+                         ['coverage', 'violations', 'new_coverage'])
+
+        # Unknown metrics fail before calling the server, unless not validating
+        with self.assertRaises(ValidationError):
+            next(self.h.get_resources_metrics(metrics=['coverage', 'covrage']))
+        self.assertFalse(mock_call.called)
+        mock_call.return_value = mock.MagicMock(status_code=200, json=mock.MagicMock(return_value=[]))
+        self.assertEqual(list(self.h.get_resources_metrics(metrics=['covrage'], validate_metrics=False)), [])
+        self.assertTrue(mock_call.called)
+
     @mock.patch('sonarqube_api.api.SonarAPIHandler._make_call')
     def test_get_rules(self, mock_call):
         # Two pages, once each
@@ -186,7 +246,35 @@ class SonarAPIHandlerTest(TestCase):
         )
 
     @mock.patch('sonarqube_api.api.SonarAPIHandler._make_call')
-    def test_get_resources_metrics(self, mock_call):
+    def test_decoder(self, mock_call):
+        # Decoders get the raw body, response text is never built
+        resp = mock.MagicMock(status_code=200)
+        resp.content = b'{"p": 1, "ps": 2, "total": 1, "rules": [{"key": "lala"}]}'
+        mock_call.return_value = resp
+        for decoder in ('json', 'orjson', 'ujson'):
+            try:
+                h = SonarAPIHandler(decoder=decoder)
+            except ImportError:
+                continue
+            self.assertEqual(list(h.get_rules()), [{'key': 'lala'}])
+        self.assertFalse(resp.json.called)
+
+        # Any callable, and events for hooks
+        decoder = mock.MagicMock(return_value={'valid': True})
+        hook = mock.MagicMock()
+        h = SonarAPIHandler(decoder=decoder)
+        h.add_hook(hook)
+        self.assertTrue(h.validate_authentication())
+        decoder.assert_called_once_with(resp.content)
+        self.assertEqual(hook.call_count, 1)
+
+        # Unknown backend
+        self.assertRaises(ValueError, SonarAPIHandler, decoder='lala')
+
+    @mock.patch('sonarqube_api.api.SonarAPIHandler._make_call')
+    @mock.patch('sonarqube_api.api.SonarAPIHandler.get_metrics_catalog')
+    def test_get_resources_metrics(self, mock_catalog, mock_call):
+        mock_catalog.return_value = METRICS_CATALOG
         # Note: resource metrics responses are not paged
         resp = mock.MagicMock(status_code=200)
         resp.json.return_value = [
@@ -271,7 +359,9 @@ class SonarAPIHandlerTest(TestCase):
         mock_call.reset_mock()
 
     @mock.patch('sonarqube_api.api.SonarAPIHandler._make_call')
-    def test_get_resources_full_data(self, mock_call):
+    @mock.patch('sonarqube_api.api.SonarAPIHandler.get_metrics_catalog')
+    def test_get_resources_full_data(self, mock_catalog, mock_call):
+        mock_catalog.return_value = METRICS_CATALOG
         # Setup responses for calls
         resp = mock.MagicMock(status_code=200)
         resp.json.side_effect = [
@@ -331,6 +421,181 @@ class SonarAPIHandlerTest(TestCase):
         )
 
 
+class SharedHandlerTest(TestCase):
+
+    def test_stress(self):
+        threads, rounds = 24, 5
+        errors = []
+        sessions = set()
+        rules = {}
+
+        with FakeSonarQube(rules=230, users=0, groups=1) as server:
+            h = server.handler()
+            expected = [r['key'] for r in h.get_rules(page_size=100)]
+            start = threading.Barrier(threads + 1) if hasattr(threading, 'Barrier') else None
+
+            def work(n):
+                try:
+                    if start:
+                        start.wait()
+                    sessions.add(h._session)
+                    for i in range(rounds):
+                        # Paginated reads
+                        rules[n, i] = [r['key'] for r in h.get_rules(page_size=100)]
+                        # Writes
+                        login = 'user{}-{}'.format(n, i)
+                        h.create_user(login, 'pass', 'User {} {}'.format(n, i))
+                        h.add_user_group(login, name='group0')
+                        h.activate_rule(expected[(n * rounds + i) % len(expected)], 'prof{}'.format(n))
+                except Exception as exc:
+                    errors.append(exc)
+
+            def toggle_hooks():
+                # Hooks added and removed while calls are made
+                while any(t.is_alive() for t in workers):
+                    profiler = Profiler()
+                    h.add_hook(profiler)
+                    h.remove_hook(profiler)
+
+            profiler = Profiler()
+            h.add_hook(profiler)
+            calls = len(server.requests)
+            workers = [threading.Thread(target=work, args=(n,)) for n in range(threads)]
+            for thread in workers:
+                thread.start()
+            toggler = threading.Thread(target=toggle_hooks)
+            toggler.start()
+            if start:
+                start.wait()
+            for thread in workers + [toggler]:
+                thread.join()
+
+            self.assertEqual(errors, [])
+
+            # Every thread got all the rules, and made all its writes
+            self.assertEqual(len(rules), threads * rounds)
+            for keys in rules.values():
+                self.assertEqual(keys, expected)
+            self.assertEqual(len(server.users), threads * rounds)
+            self.assertEqual(server.groups['group0']['membersCount'], threads * rounds)
+            self.assertEqual(sum(len(a) for a in server.activations.values()), threads * rounds)
+
+            # A session by thread, all with the same connections pool
+            self.assertEqual(len(sessions), threads)
+            for session in sessions:
+                self.assertIs(session.get_adapter('http://127.0.0.1'), h._adapter)
+
+            # Every call was seen by the hook
+            made = len(server.requests) - calls
+            self.assertEqual(made, threads * rounds * 6)
+            self.assertEqual(sum(len(l) for l in profiler.latencies.values()), made)
+
+
+class PrefetchTest(TestCase):
+
+    def setUp(self):
+        self.server = FakeSonarQube(rules=500, metrics=250, latency=0.03).start()
+        self.h = self.server.handler()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def requests(self):
+        return len(self.server.requests)
+
+    def test_results(self):
+        self.assertEqual(list(self.h.get_rules(page_size=100, prefetch=2)),
+                         list(self.h.get_rules(page_size=100)))
+        self.assertEqual(list(self.h.get_rules(page_size=100, start_page=3, prefetch=1)),
+                         list(self.h.get_rules(page_size=100, start_page=3)))
+        self.assertEqual(list(self.h.get_metrics(prefetch=3)), list(self.h.get_metrics()))
+
+    def test_overlap(self):
+        # Consumer work (0.03s per page) overlaps with network waits
+        def consume(rules):
+            start = time.time()
+            for i, rule in enumerate(rules):
+                if i % 100 == 0:
+                    time.sleep(0.03)
+            return time.time() - start
+
+        serial = consume(self.h.get_rules(page_size=100))
+        overlapped = consume(self.h.get_rules(page_size=100, prefetch=2))
+        self.assertTrue(overlapped < serial * 0.8, (overlapped, serial))
+
+    def test_bounded(self):
+        start = self.requests()
+        rules = self.h.get_rules(page_size=50, prefetch=2)
+        next(rules)
+        time.sleep(0.3)
+
+        # Current page, 2 waiting and 1 waiting for room
+        self.assertEqual(self.requests() - start, 4)
+
+        # Closing stops the producer
+        rules.close()
+        time.sleep(0.3)
+        stopped = self.requests()
+        time.sleep(0.2)
+        self.assertEqual(self.requests(), stopped)
+        self.assertTrue(stopped - start <= 5)
+
+    def test_errors(self):
+        # Deadline of the consumer applies to the producer
+        with deadline(0.1):
+            rules = self.h.get_rules(page_size=50, prefetch=2)
+            self.assertRaises(DeadlineExceeded, list, rules)
+
+        # Server errors raised in the consumer
+        search = self.server.ROUTES[SonarAPIHandler.RULES_LIST_ENDPOINT]
+        failing = lambda srv, params: (503, None) if params.get('p') == '3' else search(srv, params)
+        with mock.patch.dict(self.server.ROUTES, {SonarAPIHandler.RULES_LIST_ENDPOINT: failing}):
+            rules = []
+            with self.assertRaises(ServerError):
+                for rule in self.h.get_rules(page_size=50, prefetch=2):
+                    rules.append(rule)
+            self.assertEqual(len(rules), 100)
+
+
+def count_rules(h, languages):
+    # Run in worker processes
+    return languages, len(list(h.get_rules(languages=languages))), h.circuit_state
+
+
+class PicklingTest(TestCase):
+
+    def test_pickle(self):
+        with FakeSonarQube(rules=120) as server:
+            h = server.handler(token='secret', timeout=(1, 10), decoder='json',
+                               circuit_breaker=True)
+            h.add_hook(Profiler())
+            rules = list(h.get_rules())
+
+            # Settings are kept, not the session or hooks
+            copy = pickle.loads(pickle.dumps(h))
+            self.assertEqual(copy._get_url('/x'), h._get_url('/x'))
+            self.assertEqual((copy._auth, copy._timeout), (('secret', ''), (1, 10)))
+            self.assertEqual(copy._hooks, [])
+            self.assertIsNot(copy._session, h._session)
+            self.assertEqual(copy._session.auth, ('secret', ''))
+            self.assertEqual(list(copy.get_rules()), rules)
+
+            # Default breaker of the server in the same process, copy of others
+            self.assertIs(copy.circuit_breaker, h.circuit_breaker)
+            breaker = CircuitBreaker(failure_threshold=2)
+            breaker.record_failure()
+            copy = pickle.loads(pickle.dumps(server.handler(circuit_breaker=breaker)))
+            self.assertIsNot(copy.circuit_breaker, breaker)
+            self.assertEqual((copy.circuit_breaker.failures, copy.circuit_breaker.failure_threshold),
+                             (1, 2))
+
+            # Handler passed to worker processes
+            with ProcessPoolExecutor(2) as executor:
+                results = list(executor.map(count_rules, [h] * 3, ['py', 'js', 'java']))
+            self.assertEqual(results, [('py', 40, 'closed'), ('js', 40, 'closed'),
+                                       ('java', 40, 'closed')])
+
+
 class TestUsers(TestCase):
     def setUp(self):
         self.sonar = SonarAPIHandler(user='admin', password='admin')
@@ -0,0 +1,76 @@
+__author__ = 'kako'
+
+import time
+from unittest import TestCase
+
+from concurrent.futures import CancelledError
+
+from sonarqube_api.deadline import deadline
+from sonarqube_api.exceptions import ClientError, DeadlineExceeded, ValidationError
+from sonarqube_api.fakeserver import FakeSonarQube
+
+
+class BatchTest(TestCase):
+
+    def setUp(self):
+        self.server = FakeSonarQube(users=2, groups=1, latency=0.05).start()
+        self.h = self.server.handler()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_batch(self):
+        start = time.time()
+        with self.h.batch(max_workers=10) as batch:
+            futures = [batch.create_user('new{}'.format(i), 'pass', 'New {}'.format(i))
+                       for i in range(10)]
+            # Fails: exists, missing
+            batch.create_user('user0', 'pass', 'User 0')
+            batch.add_user_group('ghost', name='group0')
+            self.assertRaises(AttributeError, getattr, batch, 'get_rules')
+
+        # Made concurrently
+        self.assertTrue(time.time() - start < 0.5)
+        self.assertEqual([f.result().json()['user']['login'] for f in futures],
+                         ['new{}'.format(i) for i in range(10)])
+
+        # Results in submission order, with the errors of direct calls
+        results = batch.results()
+        self.assertEqual(len(results), 12)
+        self.assertEqual([r.json()['user']['login'] for r in results[:10]],
+                         ['new{}'.format(i) for i in range(10)])
+        self.assertIsInstance(results[10], ValidationError)
+        self.assertIsInstance(results[11], ClientError)
+        self.assertRaises(ValidationError, batch.futures[10].result)
+        self.assertEqual(len(self.server.users), 12)
+
+    def test_batch_cancel(self):
+        try:
+            with self.h.batch(max_workers=1) as batch:
+                for i in range(10):
+                    batch.create_group('new{}'.format(i))
+                raise KeyboardInterrupt
+        except KeyboardInterrupt:
+            pass
+
+        # Pending calls are not made
+        self.assertTrue(any(f.cancelled() for f in batch.futures))
+        self.assertTrue(len(self.server.groups) < 11)
+
+        # Results of the cancelled calls are errors too
+        results = batch.results()
+        self.assertEqual(len(results), 10)
+        self.assertEqual(results[0].status_code, 200)
+        self.assertIsInstance(results[-1], CancelledError)
+        self.assertEqual(sum(isinstance(r, CancelledError) for r in results),
+                         sum(f.cancelled() for f in batch.futures))
+
+    def test_batch_deadline(self):
+        with deadline(0.12):
+            with self.h.batch(max_workers=1) as batch:
+                for i in range(5):
+                    batch.update_user('user0', name='Name {}'.format(i))
+
+        results = batch.results()
+        self.assertEqual(results[0].status_code, 200)
+        self.assertIsInstance(results[-1], DeadlineExceeded)
@@ -0,0 +1,168 @@
+__author__ = 'kako'
+
+from unittest import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import requests
+
+from sonarqube_api import SonarAPIHandler
+from sonarqube_api.capabilities import ServerCapabilities
+from sonarqube_api.exceptions import NotFoundError
+from sonarqube_api.fakeserver import FakeSonarQube
+
+
+class ServerCapabilitiesTest(TestCase):
+
+    def test_parse(self):
+        self.assertEqual(ServerCapabilities.parse_version('6.7.1.35068'), (6, 7, 1, 35068))
+        self.assertEqual(ServerCapabilities.parse_version('5.6-SNAPSHOT'), (5, 6))
+        self.assertIsNone(ServerCapabilities.parse_version('<html>'))
+        self.assertEqual(ServerCapabilities.parse_webservices({'webServices': [
+            {'path': 'api/rules', 'actions': [{'key': 'search'}, {'key': 'create'}]},
+            {'path': 'api/resources', 'actions': [{'key': 'index'}]},
+        ]}), {'/api/rules', '/api/rules/search', '/api/rules/create',
+              '/api/resources', '/api/resources/index'})
+
+    def test_checks(self):
+        capabilities = ServerCapabilities((6, 7, 1), ['/api/rules/search'])
+        self.assertTrue(capabilities.known)
+        self.assertTrue(capabilities.at_least(6, 3))
+        self.assertFalse(capabilities.at_least(7))
+        self.assertTrue(capabilities.supports('/api/rules/search'))
+        self.assertFalse(capabilities.supports('/api/resources'))
+
+        # Inconclusive if unknown
+        capabilities = ServerCapabilities()
+        self.assertFalse(capabilities.known)
+        self.assertIsNone(capabilities.at_least(6, 3))
+        self.assertIsNone(capabilities.supports('/api/rules/search'))
+
+
+class DetectionTest(TestCase):
+
+    def setUp(self):
+        SonarAPIHandler._server_capabilities.clear()
+        self.servers = []
+
+    def tearDown(self):
+        SonarAPIHandler._server_capabilities.clear()
+        for server in self.servers:
+            server.stop()
+
+    def start(self, **kwargs):
+        server = FakeSonarQube(**kwargs).start()
+        self.servers.append(server)
+        return server
+
+    def calls(self, server, *endpoints):
+        return [path for method, path in server.requests if path in endpoints]
+
+    def test_detection(self):
+        server = self.start(version='6.7.1')
+        capabilities = server.handler().get_capabilities()
+        self.assertEqual(capabilities.version, (6, 7, 1))
+        self.assertTrue(capabilities.supports(SonarAPIHandler.MEASURES_TREE_ENDPOINT))
+        self.assertFalse(capabilities.supports(SonarAPIHandler.RESOURCES_ENDPOINT))
+
+        # Cached for all handlers of the server, until refreshed
+        self.assertIs(server.handler().get_capabilities(), capabilities)
+        self.assertEqual(len(server.requests), 2)
+        self.assertIsNot(server.handler().get_capabilities(refresh=True), capabilities)
+        self.assertEqual(len(server.requests), 4)
+
+        # Unknown if disabled or not available
+        self.assertFalse(server.handler(detect=False).get_capabilities().known)
+        self.assertEqual(len(server.requests), 4)
+        capabilities = self.start(version='4.1').handler().get_capabilities()
+        self.assertEqual(capabilities.version, (4, 1))
+        self.assertIsNone(capabilities.webservices)
+
+    def test_detection_errors(self):
+        # Server errors are unknown (and detected again), not failures
+        server = self.start(version='5.6.7')
+        failing = lambda srv, params: (503, None)
+        with mock.patch.dict(server.ROUTES, {SonarAPIHandler.WEBSERVICES_LIST_ENDPOINT: failing}):
+            capabilities = server.handler().get_capabilities()
+            self.assertEqual(capabilities.version, (5, 6, 7))
+            self.assertIsNone(capabilities.webservices)
+            self.assertEqual(server.handler().activate_rules('prof1', languages='py')[1], 0)
+        self.assertTrue(server.handler().get_capabilities().supports(
+            SonarAPIHandler.RULES_BULK_ACTIVATION_ENDPOINT))
+
+        # And so are connection errors
+        with mock.patch('requests.Session.get', side_effect=requests.ConnectionError('refused')):
+            self.assertFalse(server.handler().get_capabilities(refresh=True).known)
+
+        # Missing resources are still errors
+        self.assertRaises(NotFoundError, list, self.start(version='5.6.7').handler().get_resources_metrics(
+            resource='missing', metrics=['coverage']))
+
+    def test_resources_metrics(self):
+        old, new = self.start(version='5.6.7'), self.start(version='6.7.1')
+        for kwargs in ({}, {'resource': 'project:3', 'include_modules': True}):
+            expected = list(old.handler().get_resources_metrics(metrics=['coverage'], **kwargs))
+            self.assertEqual(list(new.handler().get_resources_metrics(metrics=['coverage'], **kwargs)),
+                             expected)
+        self.assertEqual(len(expected), 1)
+
+        # Deprecated resources used if available, without detecting
+        self.assertEqual(len(self.calls(old, SonarAPIHandler.RESOURCES_ENDPOINT)), 2)
+        self.assertEqual(self.calls(old, SonarAPIHandler.MEASURES_TREE_ENDPOINT,
+                                    SonarAPIHandler.SERVER_VERSION_ENDPOINT,
+                                    SonarAPIHandler.WEBSERVICES_LIST_ENDPOINT), [])
+
+        # Otherwise detected once they are not found
+        self.assertEqual(self.calls(new, SonarAPIHandler.RESOURCES_ENDPOINT,
+                                    SonarAPIHandler.SERVER_VERSION_ENDPOINT,
+                                    SonarAPIHandler.WEBSERVICES_LIST_ENDPOINT), [
+            SonarAPIHandler.RESOURCES_ENDPOINT, SonarAPIHandler.SERVER_VERSION_ENDPOINT,
+            SonarAPIHandler.WEBSERVICES_LIST_ENDPOINT])
+        self.assertEqual(len(self.calls(new, SonarAPIHandler.MEASURES_TREE_ENDPOINT)), 21)
+
+        # Trends, from periods (and the base component param before 6.6)
+        resources = list(self.start(version='6.5').handler().get_resources_metrics(
+            resource='project:3', metrics=['coverage'], include_trends=True))
+        self.assertEqual(resources[0]['msr'], [
+            {'key': 'coverage', 'val': 3.0, 'frmt_val': '3', 'var1': 1.0},
+            {'key': 'new_coverage', 'val': 3.0, 'frmt_val': '3', 'var1': 1.0},
+        ])
+
+    def test_activate_rules(self):
+        activations = []
+        for version in ('5.6.7', '4.3'):
+            server = self.start(rules=60, custom_ratio=0.3, version=version)
+            h = server.handler()
+            self.assertEqual(h.activate_rules('prof1', languages='py', severity='major'), (20, 0))
+            self.assertEqual(h.activate_rules('prof2', custom_only=True)[1], 0)
+            activations.append(server.activations)
+
+            calls = self.calls(server, SonarAPIHandler.RULES_BULK_ACTIVATION_ENDPOINT,
+                               SonarAPIHandler.RULES_ACTIVATION_ENDPOINT)
+            if version == '5.6.7':
+                # In bulk
+                self.assertEqual(calls, [SonarAPIHandler.RULES_BULK_ACTIVATION_ENDPOINT] * 2)
+            else:
+                # One by one
+                self.assertEqual(set(calls), {SonarAPIHandler.RULES_ACTIVATION_ENDPOINT})
+                self.assertEqual(len(calls), 20 + len(activations[-1]['prof2']))
+
+        # Same result
+        self.assertEqual(activations[0], activations[1])
+        self.assertTrue(all(a['severity'] == 'MAJOR' for a in activations[0]['prof1'].values()))
+
+    def test_users(self):
+        # Paginated, fetched in pages of the largest size
+        server = self.start(users=120)
+        h = server.handler()
+        self.assertEqual(len(h.decode(h.get_users())['users']), 50)
+        self.assertEqual(len(list(h.iter_users())), 120)
+        self.assertEqual(len(self.calls(server, SonarAPIHandler.USERS_LIST_ENDPOINT)), 2)
+
+        # All in a single call
+        server = self.start(users=120, version='5.1')
+        self.assertEqual(len(list(server.handler().iter_users())), 120)
+        self.assertEqual(len(self.calls(server, SonarAPIHandler.USERS_LIST_ENDPOINT)), 1)
@@ -0,0 +1,135 @@
+__author__ = 'kako'
+
+import threading
+from unittest import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from sonarqube_api import SonarAPIHandler
+from sonarqube_api.circuit import CircuitBreaker
+from sonarqube_api.deadline import deadline
+from sonarqube_api.exceptions import CircuitOpenError, DeadlineExceeded, ServerError, ValidationError
+from sonarqube_api.fakeserver import FakeSonarQube
+
+
+class CircuitBreakerTest(TestCase):
+
+    @mock.patch('sonarqube_api.circuit.time.time')
+    def test_states(self, time_mock):
+        time_mock.return_value = 1000.0
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+        self.assertEqual(breaker.state, 'closed')
+
+        # Successes reset the failures count
+        breaker.before_call()
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.failures, 0)
+
+        # Consecutive failures open the circuit
+        breaker.before_call()
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        self.assertRaises(CircuitOpenError, breaker.before_call)
+
+        # Half-open after timeout, with a single probe allowed
+        time_mock.return_value = 1010.0
+        self.assertEqual(breaker.state, 'half-open')
+        breaker.before_call()
+        self.assertRaises(CircuitOpenError, breaker.before_call)
+
+        # Failed probe opens again, successful one closes
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        time_mock.return_value = 1020.0
+        breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+        breaker.before_call()
+
+    def test_handler(self):
+        with FakeSonarQube(rules=10, error_rate=1.0) as server:
+            breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+            h = server.handler(circuit_breaker=breaker)
+            self.assertEqual(h.circuit_state, 'closed')
+
+            # Server errors until the circuit opens, then fail fast
+            for _ in range(3):
+                self.assertRaises(ServerError, h.validate_authentication)
+            self.assertEqual(h.circuit_state, 'open')
+            for _ in range(100):
+                self.assertRaises(CircuitOpenError, h.validate_authentication)
+            self.assertEqual(len(server.requests), 3)
+
+            # Server is back: client errors don't count as failures
+            server.error_rate = 0.0
+            breaker.reset()
+            self.assertRaises(ValidationError, h.create_user, 'user0', 'secret', 'User 0')
+            self.assertEqual(h.circuit_state, 'closed')
+            self.assertTrue(h.validate_authentication())
+            port = server.port
+
+        # Connection errors count as failures too
+        h = SonarAPIHandler(host='http://127.0.0.1', port=port, circuit_breaker=breaker)
+        self.assertRaises(Exception, h.validate_authentication)
+        self.assertEqual(breaker.failures, 1)
+
+    def test_shared_breakers(self):
+        h1 = SonarAPIHandler(host='http://sonar1', circuit_breaker=True)
+        h2 = SonarAPIHandler(host='http://sonar1', circuit_breaker=True)
+        h3 = SonarAPIHandler(host='http://sonar2', circuit_breaker=True)
+        self.assertIs(h1.circuit_breaker, h2.circuit_breaker)
+        self.assertIsNot(h1.circuit_breaker, h3.circuit_breaker)
+
+        # Disabled by default
+        h = SonarAPIHandler(host='http://sonar1')
+        self.assertIsNone(h.circuit_breaker)
+        self.assertIsNone(h.circuit_state)
+
+    def test_concurrent_probes(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0, half_open_calls=2)
+        breaker.before_call()
+        breaker.record_failure()
+
+        # Only the allowed number of probes go through at once
+        allowed = []
+
+        def probe():
+            try:
+                breaker.before_call()
+                allowed.append(True)
+            except CircuitOpenError:
+                pass
+
+        threads = [threading.Thread(target=probe) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(allowed), 2)
+
+    def test_deadline(self):
+        # Calls stopped by the deadline of the caller are not failures
+        breaker = CircuitBreaker(failure_threshold=2)
+        with FakeSonarQube(latency=0.3) as server:
+            h = server.handler(circuit_breaker=breaker)
+            for _ in range(2):
+                with deadline(0.05):
+                    self.assertRaises(DeadlineExceeded, h.get_metrics_catalog, refresh=True)
+            self.assertEqual((breaker.state, breaker.failures), ('closed', 0))
+
+            # Nor probes, that release their slot
+            breaker.record_failure()
+            breaker.record_failure()
+            breaker._opened_at -= breaker.reset_timeout
+            with deadline(0.05):
+                self.assertRaises(DeadlineExceeded, h.get_metrics_catalog, refresh=True)
+            self.assertEqual(breaker.state, 'half-open')
+            self.assertTrue(h.validate_authentication())
+            self.assertEqual(breaker.state, 'closed')
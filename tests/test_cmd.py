@@ -3,6 +3,14 @@ __author__ = 'kako'
 from io import StringIO
 from unittest import TestCase
 import argparse
+import csv
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
 import uuid
 
 try:
@@ -11,7 +19,9 @@ except ImportError:
     import mock
 
 from sonarqube_api.api import SonarAPIHandler
-from sonarqube_api.cmd import activate_rules, export_rules, migrate_rules, users, groups
+from sonarqube_api.cmd import activate_rules, export_issues, export_rules, migrate_rules, search_rules, users, groups, sonarqube
+from sonarqube_api.fakeserver import FakeSonarQube
+from sonarqube_api.instrumentation import Profiler
 
 
 GET_RULES_DATA = [
@@ -41,6 +51,25 @@ GET_RULES_DATA = [
 ]
 
 
+class StartupTest(TestCase):
+
+    def test_lazy_imports(self):
+        # Importing the commands or showing help must not load heavy modules
+        for module in ('activate_rules', 'export_rules', 'export_issues', 'migrate_rules',
+                       'users', 'groups'):
+            output = subprocess.check_output([
+                sys.executable, '-c',
+                'import sys\n'
+                'from sonarqube_api.cmd.{} import main\n'
+                'try:\n'
+                '    main()\n'
+                'except SystemExit:\n'
+                '    print(sorted(m for m in ("requests", "prettytable") if m in sys.modules))'.format(module),
+                '--help'
+            ])
+            self.assertTrue(output.endswith(b'[]\n'), module)
+
+
 class ExportRulesTest(TestCase):
 
     @mock.patch('sonarqube_api.cmd.export_rules.open', create=True)
@@ -54,7 +83,8 @@ class ExportRulesTest(TestCase):
         # Set call arguments: active only, spec profile and langs
         parse_mock.return_value = mock.MagicMock(
             host='localhost', port='9000', user='pancho', password='primero',
-            output='~', active=True, profile='prof1', languages='py,js'
+            output='~', active=True, profile='prof1', languages='py,js',
+            page_size=100, resume=False, workers=1, shard=False, profile_report=False, timeout=None, deadline=None
         )
 
         # Mock file handlers
@@ -70,7 +100,7 @@ class ExportRulesTest(TestCase):
         export_rules.main()
 
         # Check call to get_rules, should be one
-        get_rules_mock.assert_called_once_with(True, 'prof1', 'py,js')
+        get_rules_mock.assert_called_once_with(True, 'prof1', 'py,js', page_size=100, start_page=1)
 
         # Check error calls
         stderr_mock.write.assert_called_once_with("Error: missing values for key\n")
@@ -89,6 +119,238 @@ class ExportRulesTest(TestCase):
 
         # TODO: add checks for html file write
 
+    @mock.patch('sonarqube_api.cmd.export_rules.open', create=True)
+    @mock.patch('sonarqube_api.cmd.export_rules.sys.stdout')
+    @mock.patch('sonarqube_api.cmd.export_rules.sys.stderr')
+    @mock.patch('sonarqube_api.cmd.export_rules.argparse.ArgumentParser.parse_args')
+    @mock.patch('requests.Session.get')
+    def test_main_profile_report(self, get_mock, parse_mock, stderr_mock, stdout_mock, open_mock):
+        parse_mock.return_value = mock.MagicMock(
+            host='localhost', port='9000', user='pancho', password='primero',
+            output='~', active=True, profile='prof1', languages='py,js',
+            page_size=100, resume=False, workers=1, shard=False, profile_report=True, timeout=None, deadline=None
+        )
+        open_mock.side_effect = [mock.MagicMock(), mock.MagicMock()]
+        get_mock.return_value = mock.MagicMock(status_code=200, content=b'{}', json=mock.MagicMock(
+            return_value={'p': 1, 'ps': 100, 'total': 5, 'rules': GET_RULES_DATA}
+        ))
+
+        # Execute command
+        export_rules.main()
+
+        # Check report written to stderr after the rule error
+        self.assertEqual(stderr_mock.write.call_count, 2)
+        report = stderr_mock.write.call_args[0][0]
+        self.assertTrue(report.startswith('Profile report\n'))
+        self.assertIn('/api/rules/search', report)
+        self.assertIn('formatting', report)
+        self.assertIn('Throughput: 4 items', report)
+
+    @mock.patch('sonarqube_api.cmd.export_rules.sys.stdout', new_callable=StringIO)
+    @mock.patch('sonarqube_api.cmd.export_rules.sys.stderr', new_callable=StringIO)
+    def test_main_resume(self, stderr_mock, stdout_mock):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        with FakeSonarQube(rules=250) as server:
+            argv = ['export-sonarqube-rules', '--host', 'http://127.0.0.1',
+                    '--port', str(server.port), '--output-dir']
+            search = server.ROUTES[server.handler().RULES_LIST_ENDPOINT]
+
+            # Reference export
+            expected = os.path.join(tmp, 'expected')
+            os.mkdir(expected)
+            with mock.patch('sys.argv', argv + [expected]):
+                export_rules.main()
+
+            # Fails on the third page, leaving the checkpoint of the second
+            output = os.path.join(tmp, 'output')
+            os.mkdir(output)
+            failing = lambda srv, params: (503, None) if params.get('p') == '3' else search(srv, params)
+            with mock.patch.dict(server.ROUTES, {server.handler().RULES_LIST_ENDPOINT: failing}):
+                with mock.patch('sys.argv', argv + [output]):
+                    export_rules.main()
+            self.assertIn('Incomplete rules export: 200 exported', stdout_mock.getvalue())
+            with open(os.path.join(output, 'rules.checkpoint.json')) as f:
+                self.assertEqual(json.load(f)['page'], 2)
+
+            # Resume only fetches the rest, output is the same
+            del server.requests[:]
+            with mock.patch('sys.argv', argv + [output, '--resume']):
+                export_rules.main()
+            self.assertTrue(stdout_mock.getvalue().endswith('Complete rules export: 250 exported and 0 failed.\n'))
+            self.assertEqual(len(server.requests), 1)
+            self.assertFalse(os.path.exists(os.path.join(output, 'rules.checkpoint.json')))
+            for name in ('rules.csv', 'rules.html'):
+                with open(os.path.join(expected, name)) as f1, open(os.path.join(output, name)) as f2:
+                    self.assertEqual(f1.read(), f2.read())
+
+            # Checkpoint of other filters is refused
+            with mock.patch.dict(server.ROUTES, {server.handler().RULES_LIST_ENDPOINT: failing}):
+                with mock.patch('sys.argv', argv + [output]):
+                    export_rules.main()
+            with mock.patch('sys.argv', argv + [output, '--resume', '--languages', 'py']):
+                export_rules.main()
+            self.assertIn('is for other filters', stderr_mock.getvalue())
+
+    @mock.patch('sonarqube_api.cmd.export_rules.sys.stdout', new_callable=StringIO)
+    @mock.patch('sonarqube_api.cmd.export_rules.sys.stderr', new_callable=StringIO)
+    def test_main_resume_large_pages(self, stderr_mock, stdout_mock):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        with FakeSonarQube(rules=1500) as server:
+            # Pages over the server maximum are capped, to resume from its pages
+            argv = ['export-sonarqube-rules', '--host', 'http://127.0.0.1',
+                    '--port', str(server.port), '--page-size', '1000', '--output-dir']
+            search = server.ROUTES[SonarAPIHandler.RULES_LIST_ENDPOINT]
+            failing = lambda srv, params: (503, None) if params.get('p') == '3' else search(srv, params)
+            with mock.patch.dict(server.ROUTES, {SonarAPIHandler.RULES_LIST_ENDPOINT: failing}):
+                with mock.patch('sys.argv', argv + [tmp]):
+                    export_rules.main()
+            with open(os.path.join(tmp, 'rules.checkpoint.json')) as f:
+                checkpoint = json.load(f)
+            self.assertEqual((checkpoint['page'], checkpoint['filters']['page_size']), (2, 500))
+
+            with mock.patch('sys.argv', argv + [tmp, '--resume']):
+                export_rules.main()
+            with open(os.path.join(tmp, 'rules.csv')) as f:
+                keys = [row[1] for row in csv.reader(f)][1:]
+            self.assertEqual(len(keys), len(set(keys)))
+            self.assertEqual(sorted(keys), sorted(r['key'] for r in server.handler().get_rules()))
+
+        # Invalid sizes are refused
+        with mock.patch('sys.argv', argv + [tmp, '--page-size', '0']):
+            self.assertRaises(SystemExit, export_rules.main)
+
+    @mock.patch('sonarqube_api.cmd.export_rules.sys.stdout', new_callable=StringIO)
+    @mock.patch('sonarqube_api.cmd.export_rules.sys.stderr', new_callable=StringIO)
+    def test_main_sharded(self, stderr_mock, stdout_mock):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        with FakeSonarQube(rules=250) as server:
+            argv = ['export-sonarqube-rules', '--host', 'http://127.0.0.1',
+                    '--port', str(server.port), '--output-dir']
+            search = server.ROUTES[SonarAPIHandler.RULES_LIST_ENDPOINT]
+            outputs = {}
+            for name, options in (('single', []), ('workers', ['--workers', '2']),
+                                  ('sharded', ['--shard-by-language', '--workers', '2'])):
+                outputs[name] = os.path.join(tmp, name)
+                os.mkdir(outputs[name])
+                with mock.patch('sys.argv', argv + [outputs[name]] + options):
+                    export_rules.main()
+
+            # Same output rendering in processes
+            for fn in ('rules.csv', 'rules.html'):
+                with open(os.path.join(outputs['single'], fn)) as f1, \
+                        open(os.path.join(outputs['workers'], fn)) as f2:
+                    self.assertEqual(f1.read(), f2.read())
+
+            # Same rules by language, with an index
+            with open(os.path.join(outputs['single'], 'rules.csv')) as f:
+                rows = f.read().splitlines()
+            self.assertEqual(sorted(os.listdir(outputs['sharded'])), [
+                'index.html', 'rules-java.csv', 'rules-java.html', 'rules-js.csv',
+                'rules-js.html', 'rules-py.csv', 'rules-py.html'])
+            sharded = []
+            for lang in ('java', 'js', 'py'):
+                with open(os.path.join(outputs['sharded'], 'rules-{}.csv'.format(lang))) as f:
+                    self.assertEqual(f.readline(), rows[0] + '\n')
+                    sharded.extend(f.read().splitlines())
+                with open(os.path.join(outputs['sharded'], 'rules-{}.html'.format(lang))) as f:
+                    self.assertTrue(f.read().endswith('</body></html>'))
+            self.assertEqual(sorted(sharded), sorted(rows[1:]))
+            with open(os.path.join(outputs['sharded'], 'index.html')) as f:
+                self.assertIn('<li><a href="rules-py.html">Python</a>: 84 rules '
+                              '(<a href="rules-py.csv">CSV</a>)</li>', f.read())
+
+            # Resume sharded export
+            output = os.path.join(tmp, 'resumed')
+            os.mkdir(output)
+            failing = lambda srv, params: (503, None) if params.get('p') == '3' else search(srv, params)
+            with mock.patch.dict(server.ROUTES, {SonarAPIHandler.RULES_LIST_ENDPOINT: failing}):
+                with mock.patch('sys.argv', argv + [output, '--shard-by-language']):
+                    export_rules.main()
+            with mock.patch('sys.argv', argv + [output, '--shard-by-language', '--resume']):
+                export_rules.main()
+            self.assertTrue(stdout_mock.getvalue().endswith('Complete rules export: 250 exported and 0 failed.\n'))
+            for fn in os.listdir(outputs['sharded']):
+                with open(os.path.join(outputs['sharded'], fn)) as f1, open(os.path.join(output, fn)) as f2:
+                    self.assertEqual(f1.read(), f2.read())
+
+    @mock.patch('sonarqube_api.cmd.export_rules.sys.stdout', new_callable=StringIO)
+    @mock.patch('sonarqube_api.cmd.export_rules.sys.stderr', new_callable=StringIO)
+    def test_main_sharded_resume_large_pages(self, stderr_mock, stdout_mock):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        with FakeSonarQube(rules=1500) as server:
+            # Pages over the server maximum, resumed from the server pages
+            argv = ['export-sonarqube-rules', '--host', 'http://127.0.0.1',
+                    '--port', str(server.port), '--page-size', '1000',
+                    '--shard-by-language', '--output-dir']
+            expected = os.path.join(tmp, 'expected')
+            output = os.path.join(tmp, 'output')
+            os.mkdir(expected)
+            os.mkdir(output)
+            with mock.patch('sys.argv', argv + [expected]):
+                export_rules.main()
+
+            search = server.ROUTES[SonarAPIHandler.RULES_LIST_ENDPOINT]
+            failing = lambda srv, params: (503, None) if params.get('p') == '3' else search(srv, params)
+            with mock.patch.dict(server.ROUTES, {SonarAPIHandler.RULES_LIST_ENDPOINT: failing}):
+                with mock.patch('sys.argv', argv + [output]):
+                    export_rules.main()
+            with mock.patch('sys.argv', argv + [output, '--resume']):
+                export_rules.main()
+
+        # No duplicated rules in any shard
+        self.assertTrue(stdout_mock.getvalue().endswith('Complete rules export: 1500 exported and 0 failed.\n'))
+        self.assertEqual(sorted(os.listdir(output)), sorted(os.listdir(expected)))
+        for fn in os.listdir(expected):
+            with open(os.path.join(expected, fn)) as f1, open(os.path.join(output, fn)) as f2:
+                self.assertEqual(f1.read(), f2.read())
+
+
+class ExportIssuesTest(TestCase):
+
+    @mock.patch('sonarqube_api.cmd.export_issues.sys.stdout', new_callable=StringIO)
+    @mock.patch('sonarqube_api.cmd.export_issues.sys.stderr', new_callable=StringIO)
+    def test_main(self, stderr_mock, stdout_mock):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        with FakeSonarQube(issues=300) as server, \
+                mock.patch.object(SonarAPIHandler, 'ISSUES_LIMIT', 100), \
+                mock.patch.object(FakeSonarQube, 'ISSUES_LIMIT', 100):
+            argv = ['export-sonarqube-issues', '--host', 'http://127.0.0.1',
+                    '--port', str(server.port), '--page-size', '50']
+
+            # CSV by extension, sliced by date
+            output = os.path.join(tmp, 'issues.csv')
+            with mock.patch('sys.argv', argv + ['--output', output, '--severities', 'major,blocker']):
+                export_issues.main()
+            expected = sorted(i['key'] for i in server.issues if i['severity'] in ('MAJOR', 'BLOCKER'))
+            with open(output, 'r') as f:
+                rows = list(csv.DictReader(f))
+            self.assertEqual(sorted(row['key'] for row in rows), expected)
+            self.assertEqual(stdout_mock.getvalue(),
+                             'Complete issues export: {} exported.\n'.format(len(expected)))
+
+            # JSONL to stdout, results to stderr
+            stdout_mock.truncate(0)
+            stdout_mock.seek(0)
+            with mock.patch('sys.argv', argv + ['--workers', '1', '--resolved', 'true',
+                                                '--created-after', '2019-01-02']):
+                export_issues.main()
+            issues = [json.loads(line) for line in stdout_mock.getvalue().splitlines()]
+            self.assertEqual([i['key'] for i in issues],
+                             [i['key'] for i in server.issues if 'resolution' in i and
+                              i['creationDate'] >= '2019-01-02'])
+            self.assertEqual(stderr_mock.getvalue(),
+                             'Complete issues export: {} exported.\n'.format(len(issues)))
+
+            # Invalid dates fail
+            with mock.patch('sys.argv', argv + ['--created-after', 'yesterday']):
+                self.assertRaises(SystemExit, export_issues.main)
+            self.assertIn('Error: Invalid date: yesterday', stderr_mock.getvalue())
+
 
 class MigrateRulesTest(TestCase):
 
@@ -96,12 +358,14 @@ class MigrateRulesTest(TestCase):
     @mock.patch('sonarqube_api.cmd.export_rules.sys.stderr')
     @mock.patch('sonarqube_api.cmd.export_rules.argparse.ArgumentParser.parse_args')
     @mock.patch('sonarqube_api.api.SonarAPIHandler.get_rules')
-    @mock.patch('sonarqube_api.api.requests.Session.post')
+    @mock.patch('requests.Session.post')
     def test_main(self, post_mock, get_rules_mock, parse_mock, stderr_mock, stdout_mock):
         # Set call arguments: active only, spec profile and langs
         parse_mock.return_value = mock.MagicMock(
             source_host='localhost', source_port='9000', source_user='pancho', source_password='primero',
-            target_host='another.host', target_port='9000', target_user='pancho', target_password='primero',
+            target_host=['another.host'], target_port=['9000'], target_user=['pancho'],
+            target_password=['primero'], target_authtoken=None, target_basepath=None,
+            profile_report=False, timeout=None, deadline=None
         )
 
         # Set responses from source and target
@@ -133,6 +397,103 @@ class MigrateRulesTest(TestCase):
             "Complete rules migration: 1 created, 1 skipped (already existing) and 1 failed.\n"
         )
 
+    @mock.patch('sonarqube_api.cmd.migrate_rules.sys.stdout', new_callable=StringIO)
+    @mock.patch('sonarqube_api.cmd.migrate_rules.sys.stderr', new_callable=StringIO)
+    def test_main_targets(self, stderr_mock, stdout_mock):
+        with FakeSonarQube(rules=100, custom_ratio=0.2, latency=0.01) as source, \
+                FakeSonarQube(rules=0, latency=0.01) as t1, FakeSonarQube(rules=0, latency=0.01) as t2:
+            custom = [r for r in source.rules if 'templateKey' in r]
+            source.activations['prof'] = {r['key']: {'severity': r['severity'], 'params': []}
+                                          for r in custom}
+            t2.rules.append(dict(custom[0]))
+
+            # Single scan of the source, same rules in all targets
+            argv = ['migrate-sonarqube-rules', '--source-host', 'http://127.0.0.1',
+                    '--source-port', str(source.port),
+                    '--target-host', 'http://127.0.0.1', '--target-port', str(t1.port),
+                    '--target-host', 'http://127.0.0.1', '--target-port', str(t2.port)]
+            with mock.patch('sys.argv', argv):
+                migrate_rules.main()
+            self.assertEqual(len(source.requests), 1)
+            self.assertEqual([r['key'] for r in t1.rules], [r['key'] for r in custom])
+            self.assertEqual([r['key'] for r in t2.rules], [r['key'] for r in custom])
+
+            # Counters by target, as each one finishes
+            self.assertEqual(sorted(stdout_mock.getvalue().splitlines()), sorted([
+                'Complete rules migration to http://127.0.0.1:{}: {} created, 0 skipped '
+                '(already existing) and 0 failed.'.format(t1.port, len(custom)),
+                'Complete rules migration to http://127.0.0.1:{}: {} created, 1 skipped '
+                '(already existing) and 0 failed.'.format(t2.port, len(custom) - 1),
+            ]))
+
+            # Failures are reported by target
+            stdout_mock.truncate(0)
+            stdout_mock.seek(0)
+            create = t1.ROUTES[SonarAPIHandler.RULES_CREATE_ENDPOINT]
+            failing = lambda srv, params: (503, None) if srv is t1 else create(srv, params)
+            with mock.patch.dict(t1.ROUTES, {SonarAPIHandler.RULES_CREATE_ENDPOINT: failing}):
+                with mock.patch('sys.argv', argv):
+                    migrate_rules.main()
+            self.assertIn('Error in http://127.0.0.1:{}: '.format(t1.port), stderr_mock.getvalue())
+            self.assertEqual(sorted(stdout_mock.getvalue().splitlines()), [
+                'Complete rules migration to http://127.0.0.1:{}: 0 created, {} skipped '
+                '(already existing) and 0 failed.'.format(t2.port, len(custom)),
+                'Incomplete rules migration to http://127.0.0.1:{}: 0 created, 0 skipped '
+                '(already existing) and 0 failed.'.format(t1.port),
+            ])
+
+    @mock.patch('sonarqube_api.cmd.migrate_rules.sys.stderr', new_callable=StringIO)
+    def test_main_target_options(self, stderr_mock):
+        # Target options must be given once, or once by target
+        argv = ['migrate-sonarqube-rules', '--target-host', 'a', '--target-host', 'b',
+                '--target-host', 'c', '--target-port', '9001', '--target-port', '9002']
+        with mock.patch('sys.argv', argv):
+            with self.assertRaises(SystemExit) as ctx:
+                migrate_rules.main()
+        self.assertEqual(ctx.exception.code, 2)
+        self.assertIn('--target-port given 2 times, expected once or once by --target-host (3)',
+                      stderr_mock.getvalue())
+
+
+class SearchRulesTest(TestCase):
+
+    @mock.patch('sonarqube_api.cmd.search_rules.sys.stdout', new_callable=StringIO)
+    @mock.patch('sonarqube_api.cmd.search_rules.sys.stderr', new_callable=StringIO)
+    def test_main(self, stderr_mock, stdout_mock):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        index = os.path.join(tmp, 'rules.db')
+        with FakeSonarQube(rules=60) as server:
+            argv = ['search-sonarqube-rules', '--host', 'http://127.0.0.1',
+                    '--port', str(server.port), '--index', index]
+            with mock.patch('sys.argv', argv + ['build', '--languages', 'py,js']):
+                search_rules.main()
+            self.assertEqual(server.requests, [('GET', SonarAPIHandler.RULES_LIST_ENDPOINT)])
+
+        # Searches don't need the server
+        self.assertTrue(stdout_mock.getvalue().startswith('Indexed 40 rules in {} (fts'.format(index)))
+        stdout_mock.truncate(0)
+        stdout_mock.seek(0)
+        with mock.patch('sys.argv', argv + ['search', 'rule', 'number', '12']):
+            search_rules.main()
+        with mock.patch('sys.argv', argv + ['search', 'number', '--languages', 'java']):
+            search_rules.main()
+        with mock.patch('sys.argv', argv + ['--profile-report', 'search', 'tag3',
+                                            '--severities', 'minor,info']):
+            search_rules.main()
+        self.assertEqual(stdout_mock.getvalue(), u'py:S12\tMAJOR\tRule number 12\n'
+                                                 u'js:S10\tINFO\tRule number 10\n'
+                                                 u'js:S31\tMINOR\tRule number 31\n'
+                                                 u'py:S45\tINFO\tRule number 45\n')
+        self.assertIn('searching', stderr_mock.getvalue())
+
+        # Invalid raw queries are usage errors
+        with mock.patch('sys.argv', argv + ['search', '--raw', 'name:"rule']):
+            with self.assertRaises(SystemExit) as ctx:
+                search_rules.main()
+        self.assertEqual(ctx.exception.code, 2)
+        self.assertIn('Invalid search query', stderr_mock.getvalue())
+
 
 class ActivateRulesTest(TestCase):
 
@@ -140,13 +501,14 @@ class ActivateRulesTest(TestCase):
     @mock.patch('sonarqube_api.cmd.activate_rules.sys.stdout')
     @mock.patch('sonarqube_api.cmd.activate_rules.sys.stderr')
     @mock.patch('sonarqube_api.cmd.export_rules.argparse.ArgumentParser.parse_args')
-    @mock.patch('sonarqube_api.api.requests.Session.post')
+    @mock.patch('requests.Session.post')
     def test_main(self, post_mock, parse_mock, stderr_mock,
                   stdout_mock, open_mock):
         # Set call arguments
         parse_mock.return_value = mock.MagicMock(
             host='localhost', port='9000', user='pancho', password='primero',
-            profile_key='py-234345', filename='active-rules.csv', basepath=None
+            profile_key='py-234345', filename='active-rules.csv', basepath=None,
+            journal=None, diff=False, profile_report=False, timeout=None, deadline=None
         )
 
         # Mock file handlers
@@ -224,6 +586,128 @@ class ActivateRulesTest(TestCase):
         # Check stdout write: 3 exported and 1 failed
         stdout_mock.write.assert_called_once_with('Complete rules activation: 6 activated and 1 failed.\n')
 
+    @mock.patch('sonarqube_api.cmd.activate_rules.sys.stdout', new_callable=StringIO)
+    @mock.patch('sonarqube_api.cmd.activate_rules.sys.stderr', new_callable=StringIO)
+    def test_main_journal(self, stderr_mock, stdout_mock):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        filename = os.path.join(tmp, 'rules.csv')
+        journal = os.path.join(tmp, 'journal.tsv')
+        with open(filename, 'w') as f:
+            f.write('key,severity,message\n'
+                    'py:S0,MAJOR,\n'
+                    'js:S1,,Do not\n'
+                    'java:S2,so-so,\n'
+                    'py:S3,,\n')
+
+        with FakeSonarQube(rules=10) as server:
+            argv = ['activate-sonarqube-rules', 'prof', filename, '--journal', journal,
+                    '--host', 'http://127.0.0.1', '--port', str(server.port)]
+
+            # Server down after the first two rows
+            calls = []
+
+            def crash(srv, params):
+                calls.append(params['rule_key'])
+                return (503, None) if len(calls) > 2 else activate(srv, params)
+
+            activate = server.ROUTES[SonarAPIHandler.RULES_ACTIVATION_ENDPOINT]
+            with mock.patch.dict(server.ROUTES, {SonarAPIHandler.RULES_ACTIVATION_ENDPOINT: crash}):
+                with mock.patch('sys.argv', argv):
+                    activate_rules.main()
+            self.assertIn('Incomplete rules activation: 2 activated, 0 skipped', stdout_mock.getvalue())
+            with open(journal) as f:
+                self.assertEqual([line.split('\t')[:2] for line in f],
+                                 [['prof', 'py:S0'], ['prof', 'js:S1']])
+
+            # Re-run skips journaled rows, then failed rows are retried
+            del server.requests[:]
+            with mock.patch('sys.argv', argv):
+                activate_rules.main()
+            self.assertTrue(stdout_mock.getvalue().endswith(
+                'Complete rules activation: 1 activated, 2 skipped (journaled) and 1 failed.\n'))
+            self.assertEqual(len(server.requests), 2)
+            with mock.patch('sys.argv', argv):
+                activate_rules.main()
+            self.assertEqual(len(server.requests), 3)
+            self.assertEqual(sorted(server.activations['prof']), ['js:S1', 'py:S0', 'py:S3'])
+
+            # Changed values are applied again
+            with open(filename, 'a') as f:
+                f.write('py:S0,MINOR,\n')
+            with mock.patch('sys.argv', argv):
+                activate_rules.main()
+            self.assertEqual(server.activations['prof']['py:S0']['severity'], 'MINOR')
+
+    @mock.patch('sonarqube_api.cmd.activate_rules.sys.stdout', new_callable=StringIO)
+    @mock.patch('sonarqube_api.cmd.activate_rules.sys.stderr', new_callable=StringIO)
+    def test_main_diff(self, stderr_mock, stdout_mock):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        filename = os.path.join(tmp, 'rules.csv')
+        with open(filename, 'w') as f:
+            f.write('key,reset,severity,format\n'
+                    'py:S0,,major,^a$\n'
+                    'js:S1,,,\n'
+                    'java:S2,,minor,\n'
+                    'py:S3,yes,,\n'
+                    'js:S4,,,\n')
+
+        with FakeSonarQube(rules=10) as server:
+            # Current state: same values, other severity, other params, active
+            server.activations['prof'] = {
+                'py:S0': {'severity': 'MAJOR', 'params': [{'key': 'format', 'value': '^a$'}]},
+                'js:S1': {'severity': 'MINOR', 'params': []},
+                'java:S2': {'severity': 'CRITICAL', 'params': []},
+                'py:S3': {'severity': 'INFO', 'params': []},
+            }
+            server.activations['other'] = {'js:S4': {'severity': 'INFO', 'params': []}}
+            argv = ['activate-sonarqube-rules', 'prof', filename, '--diff',
+                    '--host', 'http://127.0.0.1', '--port', str(server.port)]
+
+            # Only changes are sent, resets always
+            with mock.patch('sys.argv', argv):
+                activate_rules.main()
+            self.assertEqual(stdout_mock.getvalue(),
+                             'Complete rules activation: 3 activated, 2 unchanged and 0 failed.\n')
+            self.assertEqual(server.requests[-3:], [('POST', SonarAPIHandler.RULES_ACTIVATION_ENDPOINT)] * 3)
+            self.assertEqual(server.activations['prof']['java:S2']['severity'], 'MINOR')
+            self.assertEqual(server.activations['prof']['py:S3']['severity'], 'CRITICAL')
+            self.assertIn('js:S4', server.activations['prof'])
+
+            # Nothing to do but resets on a second run
+            del server.requests[:]
+            with mock.patch('sys.argv', argv):
+                activate_rules.main()
+            self.assertTrue(stdout_mock.getvalue().endswith(
+                'Complete rules activation: 1 activated, 4 unchanged and 0 failed.\n'))
+            self.assertEqual(server.requests, [('GET', SonarAPIHandler.RULES_LIST_ENDPOINT),
+                                               ('POST', SonarAPIHandler.RULES_ACTIVATION_ENDPOINT)])
+
+
+class TablesFormattingTest(TestCase):
+
+    def test_rendering_timed(self):
+        # Tables are rendered in the formatting section, not when printed
+        from prettytable import PrettyTable
+        get_string = PrettyTable.get_string
+
+        def slow_get_string(table, **kwargs):
+            time.sleep(0.05)
+            return get_string(table, **kwargs)
+
+        profiler = Profiler()
+        with FakeSonarQube(users=5, groups=2) as server, \
+                mock.patch.object(PrettyTable, 'get_string', slow_get_string), \
+                mock.patch('sys.stdout', new_callable=StringIO) as stdout_mock:
+            h = server.handler()
+            users.run(h, argparse.Namespace(command='list', logins=None, deactivated=False), profiler)
+            groups.run(h, argparse.Namespace(command='list', fields=None, query=None), profiler)
+            groups.run(h, argparse.Namespace(command='list-users', gid=None, name='group0',
+                                             query=None), profiler)
+        self.assertTrue(profiler.sections['formatting'] >= 0.15)
+        self.assertIn('| Login', stdout_mock.getvalue())
+
 
 class UsersTest(TestCase):
     def setUp(self):
@@ -238,8 +722,8 @@ class UsersTest(TestCase):
         # Set call arguments for list
         parse_mock.return_value = argparse.Namespace(
             host=self.host, port=self.port, user=self.user,
-            password=self.password, authtoken=None, basepath=None,
-            command='list', deactivated=False, logins=None
+            password=self.password, authtoken=None, basepath=None, profile_report=False,
+            timeout=None, deadline=None, command='list', deactivated=False, logins=None
         )
         users.main()
 
@@ -248,8 +732,8 @@ class UsersTest(TestCase):
         # Set call arguments for create
         parse_mock.return_value = argparse.Namespace(
             host=self.host, port=self.port, user=self.user,
-            password=self.password, authtoken=None, basepath=None,
-            command='create', login=self.user_login, user_pass="qwerty",
+            password=self.password, authtoken=None, basepath=None, profile_report=False,
+            timeout=None, deadline=None, command='create', login=self.user_login, user_pass="qwerty",
             name="User From CLI", email=None
         )
         users.main()
@@ -257,8 +741,8 @@ class UsersTest(TestCase):
         # Set call arguments for update
         parse_mock.return_value = argparse.Namespace(
             host=self.host, port=self.port, user=self.user,
-            password=self.password, authtoken=None, basepath=None,
-            command='update', login=self.user_login, name=None,
+            password=self.password, authtoken=None, basepath=None, profile_report=False,
+            timeout=None, deadline=None, command='update', login=self.user_login, name=None,
             email="cli_user@example.com"
         )
         users.main()
@@ -266,8 +750,8 @@ class UsersTest(TestCase):
         # Set call arguments for deactivate
         parse_mock.return_value = argparse.Namespace(
             host=self.host, port=self.port, user=self.user,
-            password=self.password, authtoken=None, basepath=None,
-            command='deactivate', login=self.user_login
+            password=self.password, authtoken=None, basepath=None, profile_report=False,
+            timeout=None, deadline=None, command='deactivate', login=self.user_login
         )
         users.main()
 
@@ -293,8 +777,8 @@ class GroupsTest(TestCase):
     def test_cmd_list_groups(self, parse_mock):
         parse_mock.return_value = argparse.Namespace(
             host=self.host, port=self.port, user=self.user,
-            password=self.password, authtoken=None, basepath=None,
-            command='list', fields=None, query=None
+            password=self.password, authtoken=None, basepath=None, profile_report=False,
+            timeout=None, deadline=None, command='list', fields=None, query=None
         )
         groups.main()
 
@@ -303,8 +787,8 @@ class GroupsTest(TestCase):
     def test_cmd_create_group(self, parse_mock):
         parse_mock.return_value = argparse.Namespace(
             host=self.host, port=self.port, user=self.user,
-            password=self.password, authtoken=None, basepath=None,
-            command='create', name=self.test_group, description=None
+            password=self.password, authtoken=None, basepath=None, profile_report=False,
+            timeout=None, deadline=None, command='create', name=self.test_group, description=None
         )
         groups.main()
 
@@ -314,16 +798,16 @@ class GroupsTest(TestCase):
         res = self.sonar.create_group(str(uuid.uuid1())).json()
         parse_mock.return_value = argparse.Namespace(
             host=self.host, port=self.port, user=self.user,
-            password=self.password, authtoken=None, basepath=None,
-            command='update', gid=res['group']['id'],
+            password=self.password, authtoken=None, basepath=None, profile_report=False,
+            timeout=None, deadline=None, command='update', gid=res['group']['id'],
             name=None, description='Awesome group'
         )
         groups.main()
 
         parse_mock.return_value = argparse.Namespace(
             host=self.host, port=self.port, user=self.user,
-            password=self.password, authtoken=None, basepath=None,
-            command='delete', gid=res['group']['id'], name=None
+            password=self.password, authtoken=None, basepath=None, profile_report=False,
+            timeout=None, deadline=None, command='delete', gid=res['group']['id'], name=None
         )
         groups.main()
 
@@ -333,16 +817,16 @@ class GroupsTest(TestCase):
         res = self.sonar.create_group(str(uuid.uuid1())).json()
         parse_mock.return_value = argparse.Namespace(
             host=self.host, port=self.port, user=self.user,
-            password=self.password, authtoken=None, basepath=None,
-            command='add-user', login=self.test_user['login'],
+            password=self.password, authtoken=None, basepath=None, profile_report=False,
+            timeout=None, deadline=None, command='add-user', login=self.test_user['login'],
             name=res['group']['name'], gid=None
         )
         groups.main()
 
         parse_mock.return_value = argparse.Namespace(
             host=self.host, port=self.port, user=self.user,
-            password=self.password, authtoken=None, basepath=None,
-            command='remove-user', login=self.test_user['login'],
+            password=self.password, authtoken=None, basepath=None, profile_report=False,
+            timeout=None, deadline=None, command='remove-user', login=self.test_user['login'],
             name=res['group']['name'], gid=None
         )
         groups.main()
@@ -356,10 +840,70 @@ class GroupsTest(TestCase):
                                   name=res['group']['name'])
         parse_mock.return_value = argparse.Namespace(
             host=self.host, port=self.port, user=self.user,
-            password=self.password, authtoken=None, basepath=None,
-            command='list-users', name=res['group']['name'],
+            password=self.password, authtoken=None, basepath=None, profile_report=False,
+            timeout=None, deadline=None, command='list-users', name=res['group']['name'],
             gid=None, query=None
         )
         groups.main()
         self.sonar.delete_group(name=res['group']['name'])
 
+
+class SonarqubeTest(TestCase):
+    def setUp(self):
+        self.server = FakeSonarQube(rules=30, users=2, groups=1).start()
+        self.argv = ['sonarqube', '--host', 'http://127.0.0.1', '--port', str(self.server.port)]
+
+    def tearDown(self):
+        self.server.stop()
+
+    @mock.patch('sonarqube_api.cmd.sonarqube.sys.stdout', new_callable=StringIO)
+    @mock.patch('sonarqube_api.cmd.sonarqube.sys.stderr', new_callable=StringIO)
+    def test_single_operation(self, stderr_mock, stdout_mock):
+        with mock.patch('sys.argv', self.argv + ['groups', 'create', 'devs']):
+            sonarqube.main()
+        self.assertIn('devs', self.server.groups)
+
+    @mock.patch('sonarqube_api.cmd.sonarqube.sys.stdin')
+    @mock.patch('sonarqube_api.cmd.sonarqube.sys.stdout', new_callable=StringIO)
+    @mock.patch('sonarqube_api.cmd.sonarqube.sys.stderr', new_callable=StringIO)
+    def test_script(self, stderr_mock, stdout_mock, stdin_mock):
+        stdin_mock.__iter__.return_value = [
+            u'# Provisioning\n',
+            u'users create jdoe secret "John Doe" --email jdoe@example.com\n',
+            u'\n',
+            u'groups create devs\n',
+            u'groups add-user jdoe --name devs  # membership\n',
+            u'users frobnicate jdoe\n',
+            u'groups add-user nobody --name devs\n',
+            u'users deactivate user0\n',
+        ]
+
+        # Keep going after errors: invalid line and unknown user
+        with mock.patch('sys.argv', self.argv + ['run', '--keep-going']):
+            self.assertRaises(SystemExit, sonarqube.main)
+        self.assertEqual(self.server.users['jdoe']['email'], 'jdoe@example.com')
+        self.assertEqual(self.server.groups['devs']['members'], {'jdoe'})
+        self.assertFalse(self.server.users['user0']['active'])
+        self.assertEqual(stderr_mock.getvalue().splitlines(), [
+            "Error in line 6: argument command: invalid choice: 'frobnicate' "
+            "(choose from 'list', 'create', 'update', 'deactivate')",
+            "Error in line 7: Not Found",
+        ])
+        self.assertTrue(stdout_mock.getvalue().endswith(
+            'Complete script: 6 operations run and 2 failed.\n'))
+
+        # All calls over a single session
+        self.assertEqual(len(self.server.requests), 5)
+
+    @mock.patch('sonarqube_api.cmd.sonarqube.sys.stdout', new_callable=StringIO)
+    @mock.patch('sonarqube_api.cmd.sonarqube.sys.stderr', new_callable=StringIO)
+    @mock.patch('sonarqube_api.cmd.sonarqube.open', create=True)
+    def test_script_stops(self, open_mock, stderr_mock, stdout_mock):
+        open_mock.return_value = StringIO(u'groups delete --name nope\ngroups create devs\n')
+
+        # Stops at first failure by default
+        with mock.patch('sys.argv', self.argv + ['run', 'script.txt']):
+            self.assertRaises(SystemExit, sonarqube.main)
+        open_mock.assert_called_once_with('script.txt', 'r')
+        self.assertNotIn('devs', self.server.groups)
+        self.assertEqual(stdout_mock.getvalue(), 'Incomplete script: 1 operations run and 1 failed.\n')
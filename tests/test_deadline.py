@@ -0,0 +1,100 @@
+__author__ = 'kako'
+
+import threading
+import time
+from unittest import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from sonarqube_api import SonarAPIHandler
+from sonarqube_api.deadline import bound_timeout, deadline, remaining
+from sonarqube_api.exceptions import DeadlineExceeded
+from sonarqube_api.fakeserver import FakeSonarQube
+from sonarqube_api.utils import parse_timeout
+
+
+class DeadlineTest(TestCase):
+
+    def test_remaining(self):
+        self.assertIsNone(remaining())
+        with deadline(10):
+            self.assertTrue(9 < remaining() <= 10)
+
+            # Nested deadlines can only shorten it
+            with deadline(100):
+                self.assertTrue(remaining() <= 10)
+            with deadline(1):
+                self.assertTrue(remaining() <= 1)
+            with deadline(None):
+                self.assertTrue(9 < remaining() <= 10)
+            self.assertTrue(9 < remaining() <= 10)
+
+            # Other threads are not affected
+            others = []
+            thread = threading.Thread(target=lambda: others.append(remaining()))
+            thread.start()
+            thread.join()
+            self.assertEqual(others, [None])
+
+        self.assertIsNone(remaining())
+
+    def test_bound_timeout(self):
+        self.assertEqual(bound_timeout(None, None), None)
+        self.assertEqual(bound_timeout(5, None), 5)
+        self.assertEqual(bound_timeout(None, 2), 2)
+        self.assertEqual(bound_timeout(5, 2), 2)
+        self.assertEqual(bound_timeout((3, 30), 10), (3, 10))
+        self.assertEqual(bound_timeout((3, None), 10), (3, 10))
+        self.assertEqual(parse_timeout('5'), 5.0)
+        self.assertEqual(parse_timeout('3.05,27'), (3.05, 27.0))
+
+    @mock.patch('requests.Session.get')
+    def test_timeout(self, get_mock):
+        get_mock.return_value = mock.MagicMock(status_code=200, json=mock.MagicMock(
+            return_value={'valid': True}))
+
+        # Not passed unless configured
+        h = SonarAPIHandler()
+        h.validate_authentication()
+        get_mock.assert_called_with('http://localhost:9000/api/authentication/validate', params={})
+
+        # Configured, and limited by the deadline
+        h = SonarAPIHandler(timeout=(3, 30))
+        h.validate_authentication()
+        get_mock.assert_called_with('http://localhost:9000/api/authentication/validate',
+                                    params={}, timeout=(3, 30))
+        with deadline(10):
+            h.validate_authentication()
+        connect, read = get_mock.call_args[1]['timeout']
+        self.assertEqual(connect, 3)
+        self.assertTrue(9 < read <= 10)
+
+        # Expired before the call
+        get_mock.reset_mock()
+        with deadline(0):
+            self.assertRaises(DeadlineExceeded, h.validate_authentication)
+        self.assertFalse(get_mock.called)
+
+    def test_scan(self):
+        # Budget shared by all the pages of the scan
+        with FakeSonarQube(rules=1000, latency=0.05) as server:
+            h = server.handler()
+            h.validate_authentication()
+            start = time.time()
+            with deadline(0.3):
+                self.assertRaises(DeadlineExceeded, list, h.get_rules())
+            self.assertTrue(time.time() - start < 1)
+            self.assertTrue(2 < len(server.requests) < 11)
+
+    def test_stalled_server(self):
+        # A call timed out because of the deadline raises DeadlineExceeded
+        with FakeSonarQube(rules=10, latency=5) as server:
+            h = server.handler(timeout=60)
+            start = time.time()
+            with deadline(0.2):
+                self.assertRaises(DeadlineExceeded, h.validate_authentication)
+            self.assertTrue(time.time() - start < 1)
+            server.latency = 0
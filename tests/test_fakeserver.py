@@ -0,0 +1,78 @@
+__author__ = 'kako'
+
+from unittest import TestCase
+
+from sonarqube_api.exceptions import ServerError, ValidationError
+from sonarqube_api.fakeserver import FakeSonarQube
+
+
+class FakeSonarQubeTest(TestCase):
+
+    def setUp(self):
+        self.server = FakeSonarQube(rules=250, metrics=40, users=5, groups=2).start()
+        self.h = self.server.handler(user='admin', password='admin')
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_paging(self):
+        # Rules and metrics are paged (100 by default)
+        self.assertEqual(len(list(self.h.get_rules())), 250)
+        self.assertEqual(self.server.requests, [('GET', self.h.RULES_LIST_ENDPOINT)] * 3)
+        self.assertEqual(len(list(self.h.get_metrics())), 40)
+
+        # Filters are applied
+        rules = list(self.h.get_rules(languages='py'))
+        self.assertEqual(len(rules), 84)
+        self.assertEqual(set(r['lang'] for r in rules), {'py'})
+        custom = list(self.h.get_rules(custom_only=True))
+        self.assertTrue(custom)
+        self.assertTrue(all('templateKey' in r for r in custom))
+
+    def test_rules(self):
+        # Activation in profile
+        self.h.activate_rule('py:S0', 'prof1', severity='major', format='^a$')
+        self.assertEqual([r['key'] for r in self.h.get_rules(profile='prof1')], ['py:S0'])
+        self.assertEqual(self.server.activations['prof1']['py:S0'],
+                         {'severity': 'MAJOR', 'params': [{'key': 'format', 'value': '^a$'}]})
+        with self.assertRaises(ValidationError):
+            self.h.activate_rule('py:S0', 'prof1', severity='so-so')
+
+        # Rule creation, fails if already existing
+        self.h.create_rule('X1', 'New rule', 'Desc', 'Message', '//a', 'MAJOR', 'READY', 'py:XPath')
+        with self.assertRaises(ValidationError) as ctx:
+            self.h.create_rule('X1', 'New rule', 'Desc', 'Message', '//a', 'MAJOR', 'READY', 'py:XPath')
+        self.assertIn('already exists', str(ctx.exception))
+
+    def test_users_groups(self):
+        self.assertEqual(len(self.h.get_users().json()['users']), 5)
+        self.h.create_user('lala', 'secret', 'La La')
+        self.h.deactivate_user('user0')
+        self.assertEqual(len(self.h.get_users().json()['users']), 5)
+        self.assertEqual(len(self.h.get_users(include_deactivated=True).json()['users']), 6)
+
+        group = self.h.create_group('devs').json()['group']
+        self.assertEqual(self.h.add_user_group('lala', gid=group['id']).status_code, 204)
+        self.assertEqual(self.h.get_group_users(name='devs').json()['users'][0]['login'], 'lala')
+        self.assertEqual(self.h.delete_group(name='devs').status_code, 204)
+        self.assertEqual(len(self.h.get_groups().json()['groups']), 2)
+
+    def test_errors(self):
+        self.server.error_rate = 1
+        with self.assertRaises(ServerError):
+            self.h.validate_authentication()
+
+
+class BenchmarksTest(TestCase):
+
+    def test_run(self):
+        from benchmarks.suite import BENCHMARKS, compare, run
+
+        # Run all benchmarks with a small dataset
+        results = run(rules=30, startup_runs=1)
+        self.assertEqual(sorted(results), sorted(f.__name__ for f in BENCHMARKS))
+        self.assertEqual(results['get_rules_scan']['items'], 30)
+
+        # Compare with a much faster baseline
+        baseline = {'get_rules_scan': dict(results['get_rules_scan'], items_per_sec=10 ** 9)}
+        self.assertEqual([r[0] for r in compare(results, baseline, 0.2)], ['get_rules_scan'])
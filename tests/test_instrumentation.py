@@ -0,0 +1,117 @@
+__author__ = 'kako'
+
+from unittest import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from sonarqube_api import SonarAPIHandler
+from sonarqube_api.exceptions import ServerError
+from sonarqube_api.instrumentation import DecodeEvent, Profiler, RequestEvent, RequestStatsCollector
+
+
+class RequestHooksTest(TestCase):
+
+    def setUp(self):
+        self.h = SonarAPIHandler(user='admin', password='admin')
+        self.events = []
+        self.h.add_hook(self.events.append)
+
+    @mock.patch('requests.Session.get')
+    def test_events(self, mock_get):
+        mock_get.return_value = mock.MagicMock(status_code=200, content=b'{"valid": true}')
+        self.h._make_call('get', self.h.METRICS_LIST_ENDPOINT, p=2)
+
+        # One event with the call data
+        event, = self.events
+        self.assertEqual(event.endpoint, self.h.METRICS_LIST_ENDPOINT)
+        self.assertEqual(event.method, 'GET')
+        self.assertEqual(event.status, 200)
+        self.assertEqual(event.request_bytes, len('p=2'))
+        self.assertEqual(event.response_bytes, 15)
+        self.assertIsNone(event.error)
+
+        # Error responses also fire events
+        mock_get.return_value = mock.MagicMock(status_code=503, content=b'', reason='Unavailable')
+        self.assertRaises(ServerError, self.h._make_call, 'get', self.h.METRICS_LIST_ENDPOINT)
+        self.assertEqual(self.events[-1].status, 503)
+
+        # And so do connection errors, without status
+        mock_get.side_effect = IOError('Connection refused')
+        self.assertRaises(IOError, self.h._make_call, 'get', self.h.METRICS_LIST_ENDPOINT)
+        self.assertIsNone(self.events[-1].status)
+        self.assertIsInstance(self.events[-1].error, IOError)
+
+        # Decoding fires its own event
+        self.h.decode(mock.MagicMock(json=mock.MagicMock(return_value={})))
+        self.assertIsInstance(self.events[-1], DecodeEvent)
+        self.events.pop()
+
+        # No more events once removed
+        self.h.remove_hook(self.events.append)
+        self.assertRaises(IOError, self.h._make_call, 'get', self.h.METRICS_LIST_ENDPOINT)
+        self.assertEqual(len(self.events), 3)
+
+
+class RequestStatsCollectorTest(TestCase):
+
+    def test_export_prometheus(self):
+        stats = RequestStatsCollector(buckets=(0.1, 1))
+        stats(RequestEvent('/api/rules/search', 'GET', 200, 10, 1000, 0.05))
+        stats(RequestEvent('/api/rules/search', 'GET', 200, 10, 3000, 0.5))
+        stats(RequestEvent('/api/rules/search', 'GET', None, 10, 0, 2.0, IOError()))
+        stats('some other event')
+
+        text = stats.export_prometheus()
+        self.assertIn('# TYPE sonarqube_api_requests_total counter\n', text)
+        self.assertIn('sonarqube_api_requests_total{endpoint="/api/rules/search",'
+                      'method="GET",status="200"} 2\n', text)
+        self.assertIn('sonarqube_api_requests_total{endpoint="/api/rules/search",'
+                      'method="GET",status="error"} 1\n', text)
+
+        # Histogram buckets are cumulative
+        self.assertIn('# TYPE sonarqube_api_request_duration_seconds histogram\n', text)
+        for le, count in (('0.1', 1), ('1.0', 2), ('+Inf', 3)):
+            self.assertIn('sonarqube_api_request_duration_seconds_bucket{endpoint="/api/rules/search",'
+                          'le="%s",method="GET"} %d\n' % (le, count), text)
+        self.assertIn('sonarqube_api_request_duration_seconds_sum{endpoint="/api/rules/search",'
+                      'method="GET"} 2.55\n', text)
+        self.assertIn('sonarqube_api_request_duration_seconds_count{endpoint="/api/rules/search",'
+                      'method="GET"} 3\n', text)
+        self.assertIn('sonarqube_api_response_bytes_total{endpoint="/api/rules/search",'
+                      'method="GET"} 4000\n', text)
+
+        # Reset clears everything
+        stats.reset()
+        self.assertNotIn('/api/rules/search', stats.export_prometheus())
+
+
+class ProfilerTest(TestCase):
+
+    def test_percentile(self):
+        samples = [1, 2, 3, 4]
+        self.assertEqual(Profiler.percentile(samples, 50), 2)
+        self.assertEqual(Profiler.percentile(samples, 95), 4)
+        self.assertEqual(Profiler.percentile([1, 2], 50), 1)
+        self.assertEqual(Profiler.percentile([], 99), 0.0)
+
+    def test_report(self):
+        profiler = Profiler()
+        profiler(RequestEvent('/api/rules/search', 'GET', 200, 10, 1000, 0.01))
+        profiler(RequestEvent('/api/rules/search', 'GET', 200, 10, 1000, 0.03))
+        profiler(DecodeEvent(0.002))
+        with profiler.timer('formatting'):
+            profiler.count(20)
+
+        self.assertAlmostEqual(profiler.sections['network'], 0.04)
+        self.assertAlmostEqual(profiler.sections['decoding'], 0.002)
+        self.assertIn('formatting', profiler.sections)
+
+        report = profiler.report().splitlines()
+        self.assertEqual(report[0], 'Profile report')
+        self.assertEqual(report[2].split(), ['/api/rules/search', '2', '10.0', '30.0', '30.0'])
+        self.assertTrue(report[3].startswith('Time: '))
+        self.assertIn('network 0.040s', report[3])
+        self.assertTrue(report[4].startswith('Throughput: 20 items'))
@@ -0,0 +1,120 @@
+__author__ = 'kako'
+
+from io import StringIO
+from unittest import TestCase
+import csv
+import datetime
+import json
+import threading
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from sonarqube_api.api import SonarAPIHandler
+from sonarqube_api.exceptions import ValidationError
+from sonarqube_api.fakeserver import FakeSonarQube
+from sonarqube_api.issues import format_date, parse_date, write_csv, write_jsonl
+
+
+class DatesTest(TestCase):
+
+    def test_parse_date(self):
+        self.assertEqual(parse_date('2017-10-19'), datetime.datetime(2017, 10, 19))
+        self.assertEqual(parse_date('2017-10-19T13:30:00+0200'), datetime.datetime(2017, 10, 19, 11, 30))
+        self.assertEqual(parse_date('2017-10-19T13:30:00-03:00'), datetime.datetime(2017, 10, 19, 16, 30))
+        self.assertEqual(parse_date(datetime.date(2017, 10, 19)), datetime.datetime(2017, 10, 19))
+        self.assertEqual(parse_date(datetime.datetime(2017, 10, 19, 1)), datetime.datetime(2017, 10, 19, 1))
+        self.assertRaises(ValueError, parse_date, '19/10/2017')
+
+    def test_format_date(self):
+        date = datetime.datetime(2017, 10, 19, 11, 30, 5)
+        self.assertEqual(format_date(date), '2017-10-19T11:30:05+0000')
+        self.assertEqual(parse_date(format_date(date)), date)
+
+
+@mock.patch.object(FakeSonarQube, 'ISSUES_LIMIT', 200)
+@mock.patch.object(SonarAPIHandler, 'ISSUES_LIMIT', 200)
+class IssuesScanTest(TestCase):
+
+    def setUp(self):
+        # A fifth of the issues are created at once, over the limit
+        self.server = FakeSonarQube(issues=1500, first_analysis_ratio=0.2).start()
+        self.h = self.server.handler()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def keys(self, issues):
+        return sorted(i['key'] for i in issues)
+
+    def test_get_issues(self):
+        # All issues, sliced by date and severity, in order of creation
+        issues = list(self.h.get_issues(page_size=100))
+        self.assertEqual(self.keys(issues), self.keys(self.server.issues))
+        dates = [i['creationDate'] for i in issues]
+        self.assertEqual(dates, sorted(dates))
+        self.assertNotIn('created', issues[0])
+
+        # Every page under the limit
+        self.assertTrue(len(self.server.requests) > 1500 // 200)
+
+    def test_get_issues_concurrently(self):
+        issues = list(self.h.get_issues(page_size=100, max_workers=8))
+        self.assertEqual(self.keys(issues), self.keys(self.server.issues))
+
+    def test_get_issues_filters(self):
+        issues = list(self.h.get_issues(projects=['project:1', 'project:2'], severities='major,minor',
+                                        resolved=False, created_after='2019-06-01',
+                                        created_before=datetime.datetime(2020, 6, 1)))
+        expected = [i for i in self.server.issues
+                    if i['project'] in ('project:1', 'project:2') and
+                    i['severity'] in ('MAJOR', 'MINOR') and 'resolution' not in i and
+                    datetime.datetime(2019, 6, 1) <= i['created'] < datetime.datetime(2020, 6, 1)]
+        self.assertTrue(expected)
+        self.assertEqual(self.keys(issues), self.keys(expected))
+
+    def test_get_issues_unsplittable(self):
+        # Over the limit created at once with a single severity
+        with mock.patch.object(SonarAPIHandler, 'ISSUES_LIMIT', 20), \
+                mock.patch.object(FakeSonarQube, 'ISSUES_LIMIT', 20):
+            self.assertRaises(ValidationError, list, self.h.get_issues(page_size=10))
+            self.assertRaises(ValidationError, list, self.h.get_issues(page_size=10, max_workers=4))
+
+    def test_get_issues_close(self):
+        issues = self.h.get_issues(page_size=50, max_workers=4)
+        first = [next(issues) for _ in range(10)]
+        issues.close()
+        self.assertEqual(len(set(i['key'] for i in first)), 10)
+
+        # Workers stop fetching
+        threading.Event().wait(0.2)
+        calls = len(self.server.requests)
+        threading.Event().wait(0.2)
+        self.assertEqual(len(self.server.requests), calls)
+        self.assertTrue(calls < 1500 // 50)
+
+
+class WritersTest(TestCase):
+
+    ISSUES = [
+        {'key': 'issue-1', 'rule': 'py:S1', 'severity': 'MAJOR', 'tags': ['tag1', 'tag2'],
+         'message': u'Rename "caf\xe9"', 'line': 12},
+        {'key': 'issue-2', 'rule': 'py:S2', 'severity': 'INFO', 'resolution': 'FIXED'},
+    ]
+
+    def test_write_jsonl(self):
+        f = StringIO()
+        self.assertEqual(write_jsonl(iter(self.ISSUES), f), 2)
+        self.assertEqual([json.loads(line) for line in f.getvalue().splitlines()], self.ISSUES)
+
+    def test_write_csv(self):
+        f = StringIO()
+        self.assertEqual(write_csv(iter(self.ISSUES), f, fields=('key', 'tags', 'message', 'line')), 2)
+        f.seek(0)
+        self.assertEqual(list(csv.reader(f)), [
+            ['key', 'tags', 'message', 'line'],
+            ['issue-1', 'tag1;tag2', u'Rename "caf\xe9"', '12'],
+            ['issue-2', '', '', ''],
+        ])
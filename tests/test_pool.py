@@ -0,0 +1,70 @@
+__author__ = 'kako'
+
+import time
+from unittest import TestCase
+
+from sonarqube_api.deadline import deadline
+from sonarqube_api.exceptions import DeadlineExceeded
+from sonarqube_api.fakeserver import FakeSonarQube
+from sonarqube_api.pool import SonarAPIPool
+
+
+class SonarAPIPoolTest(TestCase):
+
+    def setUp(self):
+        self.servers = [FakeSonarQube(rules=300 + 100 * i, latency=0.02, seed=i).start()
+                        for i in range(2)]
+        self.pool = SonarAPIPool({
+            'a': self.servers[0].handler(),
+            'b': {'host': 'http://127.0.0.1', 'port': self.servers[1].port},
+            # Nothing listening
+            'down': {'host': 'http://127.0.0.1', 'port': 1},
+        })
+
+    def tearDown(self):
+        self.pool.close()
+        for server in self.servers:
+            server.stop()
+
+    def test_call(self):
+        # Items streamed by server, failures isolated
+        items = {}
+        errors = {}
+        for server, rule, error in self.pool.call('get_rules'):
+            if error is not None:
+                errors[server] = error
+            else:
+                items.setdefault(server, []).append(rule['key'])
+        self.assertEqual(len(items['a']), 300)
+        self.assertEqual(len(items['b']), 400)
+        self.assertEqual(list(errors), ['down'])
+
+        # Calls are concurrent: 4 pages, not 7
+        start = time.time()
+        results = self.pool.gather('get_rules')
+        self.assertLess(time.time() - start, 0.2)
+        self.assertEqual([r['key'] for r in results['a'].value], items['a'])
+        self.assertEqual([r['key'] for r in results['b'].value], items['b'])
+        self.assertIsNotNone(results['down'].error)
+
+        # Single values
+        results = self.pool.gather('validate_authentication')
+        self.assertTrue(results['a'].value)
+        self.assertTrue(results['b'].value)
+        self.assertIsNone(results['down'].value)
+
+    def test_close(self):
+        # Closing the results stops the scans
+        results = self.pool.call('get_rules')
+        next(results)
+        results.close()
+        self.pool.close()
+        self.assertLess(sum(len(s.requests) for s in self.servers), 7)
+
+        # Deadline of the caller applies to all servers
+        pool = SonarAPIPool([s.handler() for s in self.servers])
+        with deadline(0.05):
+            results = pool.gather('get_rules')
+        self.assertEqual(sorted(results), sorted(s.handler()._get_url('') for s in self.servers))
+        self.assertTrue(all(isinstance(r.error, DeadlineExceeded) for r in results.values()))
+        pool.close()
@@ -0,0 +1,141 @@
+__author__ = 'kako'
+
+import os
+import shutil
+import sqlite3
+import tempfile
+from unittest import TestCase
+
+from sonarqube_api.exceptions import ValidationError
+from sonarqube_api.fakeserver import FakeSonarQube
+from sonarqube_api.search import RuleIndex, RuleSearchIndex, html_text
+
+
+class RuleSearchIndexTest(TestCase):
+
+    def setUp(self):
+        with FakeSonarQube(rules=60) as server:
+            self.rules = list(server.handler().get_rules())
+        self.index = RuleSearchIndex()
+        self.index.build(self.rules)
+
+    def tearDown(self):
+        self.index.close()
+
+    def test_html_text(self):
+        self.assertEqual(html_text('<p>Use <code>a &lt; b</code>\n  instead</p>'),
+                         'Use a < b instead')
+        self.assertEqual(html_text(None), '')
+
+    def test_search(self):
+        # Words in names and descriptions, keys and tags
+        self.assertEqual([r['key'] for r in self.index.search('number 12')], ['py:S12'])
+        self.assertEqual(self.index.search('js:S13'), [self.rules[13]])
+        self.assertEqual(sorted(r['key'] for r in self.index.search('tag3')),
+                         sorted(r['key'] for r in self.rules if 'tag3' in r['sysTags']))
+
+        # HTML is not indexed, words in it are
+        self.assertEqual(self.index.search('p'), [])
+        self.assertEqual(len(self.index.search('some text', limit=None)), 60)
+        self.assertEqual(len(self.index.search('some text')), 50)
+        self.assertEqual(len(self.index.search('descr*', limit=None)), 60)
+
+        # Filters
+        found = self.index.search('description', languages='PY,java', severities=['major'],
+                                  limit=None)
+        self.assertEqual(sorted(r['key'] for r in found), sorted(
+            r['key'] for r in self.rules
+            if r['lang'] in ('py', 'java') and r['severity'] == 'MAJOR'))
+
+        # Raw queries
+        self.assertEqual([r['key'] for r in self.index.search('name:"rule number 7"', raw=True)],
+                         ['js:S7'])
+        self.assertRaises(ValidationError, self.index.search, 'name:"rule', raw=True)
+
+    def test_build(self):
+        self.assertEqual(self.index.get('py:S0'), self.rules[0])
+        self.assertEqual(self.index.info()['count'], 60)
+
+        # Replaces the previous rules
+        self.assertEqual(self.index.build(self.rules[:10]), 10)
+        self.assertEqual(self.index.info()['count'], 10)
+        self.assertIsNone(self.index.get('py:S30'))
+        self.assertEqual(len(self.index.search('description', limit=None)), 10)
+
+    def test_fts4(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, 'rules.db')
+
+        # Index created with fts4 (ie: by an older SQLite) is reused
+        db = sqlite3.connect(path)
+        db.execute('CREATE VIRTUAL TABLE rules_fts USING fts4(key, name, tags, description)')
+        db.close()
+        with RuleSearchIndex(path) as index:
+            self.assertEqual(index.fts, 'fts4')
+            index.build(self.rules)
+            self.assertEqual([r['key'] for r in index.search('number 12')], ['py:S12'])
+            self.assertEqual(len(index.search('descr*', limit=None)), 60)
+
+        # Persisted
+        with RuleSearchIndex(path) as index:
+            self.assertEqual(index.info()['count'], 60)
+            self.assertEqual(index.get('py:S0'), self.rules[0])
+
+
+class RuleIndexTest(TestCase):
+
+    def setUp(self):
+        self.server = FakeSonarQube(rules=120, custom_ratio=0.2).start()
+        self.h = self.server.handler()
+        for i, rule in enumerate(self.h.get_rules()):
+            if i % 3 == 0:
+                self.h.activate_rule(rule['key'], 'prof1')
+            if i % 5 == 0:
+                self.h.activate_rule(rule['key'], 'prof2')
+        self.index = RuleIndex.from_handler(self.h, page_size=50)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_get_rules(self):
+        self.assertEqual(len(self.index), 120)
+        self.assertTrue(self.index.custom)
+
+        # Same rules than the server, in the same order
+        for filters in ({}, {'active_only': True}, {'profile': 'prof1'},
+                        {'profile': 'prof2', 'languages': 'py,JS'},
+                        {'languages': ['java']}, {'custom_only': True},
+                        {'active_only': True, 'custom_only': True, 'languages': 'py'},
+                        {'profile': 'none'}):
+            expected = [r['key'] for r in self.h.get_rules(**filters)]
+            self.assertEqual([r['key'] for r in self.index.get_rules(**filters)], expected)
+            self.assertEqual(self.index.keys(**filters), frozenset(expected))
+
+        # Plus severities, without calls
+        calls = len(self.server.requests)
+        self.assertEqual(
+            self.index.keys(languages='py', severities='MAJOR,minor'),
+            frozenset(r['key'] for r in self.index.rules.values()
+                      if r['lang'] == 'py' and r['severity'] in ('MAJOR', 'MINOR')))
+        self.assertEqual(len(self.server.requests), calls)
+
+    def test_add_remove(self):
+        keys = self.index.keys(profile='prof1', languages='py')
+        rule = dict(self.index.get('py:S0'), actives=[], severity='BLOCKER')
+        self.index.add(rule)
+        self.assertEqual(len(self.index), 120)
+        self.assertEqual(self.index.keys(profile='prof1', languages='py'), keys - {'py:S0'})
+        self.assertIn('py:S0', self.index.keys(severities='blocker'))
+        self.assertEqual(list(self.index.get_rules(languages='py'))[-1], rule)
+
+        # Templates and rules not ready are not returned
+        self.index.add(dict(rule, key='py:XPath', isTemplate=True))
+        self.index.add(dict(rule, key='py:Old', status='DEPRECATED'))
+        self.assertNotIn('py:XPath', self.index.keys())
+        self.assertNotIn('py:Old', self.index.keys())
+
+        self.index.remove('py:S0')
+        self.assertNotIn('py:S0', self.index)
+        self.assertNotIn('py:S0', self.index.keys(severities='blocker'))
+        self.assertRaises(KeyError, self.index.remove, 'py:S0')
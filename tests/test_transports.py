@@ -0,0 +1,129 @@
+__author__ = 'kako'
+
+import json
+import os
+import pickle
+import shutil
+import tempfile
+from unittest import TestCase, skipIf
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from sonarqube_api import SonarAPIHandler
+from sonarqube_api.exceptions import ReplayError, ValidationError
+from sonarqube_api.fakeserver import FakeSonarQube
+from sonarqube_api.transports import HttpxTransport, RecordingTransport, ReplayTransport
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class RecordReplayTest(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cassette = os.path.join(self.tmp, 'cassette.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_record_replay(self):
+        # Record a multi-page scan, a repeated call and an error
+        with FakeSonarQube(rules=400) as server:
+            with RecordingTransport(self.cassette) as transport:
+                h = server.handler(user='admin', password='admin', transport=transport)
+                recorded = list(h.get_rules(languages='py'))
+                h.create_user('lala', 'secret', 'La La')
+                self.assertRaises(ValidationError, h.create_user, 'lala', 'secret', 'La La')
+
+        # Compact, one interaction per line, without credentials
+        with open(self.cassette) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[1]['params'], [['is_template', 'no'], ['languages', 'py'],
+                                              ['p', '2'], ['statuses', 'READY']])
+        self.assertNotIn('admin', open(self.cassette).read())
+
+        # Replay in another host, same results
+        h = SonarAPIHandler(host='http://offline', transport=ReplayTransport(self.cassette))
+        self.assertEqual(list(h.get_rules(languages='py')), recorded)
+        self.assertEqual(h.create_user('lala', 'secret', 'La La').json()['user']['login'], 'lala')
+        self.assertRaises(ValidationError, h.create_user, 'lala', 'secret', 'La La')
+
+        # Unknown calls fail
+        self.assertRaises(ReplayError, next, h.get_rules(languages='js'))
+
+    def test_pickle(self):
+        # Copies keep recording to the same cassette
+        with FakeSonarQube(rules=10) as server:
+            with RecordingTransport(self.cassette) as transport:
+                h = server.handler(transport=transport)
+                self.assertTrue(h.validate_authentication())
+                copy = pickle.loads(pickle.dumps(h))
+                self.assertEqual(len(list(copy.get_rules())), 10)
+                copy._transport.close()
+        with open(self.cassette) as f:
+            self.assertEqual([json.loads(line)['path'] for line in f],
+                             [SonarAPIHandler.AUTH_VALIDATION_ENDPOINT,
+                              SonarAPIHandler.RULES_LIST_ENDPOINT])
+
+        # And replay the same interactions
+        h = SonarAPIHandler(host='http://offline', transport=ReplayTransport(self.cassette))
+        copy = pickle.loads(pickle.dumps(h))
+        self.assertTrue(copy.validate_authentication())
+        self.assertEqual(len(list(copy.get_rules())), 10)
+
+    @mock.patch('sonarqube_api.transports.time.sleep')
+    def test_latency(self, sleep_mock):
+        with open(self.cassette, 'w') as f:
+            f.write('{"method":"GET","path":"/api/authentication/validate","params":[],'
+                    '"status":200,"reason":"OK","body":"{\\"valid\\":true}","elapsed":0.25}\n')
+
+        # Fixed latency
+        h = SonarAPIHandler(transport=ReplayTransport(self.cassette, latency=0.1))
+        self.assertTrue(h.validate_authentication())
+        sleep_mock.assert_called_once_with(0.1)
+
+        # Recorded latency
+        sleep_mock.reset_mock()
+        h = SonarAPIHandler(transport=ReplayTransport(self.cassette, recorded_latency=True))
+        self.assertTrue(h.validate_authentication())
+        sleep_mock.assert_called_once_with(0.25)
+
+
+class HttpxTransportTest(TestCase):
+
+    @skipIf(httpx is None, 'httpx is not installed')
+    def test_calls(self):
+        with FakeSonarQube(rules=400) as server:
+            with HttpxTransport(max_connections=1) as transport:
+                h = server.handler(user='admin', password='admin', transport=transport)
+
+                # Paged get and posts, same results as default transport
+                rules = list(h.get_rules(languages='py'))
+                self.assertEqual(rules, list(server.handler().get_rules(languages='py')))
+                res = h.create_user('lala', 'secret', 'La La')
+                self.assertEqual(res.json()['user']['login'], 'lala')
+                self.assertEqual(res.reason, 'OK')
+                self.assertRaises(ValidationError, h.create_user, 'lala', 'secret', 'La La')
+            self.assertEqual(server.users['lala']['name'], 'La La')
+
+    @skipIf(httpx is None, 'httpx is not installed')
+    def test_pickle(self):
+        with FakeSonarQube(rules=10) as server:
+            transport = HttpxTransport(http2=False, max_connections=2, verify=False)
+            h = pickle.loads(pickle.dumps(server.handler(transport=transport)))
+            self.assertIsNot(h._transport.client, transport.client)
+            self.assertEqual(h._transport._arguments, transport._arguments)
+            self.assertEqual(len(list(h.get_rules())), 10)
+            h._transport.close()
+            transport.close()
+
+    @mock.patch.dict('sys.modules', {'httpx': None})
+    def test_missing_dependency(self):
+        self.assertRaises(ImportError, HttpxTransport)